@@ -0,0 +1,320 @@
+"""上游调用的准入控制
+
+每个上游（llm / embedding / mem0 写入）一个 Limiter：令牌桶限制速率，并发数有上限，
+拿不到许可的调用进入有界等待队列。队列按用户分道、轮转出队，单个用户的大量请求不会
+饿死其他用户。队列已满、单个用户排队过多或等待超过截止时间时立即拒绝，并给出建议的
+重试间隔。
+
+同一个 Limiter 既可以在事件循环中等待（acquire_async），也可以在线程中等待（acquire）。
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import math
+import threading
+import time
+import types
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+import config
+import metrics
+
+# 当前调用所属的用户，embedding 等拿不到 user_id 的调用从这里读取
+current_user = contextvars.ContextVar("current_user", default="")
+
+
+class AdmissionRejected(Exception):
+    """准入被拒绝：status_code 为 429（该用户排队过多）或 503（整体过载 / 等待超时）"""
+
+    def __init__(self, upstream: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{upstream} 上游繁忙（{reason}），请 {retry_after} 秒后重试")
+        self.upstream = upstream
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, user: str, loop=None):
+        self.user = user
+        self.granted = False
+        self.loop = loop
+        self.event = asyncio.Event() if loop else threading.Event()
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.event.set)
+        else:
+            self.event.set()
+
+
+class Limiter:
+    def __init__(self, name: str, rate: float, burst: int, max_concurrency: int,
+                 max_queue: int, max_queue_per_user: int, timeout: float):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        # 用户 -> 等待者队列；OrderedDict 的顺序即轮转顺序
+        self._queues = OrderedDict()
+        self._queued = 0
+
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _can_grant(self) -> bool:
+        has_token = self.rate <= 0 or self._tokens >= 1
+        return has_token and self._in_flight < self.max_concurrency
+
+    def _take(self):
+        if self.rate > 0:
+            self._tokens -= 1
+        self._in_flight += 1
+
+    def _dispatch(self):
+        """按用户轮转，把许可发给排在最前面的等待者（调用方持有锁）"""
+        self._refill(time.monotonic())
+        while self._queues and self._can_grant():
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self._queued -= 1
+            self._take()
+            waiter.granted = True
+            waiter.wake()
+
+    def _next_token_delay(self) -> float:
+        if self.rate <= 0 or self._tokens >= 1:
+            # 等的是并发许可，由 release 唤醒；定期醒来检查截止时间
+            return 0.5
+        return (1 - self._tokens) / self.rate
+
+    def _retry_after(self) -> int:
+        if self.rate > 0:
+            return max(1, math.ceil((self._queued + 1) / self.rate))
+        return 1
+
+    def _enqueue(self, user: str, loop=None):
+        """尝试立即获得许可；否则排队。返回 None 表示已获得许可"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if not self._queues and self._can_grant():
+                self._take()
+                return None
+            queue = self._queues.get(user)
+            if queue is not None and len(queue) >= self.max_queue_per_user:
+                self._reject("user_queue_full", 429)
+            if self._queued >= self.max_queue:
+                self._reject("queue_full", 503)
+            waiter = _Waiter(user, loop)
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._queued += 1
+            return waiter
+
+    def _reject(self, reason: str, status_code: int):
+        metrics.ADMISSION_REJECTED.inc(upstream=self.name, reason=reason)
+        raise AdmissionRejected(self.name, reason, status_code, self._retry_after())
+
+    def _check(self, waiter: _Waiter, deadline: float) -> bool:
+        """等待者醒来后检查：已获得许可返回 True，超时则出队并拒绝"""
+        with self._lock:
+            if not waiter.granted:
+                self._dispatch()
+            if waiter.granted:
+                return True
+            if time.monotonic() >= deadline:
+                queue = self._queues.get(waiter.user)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[waiter.user]
+                self._reject("timeout", 503)
+            waiter.event.clear()
+            return False
+
+    def _wait_timeout(self, deadline: float) -> float:
+        with self._lock:
+            delay = self._next_token_delay()
+        return max(0.0, min(delay, deadline - time.monotonic()))
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def acquire(self, user: str = None, timeout: float = None):
+        """在线程中等待许可，拿到后必须调用 release"""
+        start = time.monotonic()
+        deadline = start + (timeout if timeout is not None else self.timeout)
+        waiter = self._enqueue(user if user is not None else current_user.get())
+        if waiter is not None:
+            while True:
+                waiter.event.wait(self._wait_timeout(deadline))
+                if self._check(waiter, deadline):
+                    break
+        metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, upstream=self.name)
+
+    async def acquire_async(self, user: str = None, timeout: float = None):
+        """在事件循环中等待许可，拿到后必须调用 release"""
+        start = time.monotonic()
+        deadline = start + (timeout if timeout is not None else self.timeout)
+        waiter = self._enqueue(user if user is not None else current_user.get(), asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                while True:
+                    try:
+                        await asyncio.wait_for(waiter.event.wait(), self._wait_timeout(deadline))
+                    except asyncio.TimeoutError:
+                        pass
+                    if self._check(waiter, deadline):
+                        break
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, upstream=self.name)
+
+    def _abandon(self, waiter: _Waiter):
+        """等待中被取消：已拿到的许可还回去，否则出队"""
+        with self._lock:
+            if waiter.granted:
+                self._in_flight -= 1
+                self._dispatch()
+                return
+            queue = self._queues.get(waiter.user)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[waiter.user]
+
+    @contextmanager
+    def slot(self, user: str = None, timeout: float = None):
+        self.acquire(user, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, user: str = None, timeout: float = None):
+        await self.acquire_async(user, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class _Unlimited:
+    """关闭准入控制时使用，接口与 Limiter 相同"""
+
+    def queue_depth(self) -> int:
+        return 0
+
+    @contextmanager
+    def slot(self, user: str = None, timeout: float = None):
+        yield
+
+    @asynccontextmanager
+    async def aslot(self, user: str = None, timeout: float = None):
+        yield
+
+
+_lock = threading.Lock()
+_limiters = {}
+
+
+def _build(name: str):
+    if not config.ADMISSION_ENABLED:
+        return _Unlimited()
+    rate, burst, concurrency, timeout = {
+        "llm": (config.LLM_RATE_LIMIT, config.LLM_BURST, config.LLM_MAX_CONCURRENCY, config.ADMISSION_TIMEOUT),
+        "embedding": (config.EMBEDDING_RATE_LIMIT, config.EMBEDDING_BURST,
+                      config.EMBEDDING_MAX_CONCURRENCY, config.ADMISSION_TIMEOUT),
+        # 后台写入不急，等待时间更长；被拒绝后由后写队列退避重试
+        "mem0": (config.MEM0_RATE_LIMIT, config.MEM0_BURST, config.MEM0_MAX_CONCURRENCY, 60.0),
+    }[name]
+    limiter = Limiter(name, rate, burst, concurrency, config.ADMISSION_MAX_QUEUE,
+                      config.ADMISSION_MAX_QUEUE_PER_USER, timeout)
+    metrics.ADMISSION_QUEUE_DEPTH.set_function(limiter.queue_depth, upstream=name)
+    return limiter
+
+
+def get_limiter(name: str):
+    """按上游名取共享的 Limiter：llm、embedding、mem0"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = _build(name)
+    return limiter
+
+
+@contextmanager
+def user_scope(user_id: str):
+    """标记当前线程中的上游调用属于哪个用户"""
+    token = current_user.set(user_id)
+    try:
+        yield
+    finally:
+        current_user.reset(token)
+
+
+class ContextThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    """submit 时复制调用方的 contextvars，任务在工作线程中仍能读到 current_user 等上下文"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def propagate_context(module):
+    """让 module 内部创建的线程池复制调用方的上下文
+
+    mem0 的 add / search / get_all 把向量库操作交给自己新建的 ThreadPoolExecutor，
+    工作线程中读不到 current_user（embedding 按用户排队失效）和 current_partition_user。
+    只替换该模块引用的 concurrent 名字空间，不影响其他模块。
+    """
+    futures = types.SimpleNamespace(**{
+        name: getattr(concurrent.futures, name) for name in concurrent.futures.__all__
+    })
+    futures.ThreadPoolExecutor = ContextThreadPoolExecutor
+    module.concurrent = types.SimpleNamespace(futures=futures)
+
+
+class RateLimitedEmbedder:
+    """远程 embedder 的包装：每次（批量）请求先取得 embedding 上游的许可"""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.config = embedder.config
+
+    def embed(self, text, memory_action=None):
+        with get_limiter("embedding").slot():
+            return self.embedder.embed(text, memory_action)
+
+    def embed_batch(self, texts: list) -> list:
+        # 批量文本放在同一个请求里，只计一次
+        from embedding_cache import embed_many
+        with get_limiter("embedding").slot():
+            return embed_many(self.embedder, texts)
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
@@ -0,0 +1,64 @@
+"""工具调用 agent 的缓存和流式执行
+
+agent 按（LLM、温度、工具集）构建一次后复用。执行时走 AgentExecutor 的异步路径：
+同一步中的多个工具调用由 AgentExecutor 并发执行，中间的工具状态和最终回复的 token
+通过 astream_events 逐个产出。
+"""
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Tuple
+
+from langchain.agents import AgentExecutor, create_tool_calling_agent
+from langchain_core.prompts import ChatPromptTemplate
+
+AGENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "你是一个友好、专业的AI助手。如果需要最新信息，可以使用搜索工具。"),
+    ("placeholder", "{chat_history}"),
+    ("human", "{input}"),
+    ("placeholder", "{agent_scratchpad}"),
+])
+
+_MAX_AGENTS = 16
+_agents = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_agent_executor(llm, tools: list, temperature: float) -> AgentExecutor:
+    """取缓存的 AgentExecutor，同一 LLM、温度和工具集只构建一次"""
+    key = (id(llm), getattr(llm, "model_name", None), round(temperature, 2),
+           tuple(sorted(tool.name for tool in tools)))
+    with _lock:
+        executor = _agents.get(key)
+        if executor is not None:
+            _agents.move_to_end(key)
+            return executor
+
+        agent_llm = llm.model_copy(update={"temperature": temperature})
+        agent = create_tool_calling_agent(agent_llm, tools, AGENT_PROMPT)
+        executor = AgentExecutor(agent=agent, tools=tools, verbose=False)
+        _agents[key] = executor
+        while len(_agents) > _MAX_AGENTS:
+            _agents.popitem(last=False)
+        return executor
+
+
+async def astream_agent(executor: AgentExecutor, inputs: dict) -> AsyncIterator[Tuple[str, str]]:
+    """流式执行 agent，产出 (事件类型, 内容)
+
+    事件类型：
+    - "token"：模型输出的文本片段
+    - "tool_start" / "tool_end"：工具名称和参数 / 工具名称
+    - "output"：最终回复全文
+    """
+    async for event in executor.astream_events(inputs, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if content:
+                yield "token", content
+        elif kind == "on_tool_start":
+            yield "tool_start", f"{event['name']} {event['data'].get('input', '')}"
+        elif kind == "on_tool_end":
+            yield "tool_end", event["name"]
+        elif kind == "on_chain_end" and not event["parent_ids"]:
+            yield "output", event["data"]["output"].get("output", "")
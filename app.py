@@ -1,10 +1,13 @@
 import streamlit as st
-from langchain_community.chat_models import ChatZhipuAI
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+import admission
 import config
-from memory_manager import MemoryManager
-from search_tool import SearchTool
-from datetime import datetime
+import metrics
+import resilience
+import resources
+from context_builder import assemble_context
+from datetime import datetime, timedelta
+import asyncio
 import time
 
 # 页面配置
@@ -218,15 +221,21 @@ if "messages" not in st.session_state:
 if "user_id" not in st.session_state:
     st.session_state.user_id = "default_user"
 
+# LLM 和记忆管理器是进程级共享资源，新会话不再重复初始化 mem0 和 Chroma。
+# 进程内第一个会话负责预热（打开向量库、建立连接），之后的会话直接复用
 if "llm" not in st.session_state:
-    st.session_state.llm = ChatZhipuAI(
-        model="glm-4-flash",
-        api_key=config.ZHIPU_API_KEY,
-        temperature=0.7,
-    )
+    with st.spinner("正在初始化..."):
+        state = resources.warmup()
+    if not state["ready"]:
+        st.error(f"❌ 初始化失败: {state['error']}")
+        st.stop()
+    st.session_state.llm = resources.get_llm()
 
 if "memory_manager" not in st.session_state:
-    st.session_state.memory_manager = MemoryManager()
+    st.session_state.memory_manager = resources.get_memory_manager()
+
+if "temperature" not in st.session_state:
+    st.session_state.temperature = 0.7
 
 if "show_memories" not in st.session_state:
     st.session_state.show_memories = False
@@ -235,7 +244,8 @@ if "context_limit" not in st.session_state:
     st.session_state.context_limit = 5
 
 if "search_tool" not in st.session_state:
-    st.session_state.search_tool = SearchTool()
+    # 搜索依赖 mcp 和 langchain 工具，启用搜索时才导入
+    st.session_state.search_tool = None
 
 if "use_search" not in st.session_state:
     st.session_state.use_search = False
@@ -258,6 +268,7 @@ with st.sidebar:
         if new_user_id != st.session_state.user_id:
             st.session_state.user_id = new_user_id
             st.session_state.messages = []
+            st.session_state.memory_page = 0
             st.rerun()
 
     # 记忆设置
@@ -279,13 +290,16 @@ with st.sidebar:
             st.session_state.use_search = use_search_new
             if use_search_new:
                 with st.spinner("初始化搜索工具..."):
+                    if st.session_state.search_tool is None:
+                        from search_tool import SearchTool
+                        st.session_state.search_tool = SearchTool()
                     if st.session_state.search_tool.initialize():
                         st.session_state.search_tool.enabled = True
                         st.success("✓ 搜索工具已启用")
                     else:
                         st.error("✗ 搜索工具初始化失败")
                         st.session_state.use_search = False
-            else:
+            elif st.session_state.search_tool is not None:
                 st.session_state.search_tool.enabled = False
         
         if st.session_state.use_search:
@@ -301,18 +315,29 @@ with st.sidebar:
             step=0.1,
             help="控制回复的随机性，值越高越有创造性"
         )
-        if temperature != st.session_state.llm.temperature:
-            st.session_state.llm.temperature = temperature
+        # 共享的 LLM 客户端不能修改，temperature 保存在会话中，调用时传入
+        st.session_state.temperature = temperature
 
     st.markdown("---")
 
     # 统计信息
-    memories = st.session_state.memory_manager.get_all_memories(st.session_state.user_id)
+    # 只读取 ID 计数，不加载记忆内容
+    memory_count = st.session_state.memory_manager.count_memories(st.session_state.user_id)
     col1, col2 = st.columns(2)
     with col1:
         st.metric("💬 对话轮数", len(st.session_state.messages))
     with col2:
-        st.metric("🧠 记忆数量", len(memories))
+        st.metric("🧠 记忆数量", memory_count)
+
+    # 上一轮各阶段耗时
+    if st.session_state.get("last_turn_timings"):
+        with st.expander("⏱️ 上一轮耗时"):
+            for stage, seconds in st.session_state.last_turn_timings.items():
+                st.text(f"{stage:<14} {seconds * 1000:>8.0f} ms")
+            st.text(f"{'节省 token':<12} {st.session_state.get('last_turn_tokens_saved', 0):>8}")
+            if config.RESPONSE_CACHE_ENABLED:
+                cache_stats = resources.get_response_cache().stats()
+                st.text(f"{'响应缓存命中率':<10} {cache_stats['hit_rate']:>8.0%}")
 
     st.markdown("---")
 
@@ -335,12 +360,16 @@ with st.sidebar:
 
     with col3:
         if st.button("💾 导出记忆", use_container_width=True):
-            export_data = st.session_state.memory_manager.export_memories(st.session_state.user_id)
+            # 按页读取并流式压缩，只在点击时生成一次；不含向量，导入时重新向量化
+            from memory_transfer import gzip_chunks
+            export_data = b"".join(gzip_chunks(st.session_state.memory_manager.export_memories(
+                st.session_state.user_id, include_vectors=False
+            )))
             st.download_button(
-                label="📥 下载JSON",
+                label="📥 下载 NDJSON",
                 data=export_data,
-                file_name=f"memories_{st.session_state.user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                mime="application/json",
+                file_name=f"memories_{st.session_state.user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson.gz",
+                mime="application/gzip",
                 use_container_width=True
             )
 
@@ -371,18 +400,27 @@ with st.sidebar:
 if st.session_state.show_memories:
     st.subheader("🧠 记忆库")
 
-    if memories:
-        # 按创建时间分组
-        st.info(f"共有 {len(memories)} 条记忆")
+    if memory_count:
+        st.info(f"共有 {memory_count} 条记忆")
 
         # 搜索功能
         search_query = st.text_input("🔍 搜索记忆", placeholder="输入关键词搜索相关记忆...")
+        search_mode = None
+        if st.session_state.memory_manager.keyword_index is not None:
+            # 启用关键词索引时可以选择检索方式，人名、编号等精确匹配用关键词检索更准
+            search_mode = st.radio(
+                "检索方式",
+                ["hybrid", "keyword", "vector"],
+                format_func={"hybrid": "混合", "keyword": "关键词", "vector": "语义"}.get,
+                horizontal=True
+            )
 
         if search_query:
             search_results = st.session_state.memory_manager.get_context(
                 st.session_state.user_id,
                 search_query,
-                limit=10
+                limit=10,
+                mode=search_mode
             )
             st.success(f"✨ 找到 {len(search_results)} 条相关记忆")
 
@@ -392,6 +430,7 @@ if st.session_state.show_memories:
                     memory_text = mem.get('memory', '')
                     score = mem.get('score', 0)
                     created_at = mem.get('created_at', '')
+                    match = {"keyword": " · 关键词", "both": " · 关键词 + 语义"}.get(mem.get('match'), "")
 
                     role_icon = "👤" if role == "user" else "🤖"
                     role_class = "user-memory" if role == "user" else "assistant-memory"
@@ -403,7 +442,7 @@ if st.session_state.show_memories:
                             <strong style="color: {role_color};">{role_icon} {role.upper()}</strong>
                             <span style="background: linear-gradient(135deg, {role_color}20 0%, {role_color}10 100%);
                                          padding: 0.2rem 0.6rem; border-radius: 20px; font-size: 0.85rem; font-weight: 600;">
-                                相关度: {score:.1%}
+                                相关度: {score:.1%}{match}
                             </span>
                         </div>
                         <div style="color: #333; line-height: 1.6; margin: 0.5rem 0;">{memory_text}</div>
@@ -413,38 +452,107 @@ if st.session_state.show_memories:
             else:
                 st.info("🔍 未找到相关记忆")
         else:
-            # 显示所有记忆
-            for i, mem in enumerate(memories):
-                role = mem.get('role', 'unknown')
-                memory_text = mem.get('memory', '')
-                created_at = mem.get('created_at', '')
-                mem_id = mem.get('id', '')
+            # 分页浏览：每次只读取和渲染当前页，最新的在前
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                role_filter = st.selectbox("角色", ["全部", "user", "assistant", "conversation"])
+            with col2:
+                days_filter = st.selectbox("时间范围", ["全部", "最近 1 天", "最近 7 天", "最近 30 天"])
+            with col3:
+                page_size = st.selectbox("每页条数", [10, 20, 50], index=1)
+
+            filters = (role_filter, days_filter, page_size)
+            if st.session_state.get("memory_filters") != filters:
+                # 过滤条件变化后回到第一页
+                st.session_state.memory_filters = filters
+                st.session_state.memory_page = 0
+            page_index = st.session_state.get("memory_page", 0)
+
+            since = None
+            if days_filter != "全部":
+                days = int(days_filter.split()[1])
+                since = (datetime.now() - timedelta(days=days)).date().isoformat()
+
+            page = st.session_state.memory_manager.list_memories(
+                st.session_state.user_id,
+                offset=page_index * page_size,
+                limit=page_size,
+                role=None if role_filter == "全部" else role_filter,
+                since=since
+            )
+            page_count = max(1, -(-page["total"] // page_size))
+            if not page["memories"] and page_index >= page_count:
+                # 删除后当前页已超出范围，跳到最后一页
+                st.session_state.memory_page = page_count - 1
+                st.rerun()
 
-                role_icon = "👤" if role == "user" else "🤖"
-                role_class = "user-memory" if role == "user" else "assistant-memory"
-                role_color = "#667eea" if role == "user" else "#764ba2"
+            # 勾选和删除放在表单里，勾选不会触发整页重跑，提交时一次批量删除
+            with st.form(f"memory_page_{page_index}"):
+                selected = []
+                for i, mem in enumerate(page["memories"]):
+                    role = mem.get('role', 'unknown')
+                    memory_text = mem.get('memory', '')
+                    created_at = mem.get('created_at', '')
+                    mem_id = mem.get('id', '')
 
-                col1, col2 = st.columns([0.92, 0.08])
+                    role_icon = "👤" if role == "user" else "🤖"
+                    role_class = "user-memory" if role == "user" else "assistant-memory"
+                    role_color = "#667eea" if role == "user" else "#764ba2"
 
-                with col1:
-                    st.markdown(f"""
-                    <div class="memory-card {role_class}">
-                        <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
-                            <strong style="color: {role_color};">{role_icon} {role.upper()}</strong>
-                            <span style="margin-left: 0.5rem; background: {role_color}15;
-                                         padding: 0.1rem 0.5rem; border-radius: 12px; font-size: 0.75rem;">
-                                #{i+1}
-                            </span>
+                    col1, col2 = st.columns([0.92, 0.08])
+
+                    with col1:
+                        st.markdown(f"""
+                        <div class="memory-card {role_class}">
+                            <div style="display: flex; align-items: center; margin-bottom: 0.5rem;">
+                                <strong style="color: {role_color};">{role_icon} {role.upper()}</strong>
+                                <span style="margin-left: 0.5rem; background: {role_color}15;
+                                             padding: 0.1rem 0.5rem; border-radius: 12px; font-size: 0.75rem;">
+                                    #{page["offset"] + i + 1}
+                                </span>
+                            </div>
+                            <div style="color: #333; line-height: 1.6; margin: 0.5rem 0;">{memory_text}</div>
+                            <small style="color: #999; font-size: 0.85rem;">📅 {created_at}</small>
                         </div>
-                        <div style="color: #333; line-height: 1.6; margin: 0.5rem 0;">{memory_text}</div>
-                        <small style="color: #999; font-size: 0.85rem;">📅 {created_at}</small>
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                with col2:
-                    if st.button("🗑️", key=f"del_{mem_id}", help="删除此记忆", type="secondary"):
-                        if st.session_state.memory_manager.delete_memory(mem_id):
+                        """, unsafe_allow_html=True)
+
+                    with col2:
+                        if st.checkbox("选择", key=f"sel_{mem_id}", label_visibility="collapsed"):
+                            selected.append(mem_id)
+
+                if not page["memories"]:
+                    st.info("🔍 没有符合条件的记忆")
+
+                if st.form_submit_button("🗑️ 删除选中", type="secondary"):
+                    if selected:
+                        try:
+                            deleted = st.session_state.memory_manager.delete_memories(
+                                st.session_state.user_id, selected
+                            )
+                        except Exception as e:
+                            st.error(f"✗ 删除失败: {e}")
+                        else:
+                            st.session_state.delete_notice = f"✓ 已删除 {deleted} 条记忆"
                             st.rerun()
+
+            if st.session_state.get("delete_notice"):
+                st.success(st.session_state.pop("delete_notice"))
+
+            col1, col2, col3 = st.columns([0.2, 0.6, 0.2])
+            with col1:
+                if st.button("◀ 上一页", disabled=page_index == 0, use_container_width=True):
+                    st.session_state.memory_page = page_index - 1
+                    st.rerun()
+            with col2:
+                st.markdown(
+                    f"<div style='text-align: center;'>第 {page_index + 1} / {page_count} 页，"
+                    f"共 {page['total']} 条</div>",
+                    unsafe_allow_html=True
+                )
+            with col3:
+                if st.button("下一页 ▶", disabled=page["next_offset"] is None, use_container_width=True):
+                    st.session_state.memory_page = page_index + 1
+                    st.rerun()
     else:
         st.info("📭 暂无记忆，开始对话即可创建记忆")
 
@@ -485,6 +593,88 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
+def stream_reply(messages, placeholder, timings):
+    """流式输出 LLM 回复，同时记录首 token 时间和总耗时
+
+    启用语义响应缓存时先查缓存：除当前问题外的提示内容（记忆、最近对话）完全相同、
+    问题足够相似时直接返回之前的回答。
+    """
+    cache_context = [m.content for m in messages[:-1]]
+    if config.RESPONSE_CACHE_ENABLED:
+        with metrics.stage_timer("response_cache", timings):
+            try:
+                cached = resources.get_response_cache().lookup(
+                    st.session_state.user_id, messages[-1].content, cache_context
+                )
+            except Exception as e:
+                # 缓存查询失败（向量化出错、被准入控制拒绝）时按未命中处理，继续调用 LLM
+                print(f"查询响应缓存失败，按未命中处理: {e}")
+                metrics.CACHE_REQUESTS.inc(cache="response", result="miss")
+                cached = None
+        if cached is not None:
+            placeholder.markdown(cached)
+            st.caption("⚡ 来自响应缓存")
+            return cached
+
+    full_response = ""
+    start = time.perf_counter()
+    with admission.get_limiter("llm").slot(st.session_state.user_id), \
+            metrics.upstream_call("llm", "llm_stream", timings):
+        for chunk in resilience.stream("llm", lambda: st.session_state.llm.stream(
+                messages, temperature=st.session_state.temperature)):
+            if hasattr(chunk, 'content') and chunk.content:
+                if not full_response:
+                    timings["ttft"] = time.perf_counter() - start
+                    metrics.TTFT_SECONDS.observe(timings["ttft"])
+                full_response += chunk.content
+                placeholder.markdown(full_response + "▌")
+    placeholder.markdown(full_response)
+    if config.RESPONSE_CACHE_ENABLED:
+        try:
+            resources.get_response_cache().store(
+                st.session_state.user_id, messages[-1].content, cache_context, full_response
+            )
+        except Exception as e:
+            print(f"写入响应缓存失败: {e}")
+    return full_response
+
+
+def run_agent(agent_executor, inputs, placeholder, timings):
+    """流式执行工具调用 agent：先显示工具调用状态，再逐个显示回复 token"""
+    start = time.perf_counter()
+    status = st.empty()
+
+    from agent_runner import astream_agent
+
+    async def consume():
+        text, output, steps = "", None, []
+        async for kind, content in astream_agent(agent_executor, inputs):
+            if "ttft" not in timings:
+                timings["ttft"] = time.perf_counter() - start
+                metrics.TTFT_SECONDS.observe(timings["ttft"])
+            if kind == "tool_start":
+                # 调用工具前模型输出的是中间文本，清空后等待最终回复
+                text = ""
+                steps.append(f"🔍 正在调用 {content}")
+                status.markdown("\n\n".join(steps))
+            elif kind == "tool_end":
+                steps.append(f"✅ {content} 完成")
+                status.markdown("\n\n".join(steps))
+            elif kind == "token":
+                text += content
+                placeholder.markdown(text + "▌")
+            elif kind == "output":
+                output = content
+        return output if output is not None else text
+
+    with admission.get_limiter("llm").slot(st.session_state.user_id), \
+            metrics.upstream_call("llm", "agent", timings):
+        full_response = asyncio.run(consume())
+    status.empty()
+    placeholder.markdown(full_response)
+    return full_response
+
+
 # 对话输入
 if prompt := st.chat_input("💭 输入你的消息..."):
     # 添加用户消息到历史
@@ -496,23 +686,35 @@ if prompt := st.chat_input("💭 输入你的消息..."):
 
     # 生成助手回复
     with st.chat_message("assistant"):
+        timings = {}
+
         # 构建消息
         messages = [SystemMessage(content="你是一个友好、专业的AI助手，擅长理解用户需求并提供有帮助的回答。")]
 
-        # 添加记忆上下文
+        # 检索记忆上下文
+        context = []
         if use_memory:
-            context = st.session_state.memory_manager.get_context(
-                st.session_state.user_id,
-                prompt,
-                limit=st.session_state.context_limit
-            )
-            if context:
-                context_text = "\n".join([f"- {m['memory']}" for m in context])
-                messages.append(SystemMessage(content=f"📚 相关历史记忆:\n{context_text}"))
+            with metrics.stage_timer("context", timings):
+                context = st.session_state.memory_manager.get_context_within(
+                    st.session_state.user_id,
+                    prompt,
+                    limit=st.session_state.context_limit
+                )
+
+        # 最近的对话历史（不包括刚添加的用户消息，因为会在下面单独添加）
+        history_window = config.CONTEXT_HISTORY_MESSAGES + 1
+        recent_messages = st.session_state.messages[-history_window:-1] if len(st.session_state.messages) > 1 else []
+
+        # 在 token 预算内挑选记忆和历史，去掉与最近对话重复的记忆
+        assembled = assemble_context(context, recent_messages)
+        st.session_state.last_turn_tokens_saved = assembled.tokens_saved
+        metrics.PROMPT_TOKENS.inc(assembled.tokens_used, kind="used")
+        metrics.PROMPT_TOKENS.inc(assembled.tokens_saved, kind="saved")
+        if assembled.memories:
+            context_text = "\n".join([f"- {m}" for m in assembled.memories])
+            messages.append(SystemMessage(content=f"📚 相关历史记忆:\n{context_text}"))
 
-        # 添加最近的对话历史（不包括刚添加的用户消息，因为会在下面单独添加）
-        recent_messages = st.session_state.messages[-11:-1] if len(st.session_state.messages) > 1 else []
-        for msg in recent_messages:
+        for msg in assembled.history:
             if msg["role"] == "user":
                 messages.append(HumanMessage(content=msg["content"]))
             else:
@@ -527,58 +729,41 @@ if prompt := st.chat_input("💭 输入你的消息..."):
             full_response = ""
             
             if st.session_state.use_search and st.session_state.search_tool.enabled:
-                from langchain.agents import create_tool_calling_agent, AgentExecutor
-                from langchain_core.prompts import ChatPromptTemplate
-                
                 tools = st.session_state.search_tool.get_tools()
                 
                 if tools:
-                    prompt_template = ChatPromptTemplate.from_messages([
-                        ("system", "你是一个友好、专业的AI助手。如果需要最新信息，可以使用搜索工具。"),
-                        ("placeholder", "{chat_history}"),
-                        ("human", "{input}"),
-                        ("placeholder", "{agent_scratchpad}"),
-                    ])
-                    
-                    agent = create_tool_calling_agent(st.session_state.llm, tools, prompt_template)
-                    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=False)
-                    
-                    result = agent_executor.invoke({
-                        "input": prompt,
-                        "chat_history": messages[:-1]
-                    })
-                    
-                    full_response = result.get("output", "")
-                    message_placeholder.markdown(full_response)
+                    from agent_runner import get_agent_executor
+                    agent_executor = get_agent_executor(
+                        st.session_state.llm, tools, st.session_state.temperature
+                    )
+                    full_response = run_agent(
+                        agent_executor,
+                        {"input": prompt, "chat_history": messages[:-1]},
+                        message_placeholder,
+                        timings
+                    )
                 else:
-                    for chunk in st.session_state.llm.stream(messages):
-                        if hasattr(chunk, 'content') and chunk.content:
-                            full_response += chunk.content
-                            message_placeholder.markdown(full_response + "▌")
-                    message_placeholder.markdown(full_response)
+                    full_response = stream_reply(messages, message_placeholder, timings)
             else:
-                for chunk in st.session_state.llm.stream(messages):
-                    if hasattr(chunk, 'content') and chunk.content:
-                        full_response += chunk.content
-                        message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
+                full_response = stream_reply(messages, message_placeholder, timings)
 
             # 保存助手回复到历史
             st.session_state.messages.append({"role": "assistant", "content": full_response})
 
-            # 保存到记忆
+            # 保存到记忆（后台写入，不阻塞界面）
             if use_memory:
-                st.session_state.memory_manager.add_message(
-                    st.session_state.user_id,
-                    prompt,
-                    "user"
-                )
-                st.session_state.memory_manager.add_message(
-                    st.session_state.user_id,
-                    full_response,
-                    "assistant"
-                )
-
+                with metrics.stage_timer("persist", timings):
+                    resources.get_memory_queue().enqueue_turn(
+                        st.session_state.user_id,
+                        prompt,
+                        full_response
+                    )
+            st.session_state.last_turn_timings = timings
+
+        except admission.AdmissionRejected as e:
+            error_msg = f"⏳ {e}"
+            st.warning(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
         except Exception as e:
             error_msg = f"❌ 发生错误: {str(e)}"
             st.error(error_msg)
@@ -0,0 +1,90 @@
+"""搜索 agent 首次可见输出时间基准测试
+
+启动本地假上游（fake_zhipu.py，返回工具调用）和假 MCP 搜索服务（stub_mcp_server.py），对比：
+- blocking：每轮重新构建 agent，同步 invoke，整个工具循环结束后才有输出（原来的做法）
+- streaming：复用缓存的 agent，astream_events 流式执行，同一步的工具调用并发
+
+运行: python benchmarks/bench_agent_stream.py --turns 5 --tool-calls 2 --search-ms 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def median(values: list) -> float:
+    values = sorted(values)
+    return values[len(values) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--tool-calls", type=int, default=2)
+    parser.add_argument("--search-ms", type=float, default=300.0)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--fake-port", type=int, default=9101)
+    args = parser.parse_args()
+
+    os.environ.update({
+        "ZHIPU_API_KEY": "fake.secret",
+        "ZHIPU_BASE_URL": f"http://127.0.0.1:{args.fake_port}/",
+    })
+
+    from langchain.agents import AgentExecutor, create_tool_calling_agent
+
+    import resources
+    from agent_runner import AGENT_PROMPT, astream_agent, get_agent_executor
+    from bench_search_pool import stub_params
+    from load_test import start_process
+    from search_tool import MCPServerPool, PooledMCPTool
+
+    fake = start_process(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "fake_zhipu.py"), "--port", str(args.fake_port),
+         "--ttft-ms", str(args.ttft_ms), "--latency-sigma", "0", "--tool-calls", str(args.tool_calls)],
+        dict(os.environ), f"http://127.0.0.1:{args.fake_port}/docs"
+    )
+    pool = MCPServerPool(stub_params(args.search_ms), size=2)
+    try:
+        pool.start()
+        tools = [PooledMCPTool(pool=pool, name=spec.name, description=spec.description or "",
+                               args_schema=spec.inputSchema) for spec in pool.tool_specs()]
+        llm = resources.get_llm()
+
+        blocking = []
+        for i in range(args.turns):
+            start = time.perf_counter()
+            agent = create_tool_calling_agent(llm.model_copy(update={"temperature": 0.7}), tools, AGENT_PROMPT)
+            AgentExecutor(agent=agent, tools=tools).invoke({"input": f"阻塞问题 {i}", "chat_history": []})
+            blocking.append(time.perf_counter() - start)
+
+        async def streamed(i):
+            start = time.perf_counter()
+            first_event = first_token = None
+            executor = get_agent_executor(llm, tools, 0.7)
+            async for kind, _ in astream_agent(executor, {"input": f"流式问题 {i}", "chat_history": []}):
+                now = time.perf_counter() - start
+                first_event = first_event if first_event is not None else now
+                if kind == "token" and first_token is None:
+                    first_token = now
+            return first_event, first_token, time.perf_counter() - start
+
+        results = [asyncio.run(streamed(i)) for i in range(args.turns)]
+    finally:
+        pool.shutdown()
+        fake.terminate()
+        fake.wait()
+
+    print(f"blocking  首次可见输出（= 总耗时）: {median(blocking):.0f} ms")
+    print(f"streaming 首个事件（工具状态）: {median([r[0] for r in results]):.0f} ms")
+    print(f"streaming 首个回复 token: {median([r[1] for r in results]):.0f} ms")
+    print(f"streaming 总耗时: {median([r[2] for r in results]):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
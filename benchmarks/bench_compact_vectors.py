@@ -0,0 +1,156 @@
+"""紧凑向量存储的召回率 / 体积 / 延迟基准测试
+
+在合成语料上比较：
+- full：Chroma 中保存全维 float32 向量（当前默认）
+- compact-<维度>：Chroma 中只保存前 N 维，全维向量 int8 量化另存，分别测试不重排
+  （rerank=0，直接使用降维检索结果）和取 limit × 倍数个候选重排
+
+语料由若干簇组成，各维度方差按维度序号递减（与 embedding-3 这类可截断维度的模型类似，
+衰减速度由 --decay 控制）；
+查询是语料中随机条目加噪声。真值为全维 float32 精确检索的 top-k。每种配置报告
+recall@k、检索延迟 p50 / p95、磁盘占用（Chroma 目录 + 重排向量文件）、HNSW 中向量
+本身的内存占用，以及重新打开向量库后首次检索的耗时（索引加载）。
+检索经过 mem0 的 ChromaDB 和 compact_vectors.CompactVectorStore，与服务中的路径一致。
+
+运行:
+    python benchmarks/bench_compact_vectors.py --size 20000 --dims 1536 --compact-dims 128,256,512
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentiles
+
+import chromadb
+from chromadb.api.shared_system_client import SharedSystemClient
+from chromadb.config import Settings
+from mem0.vector_stores.chroma import ChromaDB
+
+from compact_vectors import CompactVectorStore, RerankStore, reduce
+
+
+def synthetic_corpus(rng, size: int, dims: int, queries: int, decay: float) -> tuple:
+    """成簇的语料和查询，第 i 维的标准差为 1 / (1 + i / decay)，全部归一化"""
+    spectrum = (1.0 / (1.0 + np.arange(dims) / decay)).astype(np.float32)
+    centers = rng.standard_normal((max(1, size // 50), dims), dtype=np.float32) * spectrum
+    corpus = centers[rng.integers(0, len(centers), size)]
+    corpus += 0.6 * rng.standard_normal((size, dims), dtype=np.float32) * spectrum
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picks = corpus[rng.integers(0, size, queries)]
+    query_vectors = picks + 0.4 * rng.standard_normal((queries, dims), dtype=np.float32) * spectrum
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return corpus, query_vectors
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> list:
+    scores = queries @ corpus.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def open_store(path: str, compact_dims: int, rerank_path: str, factor: int):
+    client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+    store = ChromaDB("bench", client=client)
+    if compact_dims:
+        store = CompactVectorStore(store, RerankStore(rerank_path), dims=compact_dims, factor=factor)
+    return store
+
+
+def build(workdir: str, name: str, corpus: np.ndarray, compact_dims: int) -> dict:
+    path = os.path.join(workdir, name)
+    rerank_path = os.path.join(workdir, f"{name}.rerank.db")
+    store = open_store(path, compact_dims, rerank_path, 1)
+    start = time.perf_counter()
+    for begin in range(0, len(corpus), 1000):
+        ids = [str(i) for i in range(begin, min(len(corpus), begin + 1000))]
+        store.insert(vectors=corpus[begin:begin + 1000].tolist(), payloads=[{"n": int(i)} for i in ids], ids=ids)
+    seconds = time.perf_counter() - start
+    SharedSystemClient.clear_system_cache()
+    rerank_bytes = os.path.getsize(rerank_path) if compact_dims else 0
+    return {"path": path, "rerank_path": rerank_path, "insert_per_second": len(corpus) / seconds,
+            "chroma_mb": dir_size(path) / 1024 / 1024, "rerank_mb": rerank_bytes / 1024 / 1024}
+
+
+def measure(built: dict, compact_dims: int, factor: int, queries: np.ndarray, truth: list, k: int) -> dict:
+    """factor 为 0 时不重排：直接检索降维向量"""
+    SharedSystemClient.clear_system_cache()
+    store = open_store(built["path"], compact_dims, built["rerank_path"], max(factor, 1))
+    # 不重排时直接用降维后的查询检索 Chroma
+    raw = bool(compact_dims and not factor)
+
+    def search(vector):
+        if raw:
+            return store.store.search(query="", vectors=reduce(vector, compact_dims).tolist(), limit=k)
+        return store.search(query="", vectors=vector.tolist(), limit=k)
+
+    start = time.perf_counter()
+    search(queries[0])
+    load_ms = (time.perf_counter() - start) * 1000
+
+    latencies, hits = [], 0
+    for vector, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = search(vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {int(item.id) for item in results})
+    return {"recall": hits / (len(truth) * k), "first_query_ms": load_ms, **percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--compact-dims", default="128,256,512")
+    parser.add_argument("--factors", default="0,4,8", help="重排候选倍数，0 表示不重排")
+    parser.add_argument("--decay", type=float, default=64, help="维度方差衰减速度，越小信息越集中在前几维")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    corpus, queries = synthetic_corpus(rng, args.size, args.dims, args.queries, args.decay)
+    truth = exact_top_k(corpus, queries, args.k)
+    workdir = tempfile.mkdtemp(prefix="compact-")
+    report = {"config": vars(args), "results": []}
+
+    configs = [("full", 0, [0])]
+    factors = [int(f) for f in args.factors.split(",")]
+    configs += [(f"compact-{d}", int(d), factors) for d in args.compact_dims.split(",")]
+    print(f"{'config':<14}{'rerank':>7}{'recall@' + str(args.k):>10}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'load ms':>9}{'disk MB':>9}{'vec MB':>8}")
+    try:
+        for name, compact_dims, config_factors in configs:
+            built = build(workdir, name, corpus, compact_dims)
+            for factor in config_factors:
+                result = measure(built, compact_dims, factor, queries, truth, args.k)
+                disk = built["chroma_mb"] + built["rerank_mb"]
+                vector_mb = args.size * (compact_dims or args.dims) * 4 / 1024 / 1024
+                report["results"].append({"config": name, "rerank_factor": factor, "disk_mb": disk,
+                                          "hnsw_vector_mb": vector_mb, **built, **result})
+                print(f"{name:<14}{factor:>7}{result['recall']:>10.3f}{result['p50']:>9.2f}{result['p95']:>9.2f}"
+                      f"{result['first_query_ms']:>9.0f}{disk:>9.1f}{vector_mb:>8.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
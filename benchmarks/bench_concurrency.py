@@ -0,0 +1,94 @@
+"""/chat 并发基准测试
+
+用固定延迟的假 LLM 和假记忆管理器替换真实上游，测量不同并发数下 /chat 的吞吐量。
+事件循环不被阻塞时，每秒请求数应随并发数近似线性增长，而不是停留在单请求的水平。
+
+运行: python benchmarks/bench_concurrency.py --requests 64 --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ZHIPU_API_KEY", "bench-key")
+os.environ.setdefault("MEMORY_QUEUE_PATH", os.path.join(tempfile.mkdtemp(), "queue.db"))
+
+import httpx
+from langchain_core.messages import AIMessage
+
+import memory_manager
+
+
+class SlowMemoryManager(memory_manager.MemoryManager):
+    """不连接 mem0，只用 sleep 模拟检索和写入耗时"""
+
+    def __init__(self, search_latency: float, add_latency: float):
+        self.search_latency = search_latency
+        self.add_latency = add_latency
+        self._executor = memory_manager.ThreadPoolExecutor(
+            max_workers=memory_manager.config.MEMORY_WORKERS,
+            thread_name_prefix="memory"
+        )
+
+    def add_message(self, user_id: str, message: str, role: str):
+        time.sleep(self.add_latency)
+
+    def add_messages(self, user_id: str, messages: list, done: set = None):
+        time.sleep(self.add_latency)
+
+    def get_context(self, user_id: str, query: str, limit: int = 5):
+        time.sleep(self.search_latency)
+        return [{"memory": "用户喜欢喝茶"}]
+
+
+class SlowLLM:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.latency)
+        return AIMessage(content="好的")
+
+
+async def run_level(app, concurrency: int, total: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                r = await client.post("/chat", json={"user_id": f"u{i % 8}", "message": "你好"})
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--levels", default="1,2,4,8,16,32")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--add-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # 在导入 main 之前替换，避免打开真实的 Chroma 存储
+    memory_manager.MemoryManager = lambda: SlowMemoryManager(args.search_latency, args.add_latency)
+    import main as api
+    api.llm = SlowLLM(args.llm_latency)
+
+    print(f"{'并发':>6} {'req/s':>10} {'加速比':>8}")
+    baseline = None
+    for level in [int(x) for x in args.levels.split(",")]:
+        rps = asyncio.run(run_level(api.app, level, args.requests))
+        baseline = baseline or rps
+        print(f"{level:>6} {rps:>10.2f} {rps / baseline:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
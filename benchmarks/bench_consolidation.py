@@ -0,0 +1,164 @@
+"""记忆整理基准测试：整理前后的记忆条数、检索延迟和整理耗时
+
+为 --users 个用户各预置 --facts 个事实，每个事实有若干条变体（模拟同一件事被反复记录）：
+- 完全重复：文本和向量都相同
+- 近似重复：向量与原事实的余弦相似度在 duplicate 阈值以上
+- 相关改写：相似度介于 CONSOLIDATION_SIMILARITY 和 duplicate 阈值之间，需要 LLM 合并
+另有 --noise 比例的独立记忆。直接写入 Chroma，再经 MemoryManager 和 MemoryConsolidator
+整理（LLM 合并和向量化走本地假上游 fake_zhipu.py），统计整理前后每个用户的记忆条数、
+get_all 和向量检索的 p50 / p95、LLM 调用次数和整理耗时；最后追加少量新记忆再整理一次，
+验证增量整理只处理新增部分。
+
+运行:
+    python benchmarks/bench_consolidation.py --users 20 --facts 200 --variants 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, percentiles, start_process
+
+DIMS = 1536
+
+
+def near(rng, base: np.ndarray, similarity: float) -> np.ndarray:
+    """与 base 余弦相似度约为 similarity 的单位向量"""
+    noise = rng.standard_normal(base.shape).astype(np.float32)
+    noise -= noise.dot(base) * base
+    noise /= np.linalg.norm(noise)
+    return similarity * base + np.sqrt(1 - similarity ** 2) * noise
+
+
+def seed(collection, rng, users: int, facts: int, variants: int, noise: float, start: datetime, prefix: str):
+    ids, vectors, payloads = [], [], []
+    for u in range(users):
+        user_id = f"user{u}"
+        when = start
+        for f in range(facts):
+            base = rng.standard_normal(DIMS).astype(np.float32)
+            base /= np.linalg.norm(base)
+            kinds = ["base"] + [("exact", "near", "related")[v % 3] for v in range(variants)]
+            if rng.random() < noise:
+                kinds = ["base"]
+            for v, kind in enumerate(kinds):
+                text = f"{user_id} 的第 {f} 件事" + ("" if kind in ("base", "exact") else f"（第 {v} 次提到）")
+                vector = base if kind in ("base", "exact") else near(rng, base, 0.99 if kind == "near" else 0.9)
+                when += timedelta(seconds=1)
+                ids.append(f"{prefix}-{user_id}-{f}-{v}")
+                vectors.append(vector)
+                payloads.append({
+                    "data": text,
+                    "hash": hashlib.md5(text.encode()).hexdigest(),
+                    "created_at": when.isoformat(),
+                    "user_id": user_id,
+                    "role": "user",
+                })
+    for begin in range(0, len(ids), 1000):
+        collection.add(ids=ids[begin:begin + 1000], embeddings=np.asarray(vectors[begin:begin + 1000]),
+                       metadatas=payloads[begin:begin + 1000])
+    return len(ids)
+
+
+def latency(memory_manager, users: int, queries: int, limit: int) -> dict:
+    """直接调用 mem0（绕过结果缓存），每次检索用随机向量"""
+    rng = np.random.default_rng(1)
+    vector_store = memory_manager.memory.vector_store
+    list_ms, search_ms = [], []
+    for i in range(queries):
+        user_id = f"user{i % users}"
+        start = time.perf_counter()
+        memory_manager.memory.get_all(user_id=user_id, limit=10000)
+        list_ms.append((time.perf_counter() - start) * 1000)
+        vector = rng.standard_normal(DIMS).astype(np.float32)
+        start = time.perf_counter()
+        vector_store.search(query="", vectors=[vector.tolist()], limit=limit, filters={"user_id": user_id})
+        search_ms.append((time.perf_counter() - start) * 1000)
+    return {"get_all": percentiles(list_ms), "search": percentiles(search_ms)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--facts", type=int, default=200, help="每个用户的事实数")
+    parser.add_argument("--variants", type=int, default=4, help="每个事实额外的重复 / 改写条数")
+    parser.add_argument("--noise", type=float, default=0.3, help="没有任何重复的事实比例")
+    parser.add_argument("--max-memories", type=int, default=0, help="每个用户的条数上限，0 表示不限制")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--fake-port", type=int, default=9105)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="consolidation-")
+    os.environ.update({
+        "ZHIPU_API_KEY": "fake.secret",
+        "ZHIPU_BASE_URL": f"http://127.0.0.1:{args.fake_port}/",
+        "CHROMA_PATH": os.path.join(workdir, "chroma_db"),
+        "CHROMA_COLLECTION": "bench",
+        "EMBEDDING_CACHE_DIR": os.path.join(workdir, "embedding_cache"),
+        "CONSOLIDATION_STATE_PATH": os.path.join(workdir, "consolidation.db"),
+        "CONSOLIDATION_MAX_MEMORIES": str(args.max_memories),
+        "MEM0_TELEMETRY": "False",
+    })
+    fake = start_process(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "fake_zhipu.py"), "--port", str(args.fake_port),
+         "--embedding-ms", "0"],
+        dict(os.environ), f"http://127.0.0.1:{args.fake_port}/docs"
+    )
+    report = {"config": vars(args), "results": {}}
+    results = report["results"]
+    try:
+        from consolidation import MemoryConsolidator
+        from memory_manager import MemoryManager
+
+        memory_manager = MemoryManager()
+        consolidator = MemoryConsolidator(memory_manager)
+        collection = memory_manager.partitions.collection_for(None)
+        rng = np.random.default_rng(0)
+        start = datetime.now() - timedelta(days=30)
+        total = seed(collection, rng, args.users, args.facts, args.variants, args.noise, start, "seed")
+        users = {f"user{u}" for u in range(args.users)}
+        print(f"预置 {total} 条记忆（{args.users} 个用户）")
+
+        results["before"] = latency(memory_manager, args.users, args.queries, args.limit)
+        full = consolidator.run_once(users)
+        results["full_run"] = full
+        results["after"] = latency(memory_manager, args.users, args.queries, args.limit)
+
+        # 增量：每个用户追加少量新记忆（含一条重复），只有这些会参与聚类
+        added = seed(collection, rng, args.users, 5, 1, 0.0, datetime.now(), "new")
+        incremental = consolidator.run_once(users)
+        results["incremental_run"] = {"added": added, **incremental}
+    finally:
+        fake.terminate()
+        fake.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"整理: {full['before']} -> {full['after']} 条（减少 {full['shrink_ratio']:.1%}），"
+          f"去重 {full['duplicates']}，合并 {full['merged']} -> {full['created']}，淘汰 {full['evicted']}，"
+          f"LLM 调用 {full['llm_calls']} 次，耗时 {full['seconds']:.1f} 秒")
+    print(f"增量整理: 新增 {added} 条，{incremental['before']} -> {incremental['after']} 条，"
+          f"LLM 调用 {incremental['llm_calls']} 次，耗时 {incremental['seconds']:.2f} 秒")
+    print(f"{'':<10}{'get_all p50':>13}{'p95':>9}{'search p50':>12}{'p95':>9}")
+    for name in ("before", "after"):
+        item = results[name]
+        print(f"{name:<10}{item['get_all']['p50']:>13.2f}{item['get_all']['p95']:>9.2f}"
+              f"{item['search']['p50']:>12.2f}{item['search']['p95']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
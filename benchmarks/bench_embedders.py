@@ -0,0 +1,67 @@
+"""远程 embedding-3 与本地 ONNX 向量化对比
+
+分别测量单条查询延迟（p50/p95）和批量吞吐量。远程后端需要有效的 ZHIPU_API_KEY，
+本地后端需要 LOCAL_EMBEDDING_MODEL_DIR 下的 model.onnx 和 tokenizer.json。
+
+运行: python benchmarks/bench_embedders.py --backends remote,onnx --queries 50 --batch 256
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from reembed_collection import build_embedder, embed_batch
+
+SUBJECTS = ["我", "我的朋友", "我妈妈", "同事小王", "用户"]
+VERBS = ["喜欢", "不喜欢", "正在学习", "计划去", "最近在研究"]
+OBJECTS = ["喝绿茶", "Python 编程", "杭州旅游", "机器学习", "周末爬山", "做川菜", "看科幻电影"]
+
+
+def synthetic_sentences(n: int) -> list:
+    rng = random.Random(42)
+    return [
+        f"{rng.choice(SUBJECTS)}{rng.choice(VERBS)}{rng.choice(OBJECTS)}，第{i}条记录"
+        for i in range(n)
+    ]
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="onnx")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    print(f"{'后端':<8} {'p50(ms)':>9} {'p95(ms)':>9} {'批量(条/秒)':>12}")
+    for backend in args.backends.split(","):
+        embedder = build_embedder(backend)
+        queries = synthetic_sentences(args.queries)
+        embed_batch(embedder, queries[:1])  # 预热
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            embed_batch(embedder, [query])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        corpus = synthetic_sentences(args.batch)
+        start = time.perf_counter()
+        embed_batch(embedder, corpus)
+        throughput = len(corpus) / (time.perf_counter() - start)
+
+        print(f"{backend:<8} {statistics.median(latencies):>9.1f} "
+              f"{percentile(latencies, 0.95):>9.1f} {throughput:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""混合检索的质量和延迟基准测试
+
+合成语料：每个用户若干条记忆，由 5 类模板（订单、会议、宠物、旅行、项目）填入人名、城市和
+唯一编号生成。记忆向量 = 所属类别的中心 + 记忆自身的随机分量，模拟稠密向量只能表达
+“在说什么事”、区分不了具体编号和人名的情况。三类查询：
+
+- exact：按编号查找（“ORD-000123” 或 “ORD-000123 的详情”），查询向量只接近该类别中心
+- semantic：与记忆没有共同词的改写，查询向量接近目标记忆的向量
+- mixed：人名 + 类别（“张伟的订单”），目标为该用户这个人这一类的全部记忆
+
+经 MemoryManager.get_context 分别以 vector / keyword / hybrid（关闭快速路径）/ hybrid+fast
+四种方式检索，统计 recall@k、p50 / p95 延迟和向量化调用比例。查询向量化用按文本查表的
+合成向量代替，并 sleep --embedding-ms 模拟远程 embedding 调用的耗时。
+
+运行:
+    python benchmarks/bench_hybrid_retrieval.py --users 10 --memories 2000 --embedding-ms 50
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentiles
+
+from mem0.configs.embeddings.base import BaseEmbedderConfig
+
+TEMPLATES = (
+    ("订单", "ORD-{n:06d}", "订单 {code} 由{name}下单，寄往{city}"),
+    ("会议", "MTG-{n:06d}", "和{name}约在{city}开会，会议号 {code}"),
+    ("宠物", "PET-{n:06d}", "{name}养了一只叫{pet}的猫，芯片号 {code}"),
+    ("旅行", "CA{n:06d}", "{name}下个月去{city}旅行，航班 {code}"),
+    ("项目", "PRJ-{n:06d}", "{name}负责的项目编号是 {code}，团队在{city}"),
+)
+SURNAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平"
+CITIES = ("北京", "上海", "广州", "深圳", "杭州", "成都", "武汉", "西安", "南京", "重庆",
+          "苏州", "天津", "长沙", "郑州", "青岛", "厦门", "昆明", "大连", "宁波", "合肥")
+PETS = ("咪咪", "豆豆", "球球", "花花", "旺财", "小白", "团子", "年糕", "可乐", "布丁")
+MODES = (("vector", "vector", False), ("keyword", "keyword", False),
+         ("hybrid", "hybrid", False), ("hybrid+fast", "hybrid", True))
+
+
+def unit(vector: np.ndarray) -> np.ndarray:
+    return vector / np.linalg.norm(vector)
+
+
+class SyntheticEmbedder:
+    """按文本查表返回预先生成的查询向量，sleep 模拟远程调用"""
+
+    def __init__(self, table: dict, delay_ms: float, dims: int):
+        self.config = BaseEmbedderConfig(model="synthetic", embedding_dims=dims)
+        self.table = table
+        self.delay = delay_ms / 1000
+        self.calls = 0
+
+    def embed(self, text, memory_action=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.table[text].tolist()
+
+
+def build(rng, users: int, memories: int, dims: int) -> tuple:
+    centers = [unit(rng.standard_normal(dims)) for _ in TEMPLATES]
+    names = [s + g for s in SURNAMES for g in GIVEN]
+    records, n = [], 0
+    for u in range(users):
+        user_names = rng.choice(names, size=max(1, memories // 10), replace=False)
+        for _ in range(memories):
+            t = int(rng.integers(len(TEMPLATES)))
+            topic, code_format, template = TEMPLATES[t]
+            code = code_format.format(n=n)
+            name = str(rng.choice(user_names))
+            text = template.format(code=code, name=name, city=rng.choice(CITIES), pet=rng.choice(PETS))
+            vector = unit(0.6 * centers[t] + 0.8 * unit(rng.standard_normal(dims)))
+            records.append({"id": f"m-{n}", "user_id": f"user{u}", "topic": topic, "t": t, "code": code,
+                            "name": name, "text": text, "vector": vector})
+            n += 1
+    return centers, records
+
+
+def make_queries(rng, centers: list, records: list, count: int, dims: int) -> list:
+    queries = []
+    picks = rng.choice(len(records), size=count * 3, replace=False)
+    for i, k in enumerate(picks):
+        record = records[k]
+        kind = ("exact", "semantic", "mixed")[i % 3]
+        if kind == "exact":
+            # 一半是搜索框里直接输入的编号，一半是带上下文的问句
+            text = record["code"] if i % 2 else f"{record['code']} 的详情"
+            vector = unit(centers[record["t"]] + 0.3 * unit(rng.standard_normal(dims)))
+            truth = {record["id"]}
+        elif kind == "semantic":
+            text = f"我之前提过的那件事（第{i}次）"
+            vector = unit(record["vector"] + 0.25 * unit(rng.standard_normal(dims)))
+            truth = {record["id"]}
+        else:
+            text = f"{record['name']}的{record['topic']}（{i}）"
+            vector = unit(centers[record["t"]] + 0.3 * unit(rng.standard_normal(dims)))
+            truth = {r["id"] for r in records if r["user_id"] == record["user_id"]
+                     and r["name"] == record["name"] and r["t"] == record["t"]}
+        queries.append({"kind": kind, "user_id": record["user_id"], "text": text, "vector": vector, "truth": truth})
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--memories", type=int, default=2000, help="每个用户的记忆数")
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100, help="每类查询的条数")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--embedding-ms", type=float, default=50)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hybrid-")
+    os.environ.update({
+        "ZHIPU_API_KEY": "bench-key",
+        "CHROMA_PATH": os.path.join(workdir, "chroma_db"),
+        "CHROMA_COLLECTION": "bench",
+        "KEYWORD_INDEX_ENABLED": "true",
+        "KEYWORD_INDEX_PATH": os.path.join(workdir, "keyword_index.db"),
+        "EMBEDDING_CACHE_ENABLED": "false",
+        "CONSOLIDATION_STATE_PATH": os.path.join(workdir, "consolidation.db"),
+        "MEM0_TELEMETRY": "False",
+    })
+    report = {"config": vars(args), "results": []}
+    try:
+        from memory_manager import MemoryManager
+
+        rng = np.random.default_rng(0)
+        centers, records = build(rng, args.users, args.memories, args.dims)
+        queries = make_queries(rng, centers, records, args.queries, args.dims)
+        memory_manager = MemoryManager()
+        embedder = SyntheticEmbedder({q["text"]: q["vector"] for q in queries}, args.embedding_ms, args.dims)
+        memory_manager.memory.embedding_model = embedder
+
+        start = time.perf_counter()
+        created_at = datetime.now().isoformat()
+        for begin in range(0, len(records), 1000):
+            batch = records[begin:begin + 1000]
+            memory_manager.memory.vector_store.insert(
+                vectors=[r["vector"].tolist() for r in batch],
+                payloads=[{"data": r["text"], "user_id": r["user_id"], "role": "user", "created_at": created_at}
+                          for r in batch],
+                ids=[r["id"] for r in batch]
+            )
+        print(f"写入 {len(records)} 条记忆（含关键词索引）: {time.perf_counter() - start:.1f} 秒")
+
+        print(f"{'mode':<13}{'exact':>8}{'semantic':>10}{'mixed':>8}{'all':>8}{'p50 ms':>9}{'p95 ms':>9}{'embed':>8}")
+        for name, mode, fast_path in MODES:
+            memory_manager.keyword_fast_path = fast_path
+            # 各模式使用相同的查询，清空结果缓存
+            memory_manager._invalidate()
+            embedder.calls = 0
+            hits, totals, latencies = {}, {}, []
+            for query in queries:
+                begin = time.perf_counter()
+                results = memory_manager.get_context(query["user_id"], query["text"], limit=args.k, mode=mode)
+                latencies.append((time.perf_counter() - begin) * 1000)
+                found = {item["id"] for item in results}
+                hits[query["kind"]] = hits.get(query["kind"], 0) + len(found & query["truth"])
+                totals[query["kind"]] = totals.get(query["kind"], 0) + min(len(query["truth"]), args.k)
+            recall = {kind: hits[kind] / totals[kind] for kind in totals}
+            recall["all"] = sum(hits.values()) / sum(totals.values())
+            stats = percentiles(latencies)
+            embed_ratio = embedder.calls / len(queries)
+            report["results"].append({"mode": name, "recall": recall, "embedding_calls_per_query": embed_ratio,
+                                      **stats})
+            print(f"{name:<13}{recall['exact']:>8.3f}{recall['semantic']:>10.3f}{recall['mixed']:>8.3f}"
+                  f"{recall['all']:>8.3f}{stats['p50']:>9.1f}{stats['p95']:>9.1f}{embed_ratio:>8.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
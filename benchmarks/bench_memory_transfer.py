@@ -0,0 +1,134 @@
+"""记忆导出 / 导入吞吐量基准测试
+
+预置指定规模的记忆库（默认 10 万条、100 个用户），测量：
+- 导出（含向量）：NDJSON 和 gzip 两种格式的吞吐量、文件大小，以及导出过程中的 Python
+  堆内存峰值（按页读取时应与记忆总数无关）
+- 导入到新集合：复用文件中的向量，分别用 1 个和 --workers 个工作线程
+- 导入时重新向量化：向量模型名不同，经本地假上游（fake_zhipu.py）的 /embeddings 按批向量化
+
+运行:
+    python benchmarks/bench_memory_transfer.py --size 100000 --users 100 --dims 1536
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, seed_store, start_process
+
+os.environ.setdefault("ZHIPU_API_KEY", "bench-key")
+
+import chromadb
+from chromadb.config import Settings
+
+import memory_transfer
+
+
+def export_to(collection, path: str, compress: bool) -> dict:
+    start = time.perf_counter()
+    lines = memory_transfer.export_lines(collection, model="bench-model")
+    with open(path, "wb") as f:
+        if compress:
+            for chunk in memory_transfer.gzip_chunks(lines):
+                f.write(chunk)
+        else:
+            for line in lines:
+                f.write(line.encode("utf-8"))
+    return {"seconds": time.perf_counter() - start, "bytes": os.path.getsize(path)}
+
+
+def export_peak_memory(collection) -> int:
+    """只统计导出本身的堆内存峰值（字节），输出直接丢弃"""
+    tracemalloc.start()
+    for _ in memory_transfer.gzip_chunks(memory_transfer.export_lines(collection, model="bench-model")):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def import_from(client, path: str, name: str, embedder, model: str, workers: int) -> dict:
+    collection = client.get_or_create_collection(name)
+    importer = memory_transfer.MemoryImporter(collection, embedder, model, workers=workers)
+    stats = importer.run(memory_transfer.iter_lines(open_chunks(path)))
+    assert collection.count() == stats["imported"]
+    client.delete_collection(name)
+    return stats
+
+
+def open_chunks(path: str):
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--fake-port", type=int, default=9104)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="transfer-")
+    client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma_db"),
+                                       settings=Settings(anonymized_telemetry=False))
+    report = {"config": vars(args), "results": {}}
+    results = report["results"]
+    fake = None
+    try:
+        print(f"预置 {args.size} 条记忆（{args.dims} 维）...")
+        seed_store(client, "source", args.size, args.users, args.dims)
+        source = client.get_collection("source")
+
+        for compress in (False, True):
+            path = os.path.join(workdir, "export.ndjson" + (".gz" if compress else ""))
+            result = export_to(source, path, compress)
+            results["export_gzip" if compress else "export_ndjson"] = result
+            print(f"导出 {'gzip  ' if compress else 'ndjson'}: {args.size / result['seconds']:>8.0f} 条/秒，"
+                  f"{result['bytes'] / 1024 / 1024:.1f} MB")
+        results["export_peak_heap_mb"] = export_peak_memory(source) / 1024 / 1024
+        print(f"导出堆内存峰值: {results['export_peak_heap_mb']:.1f} MB")
+
+        gz_path = os.path.join(workdir, "export.ndjson.gz")
+        for workers in sorted({1, args.workers}):
+            stats = import_from(client, gz_path, f"reuse_{workers}", None, "bench-model", workers)
+            results[f"import_reuse_{workers}w"] = stats
+            print(f"导入（复用向量，{workers} 线程）: {stats['imported'] / stats['seconds']:>8.0f} 条/秒")
+
+        env = dict(os.environ)
+        fake = start_process(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fake_zhipu.py"), "--port", str(args.fake_port),
+             "--embedding-ms", "0"],
+            env, f"http://127.0.0.1:{args.fake_port}/docs"
+        )
+        from mem0.configs.embeddings.base import BaseEmbedderConfig
+        from mem0.embeddings.openai import OpenAIEmbedding
+        embedder = OpenAIEmbedding(BaseEmbedderConfig(
+            model="embedding-3", api_key="fake.secret", embedding_dims=args.dims,
+            openai_base_url=f"http://127.0.0.1:{args.fake_port}/",
+        ))
+        stats = import_from(client, gz_path, "reembed", embedder, "embedding-3", args.workers)
+        results["import_reembed"] = stats
+        print(f"导入（重新向量化，{args.workers} 线程）: {stats['imported'] / stats['seconds']:>8.0f} 条/秒")
+    finally:
+        if fake is not None:
+            fake.terminate()
+            fake.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
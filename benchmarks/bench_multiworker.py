@@ -0,0 +1,115 @@
+"""多 worker 吞吐量基准测试（Chroma 服务模式）
+
+启动本地 Chroma 服务（chroma run）、多进程的假上游（fake_zhipu.py），再分别以 1、2、4…
+个 uvicorn worker 启动 API（VECTOR_STORE_MODE=server），在相同并发下压测 /chat，
+输出各 worker 数的吞吐量、延迟和相对单 worker 的加速比。
+
+假上游延迟设得很低，使瓶颈落在 API 进程自身的 CPU 上（记忆检索、提示词组装、序列化），
+这时吞吐量应随 worker 数近似线性增长，直到用满 CPU 核数。
+
+运行:
+    python benchmarks/bench_multiworker.py --workers 1,2,4 --concurrency 32 --requests 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import chromadb
+from chromadb.config import Settings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, run_level, seed_store, start_process
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--store-size", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--ttft-ms", type=float, default=5.0)
+    parser.add_argument("--fake-workers", type=int, default=4)
+    parser.add_argument("--chroma-port", type=int, default=8200)
+    parser.add_argument("--fake-port", type=int, default=9102)
+    parser.add_argument("--api-port", type=int, default=8102)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="multiworker-")
+    env = dict(os.environ)
+    env.update({
+        "ZHIPU_API_KEY": "fake.secret",
+        "ZHIPU_BASE_URL": f"http://127.0.0.1:{args.fake_port}/",
+        "MEM0_TELEMETRY": "False",
+        "VECTOR_STORE_MODE": "server",
+        "CHROMA_HOST": "127.0.0.1",
+        "CHROMA_PORT": str(args.chroma_port),
+    })
+
+    processes = []
+    report = {"config": vars(args), "results": []}
+    try:
+        processes.append(start_process(
+            ["chroma", "run", "--path", os.path.join(workdir, "chroma_db"), "--port", str(args.chroma_port)],
+            env, f"http://127.0.0.1:{args.chroma_port}/api/v2/heartbeat"
+        ))
+        processes.append(start_process(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fake_zhipu.py"), "--port", str(args.fake_port),
+             "--ttft-ms", str(args.ttft_ms), "--tokens-per-sec", "0", "--embedding-ms", "0",
+             "--workers", str(args.fake_workers)],
+            env, f"http://127.0.0.1:{args.fake_port}/docs"
+        ))
+        client = chromadb.HttpClient(host="127.0.0.1", port=args.chroma_port,
+                                     settings=Settings(anonymized_telemetry=False))
+        seed_store(client, env.get("CHROMA_COLLECTION", "zhipu_conversations"),
+                   args.store_size, args.users, args.dims)
+
+        base_url = f"http://127.0.0.1:{args.api_port}"
+        baseline = None
+        for workers in [int(x) for x in args.workers.split(",")]:
+            api_env = dict(env)
+            api_env.update({
+                "EMBEDDING_CACHE_DIR": os.path.join(workdir, f"embedding_cache_{workers}"),
+                "MEMORY_QUEUE_PATH": os.path.join(workdir, f"memory_queue_{workers}.db"),
+            })
+            api = start_process(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port),
+                 "--workers", str(workers), "--log-level", "warning"],
+                api_env, f"{base_url}/health"
+            )
+            try:
+                # 预热：等所有 worker 启动完成并填充连接池
+                asyncio.run(run_level(base_url, args.concurrency, args.concurrency * 4, args.users))
+                result = asyncio.run(run_level(base_url, args.concurrency, args.requests, args.users))
+            finally:
+                api.terminate()
+                api.wait()
+            result["workers"] = workers
+            baseline = baseline or result["throughput_rps"]
+            result["speedup"] = round(result["throughput_rps"] / baseline, 2) if baseline else None
+            report["results"].append(result)
+            print(f"workers={workers} rps={result['throughput_rps']} speedup={result['speedup']} "
+                  f"p50={result['latency_ms']['p50']} p99={result['latency_ms']['p99']} errors={result['errors']}",
+                  file=sys.stderr)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""分区布局的检索延迟基准测试
+
+比较三种布局下轻量用户的检索延迟随记忆总量的变化：
+- single：所有用户一个集合，按 user_id 元数据过滤（当前默认）
+- user：每个用户一个集合
+- hash：按用户哈希分到 --buckets 个集合
+
+每种布局中固定有 --light-users 个轻量用户，各 --light-memories 条记忆；其余记忆平均
+分给 --users 个其他用户。按 --sizes 逐级追加其他用户的记忆，每一级对轻量用户做
+--queries 次检索（与 mem0 相同：query + where user_id），统计 p50 / p95 / p99。
+直接读写 Chroma，向量为随机向量，不经过 mem0 和 embedding 接口。
+
+运行:
+    python benchmarks/bench_partitions.py --sizes 10000,100000,1000000 --dims 1536
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentiles
+
+import chromadb
+from chromadb.config import Settings
+
+from partitioning import PartitionRouter
+
+LAYOUTS = ("single", "user", "hash")
+
+
+class Layout:
+    def __init__(self, client, name: str, buckets: int):
+        self.name = name
+        mode = "none" if name == "single" else name
+        self.router = PartitionRouter(client, f"bench_{name}", mode=mode, buckets=buckets)
+
+    def add(self, ids: list, vectors: np.ndarray, payloads: list):
+        groups = {}
+        for i, payload in enumerate(payloads):
+            groups.setdefault(self.router.name_for(payload["user_id"]), []).append(i)
+        for indexes in groups.values():
+            collection = self.router.collection_for(payloads[indexes[0]]["user_id"])
+            for start in range(0, len(indexes), 5000):
+                chunk = indexes[start:start + 5000]
+                collection.add(
+                    ids=[ids[i] for i in chunk],
+                    embeddings=vectors[chunk],
+                    metadatas=[payloads[i] for i in chunk]
+                )
+
+    def search(self, user_id: str, vector, limit: int):
+        collection = self.router.collection_for(user_id, create=False)
+        return collection.query(query_embeddings=[vector], where={"user_id": user_id}, n_results=limit)
+
+
+def records(rng, start: int, count: int, users: list, dims: int):
+    ids = [f"m-{i}" for i in range(start, start + count)]
+    vectors = rng.standard_normal((count, dims), dtype=np.float32)
+    payloads = [{"data": f"记忆 {i}", "user_id": users[(i - start) % len(users)], "role": "user"}
+                for i in range(start, start + count)]
+    return ids, vectors, payloads
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="记忆总量，逐级追加")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS))
+    parser.add_argument("--users", type=int, default=1000, help="其他用户数")
+    parser.add_argument("--light-users", type=int, default=20)
+    parser.add_argument("--light-memories", type=int, default=50)
+    parser.add_argument("--buckets", type=int, default=64)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    workdir = tempfile.mkdtemp(prefix="partitions-")
+    client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma_db"),
+                                       settings=Settings(anonymized_telemetry=False))
+    layouts = [Layout(client, name, args.buckets) for name in args.layouts.split(",")]
+    light_users = [f"light{i}" for i in range(args.light_users)]
+    other_users = [f"user{i}" for i in range(args.users)]
+    report = {"config": vars(args), "results": []}
+    rng = np.random.default_rng(0)
+
+    try:
+        light = args.light_users * args.light_memories
+        batch = records(rng, 0, light, light_users, args.dims)
+        for layout in layouts:
+            layout.add(*batch)
+        total = light
+
+        print(f"{'size':>9}{'layout':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'collections':>13}")
+        for size in sizes:
+            # 每次最多生成 5 万条，控制内存占用
+            while total < size:
+                count = min(50000, size - total)
+                batch = records(rng, total, count, other_users, args.dims)
+                for layout in layouts:
+                    layout.add(*batch)
+                total += count
+
+            queries = rng.standard_normal((args.queries, args.dims), dtype=np.float32)
+            for layout in layouts:
+                # 先对每个轻量用户检索一次，打开集合、加载索引
+                for user_id in light_users:
+                    layout.search(user_id, queries[0], args.limit)
+                latencies = []
+                for i, vector in enumerate(queries):
+                    start = time.perf_counter()
+                    result = layout.search(light_users[i % len(light_users)], vector, args.limit)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    assert len(result["ids"][0]) == args.limit
+                stats = percentiles(latencies)
+                collections = len(layout.router.collections()) if layout.router.partitioned else 1
+                report["results"].append({"size": total, "layout": layout.name,
+                                          "collections": collections, **stats})
+                print(f"{total:>9}{layout.name:>8}{stats['p50']:>9.2f}{stats['p95']:>9.2f}"
+                      f"{stats['p99']:>9.2f}{collections:>13}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""MCP 搜索连接池基准测试
+
+对比三种方式调用本地假 MCP 服务（stub_mcp_server.py）：
+- spawn：每个会话新启动一个服务进程（原来的做法），测启动 + 首次搜索的耗时
+- pooled：共享的长驻进程池，不同查询并发调用
+- cached：相同查询（大小写、空白不同）并发调用，测合并与缓存后的耗时和上游调用次数
+
+运行: python benchmarks/bench_search_pool.py --sessions 5 --queries 40 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("ZHIPU_API_KEY", "bench.secret")
+
+from mcp import StdioServerParameters
+
+from search_tool import MCPServerPool
+
+
+def stub_params(latency_ms: float) -> StdioServerParameters:
+    return StdioServerParameters(
+        command=sys.executable,
+        args=[os.path.join(ROOT, "benchmarks", "stub_mcp_server.py"), "--latency-ms", str(latency_ms)],
+    )
+
+
+def bench_spawn(params, sessions: int) -> float:
+    start = time.perf_counter()
+    for i in range(sessions):
+        pool = MCPServerPool(params, size=1)
+        pool.start()
+        pool.call_tool_sync("search", {"query": f"会话 {i}"})
+        pool.shutdown()
+    return (time.perf_counter() - start) / sessions
+
+
+async def run_concurrent(pool, queries: list, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(query):
+        async with semaphore:
+            await pool.acall_tool("search", {"query": query})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    params = stub_params(args.latency_ms)
+
+    per_session = bench_spawn(params, args.sessions)
+    print(f"spawn   每会话启动 + 首次搜索: {per_session * 1000:.0f} ms")
+
+    pool = MCPServerPool(params, size=args.pool_size, max_concurrency=args.concurrency)
+    start = time.perf_counter()
+    pool.start()
+    print(f"pooled  进程池启动（一次性）: {(time.perf_counter() - start) * 1000:.0f} ms")
+    try:
+        distinct = [f"查询 {i}" for i in range(args.queries)]
+        elapsed = asyncio.run(run_concurrent(pool, distinct, args.concurrency))
+        print(f"pooled  {args.queries} 个不同查询: {elapsed * 1000:.0f} ms, "
+              f"平均 {elapsed / args.queries * 1000:.1f} ms/次, 上游调用 {pool.upstream_calls} 次")
+
+        before = pool.upstream_calls
+        variants = [" Python  异步 " if i % 2 else "python 异步" for i in range(args.queries)]
+        elapsed = asyncio.run(run_concurrent(pool, variants, args.concurrency))
+        print(f"cached  {args.queries} 个相同查询并发: {elapsed * 1000:.0f} ms, "
+              f"上游调用 {pool.upstream_calls - before} 次")
+
+        before = pool.upstream_calls
+        elapsed = asyncio.run(run_concurrent(pool, variants, args.concurrency))
+        print(f"cached  再次查询（命中缓存）: {elapsed * 1000:.1f} ms, "
+              f"上游调用 {pool.upstream_calls - before} 次")
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
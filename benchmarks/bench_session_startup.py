@@ -0,0 +1,62 @@
+"""Streamlit 会话冷启动基准测试
+
+对比两种方式下每个新会话初始化资源的耗时：
+- 改造前：每个会话新建 MemoryManager（mem0 + Chroma 客户端）和 ChatZhipuAI
+- 改造后：从 resources 获取进程级共享实例
+
+只初始化本地资源，不发起任何网络请求。
+
+运行: python benchmarks/bench_session_startup.py --sessions 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ZHIPU_API_KEY", "bench-key")
+os.environ.setdefault("MEM0_TELEMETRY", "False")
+os.environ.setdefault("CHROMA_PATH", os.path.join(tempfile.mkdtemp(), "chroma_db"))
+os.environ.setdefault("EMBEDDING_CACHE_DIR", os.path.join(tempfile.mkdtemp(), "embedding_cache"))
+
+from langchain_community.chat_models import ChatZhipuAI
+
+import config
+import resources
+from memory_manager import MemoryManager
+
+
+def per_session_init():
+    MemoryManager()
+    ChatZhipuAI(model="glm-4-flash", api_key=config.ZHIPU_API_KEY, temperature=0.7)
+
+
+def shared_init():
+    resources.get_memory_manager()
+    resources.get_llm()
+
+
+def measure(func, sessions: int):
+    timings = []
+    for _ in range(sessions):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'方式':<10} {'首个会话(ms)':>14} {'中位数(ms)':>12} {'总计(ms)':>10}")
+    for name, func in [("每会话新建", per_session_init), ("进程共享", shared_init)]:
+        timings = measure(func, args.sessions)
+        print(f"{name:<10} {timings[0]:>14.1f} {statistics.median(timings):>12.2f} {sum(timings):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""启动耗时基准测试
+
+在全新的解释器中测量：
+- import：`import main` 的耗时（重复多次取中位数），以及 -X importtime 统计的最慢模块
+- 冷启动：启动 uvicorn 进程后 /livez 首次可用的时间，和预热完成、/readyz 返回 200 的时间，
+  以及 /readyz 报告的各预热步骤耗时
+
+上游为本地假服务（fake_zhipu.py），不访问真实 API。指定 --max-import-ms 时导入耗时
+超出即以非零状态退出，可放进 CI 防止有人在模块顶层重新引入重依赖。
+
+运行:
+    python benchmarks/bench_startup.py --runs 5 --max-import-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import ROOT, start_process
+
+
+def measure_import(env: dict, module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1]) * 1000
+
+
+def slowest_imports(env: dict, module: str, top: int) -> list:
+    """-X importtime 输出中累计耗时最长的顶层依赖"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                            env=env, capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 只统计 main 直接导入的模块（缩进两格）
+        if name.startswith("   ") and not name.startswith("    "):
+            rows.append((name.strip(), int(cumulative) / 1000))
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def wait_for(url: str, process, timeout: float, status: int = 200) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError("API 进程退出")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == status:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"等待 {url} 超时")
+
+
+def cold_start(env: dict, port: int) -> dict:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        live = wait_for(f"{base_url}/livez", process, 60)
+        ready = wait_for(f"{base_url}/readyz", process, 120)
+        steps = httpx.get(f"{base_url}/readyz").json()["steps"]
+        return {"livez_ms": (live - start) * 1000, "readyz_ms": (ready - start) * 1000, "steps": steps}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--max-import-ms", type=float, help="import main 的中位耗时上限（毫秒）")
+    parser.add_argument("--fake-port", type=int, default=9103)
+    parser.add_argument("--api-port", type=int, default=8103)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    env = dict(os.environ)
+    env.update({
+        "ZHIPU_API_KEY": "fake.secret",
+        "ZHIPU_BASE_URL": f"http://127.0.0.1:{args.fake_port}/",
+        "MEM0_TELEMETRY": "False",
+        "CHROMA_PATH": os.path.join(workdir, "chroma_db"),
+        "EMBEDDING_CACHE_DIR": os.path.join(workdir, "embedding_cache"),
+        "MEMORY_QUEUE_PATH": os.path.join(workdir, "memory_queue.db"),
+    })
+
+    imports = [measure_import(env, "main") for _ in range(args.runs)]
+    report = {
+        "import_main_ms": statistics.median(imports),
+        "slowest_imports": slowest_imports(env, "main", args.top),
+        "cold_starts": [],
+    }
+    print(f"import main: 中位 {report['import_main_ms']:.0f} ms（{args.runs} 次）")
+    print("最慢的直接依赖（累计毫秒）:")
+    for name, ms in report["slowest_imports"]:
+        print(f"  {name:<28}{ms:>8.1f}")
+
+    fake = start_process(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "fake_zhipu.py"), "--port", str(args.fake_port)],
+        env, f"http://127.0.0.1:{args.fake_port}/docs"
+    )
+    try:
+        print(f"\n{'run':<6}{'livez ms':>10}{'readyz ms':>11}  预热步骤（ms）")
+        for run in range(min(args.runs, 3)):
+            result = cold_start(env, args.api_port)
+            report["cold_starts"].append(result)
+            steps = ", ".join(f"{name}={ms:.0f}" for name, ms in result["steps"].items())
+            print(f"{run + 1:<6}{result['livez_ms']:>10.0f}{result['readyz_ms']:>11.0f}  {steps}")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.max_import_ms and report["import_main_ms"] > args.max_import_ms:
+        print(f"\nimport main 耗时 {report['import_main_ms']:.0f} ms 超过上限 {args.max_import_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""本地的智谱 / OpenAI 兼容假服务，用于压测时替代真实上游
+
+- POST /chat/completions：对话补全，支持 SSE 流式输出。首 token 延迟服从对数正态分布，
+  之后按固定速率输出 token。识别 mem0 的事实提取和记忆更新请求，返回合法的 JSON。
+  请求带 tools 且还没有工具结果时，返回 --tool-calls 个工具调用（参数为用户最后一条消息）。
+- POST /embeddings：根据文本哈希生成确定性的归一化向量，维度取请求中的 dimensions。
+
+让服务指向假服务：
+    ZHIPU_BASE_URL=http://127.0.0.1:9100/ ZHIPU_API_KEY=fake.secret python main.py
+
+运行: python benchmarks/fake_zhipu.py --port 9100 --ttft-ms 300 --tokens-per-sec 60
+"""
+import argparse
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="fake zhipu")
+
+settings = {
+    "ttft_ms": 300.0,
+    "latency_sigma": 0.4,
+    "tokens_per_sec": 60.0,
+    "response_tokens": 40,
+    "embedding_ms": 20.0,
+    "tool_calls": 1,
+}
+# 多 worker 运行时由父进程通过环境变量传入参数
+settings.update(json.loads(os.getenv("FAKE_ZHIPU_SETTINGS", "{}")))
+
+
+def fake_embedding(text: str, dims: int = 1536) -> list:
+    """同一文本总是得到同一向量，便于在压测之间复现检索结果"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dims).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def sample_ttft() -> float:
+    median = settings["ttft_ms"] / 1000
+    return random.lognormvariate(np.log(median), settings["latency_sigma"]) if median > 0 else 0.0
+
+
+def json_reply(messages: list) -> str:
+    """针对 mem0 的两类 JSON 请求和记忆整理的合并请求构造回复"""
+    content = messages[-1].get("content", "") if messages else ""
+    if content.startswith('{"groups"'):
+        # 记忆整理：每组取最新的一条作为合并结果
+        groups = json.loads(content)["groups"]
+        return json.dumps({"merged": [group[-1]["text"] for group in groups]}, ensure_ascii=False)
+    match = re.search(r"new retrieved facts.*?```\s*(.*?)\s*```", content, re.S)
+    if match:
+        try:
+            facts = ast.literal_eval(match.group(1))
+        except (ValueError, SyntaxError):
+            facts = []
+        return json.dumps({"memory": [
+            {"id": str(i), "text": fact, "event": "ADD"} for i, fact in enumerate(facts)
+        ]}, ensure_ascii=False)
+
+    facts = [line[len("user: "):][:100] for line in content.splitlines() if line.startswith("user: ")]
+    return json.dumps({"facts": facts}, ensure_ascii=False)
+
+
+def tool_calls_reply(body: dict) -> list:
+    """为 agent 请求构造工具调用，每个调用使用不同的查询以便并发执行"""
+    messages = body.get("messages", [])
+    if not body.get("tools") or any(m.get("role") == "tool" for m in messages):
+        return []
+    name = body["tools"][0]["function"]["name"]
+    query = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    return [{
+        "index": i,
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps({"query": f"{query} {i}"}, ensure_ascii=False)},
+    } for i in range(settings["tool_calls"])]
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "glm-4-flash")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    tool_calls = tool_calls_reply(body)
+
+    if tool_calls:
+        await asyncio.sleep(sample_ttft())
+        tokens = []
+        text = ""
+    elif body.get("response_format", {}).get("type") == "json_object":
+        await asyncio.sleep(sample_ttft())
+        text = json_reply(body.get("messages", []))
+        tokens = [text]
+    else:
+        tokens = [f"词{i}" for i in range(settings["response_tokens"])]
+        text = "".join(tokens)
+
+    interval = 1 / settings["tokens_per_sec"] if settings["tokens_per_sec"] > 0 else 0
+    usage = {"prompt_tokens": 100, "completion_tokens": len(tokens), "total_tokens": 100 + len(tokens)}
+
+    if body.get("stream"):
+        async def stream():
+            if tool_calls:
+                chunk = {
+                    "id": completion_id,
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": "", "tool_calls": tool_calls},
+                        "finish_reason": "tool_calls",
+                    }],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                yield "data: [DONE]\n\n"
+                return
+            await asyncio.sleep(sample_ttft())
+            for i, token in enumerate(tokens):
+                last = i == len(tokens) - 1
+                chunk = {
+                    "id": completion_id,
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": token},
+                        "finish_reason": "stop" if last else None,
+                    }],
+                }
+                if last:
+                    chunk["usage"] = usage
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(interval)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    if not tool_calls and body.get("response_format", {}).get("type") != "json_object":
+        await asyncio.sleep(sample_ttft() + interval * len(tokens))
+    message = {"role": "assistant", "content": text}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if tool_calls else "stop",
+        }],
+        "usage": usage,
+    }
+
+
+@app.post("/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    dims = body.get("dimensions") or 1536
+    await asyncio.sleep(settings["embedding_ms"] / 1000)
+    return {
+        "object": "list",
+        "model": body.get("model", "embedding-3"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dims)}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=settings["ttft_ms"])
+    parser.add_argument("--latency-sigma", type=float, default=settings["latency_sigma"])
+    parser.add_argument("--tokens-per-sec", type=float, default=settings["tokens_per_sec"])
+    parser.add_argument("--response-tokens", type=int, default=settings["response_tokens"])
+    parser.add_argument("--embedding-ms", type=float, default=settings["embedding_ms"])
+    parser.add_argument("--tool-calls", type=int, default=settings["tool_calls"])
+    parser.add_argument("--workers", type=int, default=1, help="多进程运行，避免假上游成为多 worker 压测的瓶颈")
+    args = parser.parse_args()
+
+    settings.update({
+        "ttft_ms": args.ttft_ms,
+        "latency_sigma": args.latency_sigma,
+        "tokens_per_sec": args.tokens_per_sec,
+        "response_tokens": args.response_tokens,
+        "embedding_ms": args.embedding_ms,
+        "tool_calls": args.tool_calls,
+    })
+    if args.workers > 1:
+        os.environ["FAKE_ZHIPU_SETTINGS"] = json.dumps(settings)
+        uvicorn.run("fake_zhipu:app", host=args.host, port=args.port, log_level="warning",
+                    workers=args.workers, app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""/chat 压测驱动
+
+启动本地假上游（fake_zhipu.py）和指向它的 API 服务，按记忆库规模和并发数扫描，
+输出 p50/p95/p99 延迟、吞吐量，以及从 Server-Timing 响应头统计的各阶段耗时。
+结果为 JSON，便于对比不同版本。
+
+运行:
+    python benchmarks/load_test.py --store-sizes 0,1000,10000 --concurrency 1,8,32 \\
+        --requests 200 --output load_results.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_zhipu import fake_embedding
+
+TOPICS = ["喝茶", "爬山", "Python", "旅游", "做饭", "电影", "跑步", "摄影", "读书", "音乐"]
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))], 2)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+            "mean": round(sum(values) / len(values), 2)}
+
+
+def seed_store(client, collection: str, size: int, users: int, dims: int):
+    """直接写入 Chroma 构造指定规模的记忆库，跳过 mem0 的 LLM 提取
+
+    client 可以是嵌入式的 PersistentClient，也可以是连接 Chroma 服务的 HttpClient。
+    """
+    if size <= 0:
+        return
+    col = client.get_or_create_collection(collection)
+    rng = random.Random(0)
+    batch = 1000
+    for start in range(0, size, batch):
+        ids, vectors, payloads = [], [], []
+        for i in range(start, min(size, start + batch)):
+            text = f"用户喜欢{rng.choice(TOPICS)}，记录编号 {i}"
+            ids.append(f"seed-{i}")
+            vectors.append(fake_embedding(text, dims))
+            payloads.append({
+                "data": text,
+                "hash": hashlib.md5(text.encode()).hexdigest(),
+                "created_at": datetime.now().isoformat(),
+                "user_id": f"user{i % users}",
+                "role": "user",
+            })
+        col.add(ids=ids, embeddings=vectors, metadatas=payloads)
+
+
+def start_process(args: list, env: dict, url: str, timeout: float = 60.0):
+    process = subprocess.Popen(args, cwd=ROOT, env=env)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise RuntimeError(f"进程启动失败: {' '.join(args)}")
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"等待 {url} 超时")
+
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in header.split(","):
+        name, _, dur = part.strip().partition(";dur=")
+        if name and dur:
+            stages[name] = float(dur)
+    return stages
+
+
+async def run_level(base_url: str, concurrency: int, total: int, users: int) -> dict:
+    latencies, stages, errors = [], {}, 0
+    rng = random.Random(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            nonlocal errors
+            payload = {
+                "user_id": f"user{rng.randrange(users)}",
+                "message": f"你还记得我喜欢{rng.choice(TOPICS)}吗？",
+            }
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json=payload)
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    return
+                latencies.append((time.perf_counter() - start) * 1000)
+                for name, dur in parse_server_timing(response.headers.get("server-timing", "")).items():
+                    stages.setdefault(name, []).append(dur)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        duration = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2),
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {name: percentiles(values) for name, values in stages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store-sizes", default="0,1000")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--fake-port", type=int, default=9100)
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--fake-args", default="", help="透传给 fake_zhipu.py 的参数，例如 \"--ttft-ms 500\"")
+    parser.add_argument("--env", action="append", default=[], help="额外传给 API 进程的环境变量 KEY=VALUE")
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        "ZHIPU_API_KEY": "fake.secret",
+        "ZHIPU_BASE_URL": f"http://127.0.0.1:{args.fake_port}/",
+        "MEM0_TELEMETRY": "False",
+        "TIMING_HEADERS": "true",
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    fake = start_process(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "fake_zhipu.py"),
+         "--port", str(args.fake_port)] + args.fake_args.split(),
+        env, f"http://127.0.0.1:{args.fake_port}/docs"
+    )
+
+    report = {"config": vars(args), "results": []}
+    try:
+        for size in [int(x) for x in args.store_sizes.split(",")]:
+            workdir = tempfile.mkdtemp(prefix="loadtest-")
+            api_env = dict(env)
+            api_env.update({
+                "CHROMA_PATH": os.path.join(workdir, "chroma_db"),
+                "EMBEDDING_CACHE_DIR": os.path.join(workdir, "embedding_cache"),
+                "MEMORY_QUEUE_PATH": os.path.join(workdir, "memory_queue.db"),
+            })
+            if size > 0:
+                import chromadb
+                from chromadb.config import Settings
+                client = chromadb.PersistentClient(path=api_env["CHROMA_PATH"],
+                                                   settings=Settings(anonymized_telemetry=False))
+                seed_store(client, api_env.get("CHROMA_COLLECTION", "zhipu_conversations"),
+                           size, args.users, args.dims)
+
+            base_url = f"http://127.0.0.1:{args.api_port}"
+            api = start_process(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+                api_env, f"{base_url}/health"
+            )
+            try:
+                for level in [int(x) for x in args.concurrency.split(",")]:
+                    result = asyncio.run(run_level(base_url, level, args.requests, args.users))
+                    result["store_size"] = size
+                    report["results"].append(result)
+                    print(f"store={size} c={level} rps={result['throughput_rps']} "
+                          f"p50={result['latency_ms']['p50']} p99={result['latency_ms']['p99']}",
+                          file=sys.stderr)
+            finally:
+                api.terminate()
+                api.wait()
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""本地的 MCP 搜索假服务，用于压测时替代 SearXNG MCP
+
+提供与 searxng-mcp 同名的 search 工具，按固定延迟返回确定性的结果，
+结果里带上本进程累计的调用次数，便于统计实际打到上游的请求数。
+
+运行: python benchmarks/stub_mcp_server.py --latency-ms 300
+"""
+import argparse
+import asyncio
+import os
+
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("stub-search", log_level="WARNING")
+
+settings = {"latency_ms": 300.0, "calls": 0}
+
+
+@mcp.tool()
+async def search(query: str) -> str:
+    """搜索网页并返回结果摘要"""
+    settings["calls"] += 1
+    await asyncio.sleep(settings["latency_ms"] / 1000)
+    return f"[pid={os.getpid()} call={settings['calls']}] 关于「{query}」的搜索结果"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"])
+    args = parser.parse_args()
+    settings["latency_ms"] = args.latency_ms
+    mcp.run("stdio")
+
+
+if __name__ == "__main__":
+    main()
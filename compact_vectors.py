@@ -0,0 +1,169 @@
+"""紧凑向量存储：降维向量做首轮检索，全维 int8 向量重排
+
+embedding-3 每条记忆一个 1536 维 float32 向量，Chroma 在 SQLite 和 HNSW 索引中各存
+一份，向量库体积和索引加载时间随记忆数快速增长。紧凑模式下：
+
+- 向量库只保存前 COMPACT_DIMS 维并重新归一化（embedding-3 支持截断维度，前几维包含
+  大部分信息），HNSW 索引按降维后的向量构建
+- 全维向量按 int8 量化（每个向量一个缩放系数）存入单独的 SQLite 文件，体积约为 float32 的 1/4
+- 检索时先用降维向量取 limit × COMPACT_RERANK_FACTOR 个候选，再用全维向量重新打分排序
+
+重排后的分数与 Chroma 默认的 l2 距离一致（归一化向量的平方欧氏距离，越小越相似）。
+紧凑模式的向量维度与普通集合不同，启用时请使用新的 CHROMA_COLLECTION，已有记忆通过
+导出（含向量）/ 导入迁移，导入时只做降维和量化，不重新向量化。
+"""
+import sqlite3
+import threading
+
+import numpy as np
+
+import config
+
+
+def reduce(vectors, dims: int = None) -> np.ndarray:
+    """截取前 dims 维并归一化，vectors 为单个向量或向量列表"""
+    dims = dims or config.COMPACT_DIMS
+    array = np.asarray(vectors, dtype=np.float32)[..., :dims]
+    norms = np.linalg.norm(array, axis=-1, keepdims=True)
+    return array / np.maximum(norms, 1e-12)
+
+
+def quantize(vectors) -> tuple:
+    """按向量对称量化为 int8，返回 (scales, codes)"""
+    array = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    array = array / np.maximum(np.linalg.norm(array, axis=1, keepdims=True), 1e-12)
+    scales = np.maximum(np.abs(array).max(axis=1), 1e-12) / 127.0
+    codes = np.clip(np.rint(array / scales[:, None]), -127, 127).astype(np.int8)
+    return scales, codes
+
+
+class RerankStore:
+    """按记忆 ID 保存 int8 量化的全维向量（SQLite）"""
+
+    def __init__(self, path: str = None):
+        self.path = path or config.COMPACT_RERANK_PATH
+        # 每次检索都要读取，每个线程复用一个连接
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rerank_vectors (
+                id TEXT PRIMARY KEY,
+                scale REAL NOT NULL,
+                code BLOB NOT NULL
+            )
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, ids: list, vectors):
+        if not ids:
+            return
+        scales, codes = quantize(vectors)
+        self._conn().executemany(
+            "INSERT OR REPLACE INTO rerank_vectors (id, scale, code) VALUES (?, ?, ?)",
+            [(memory_id, float(scale), code.tobytes()) for memory_id, scale, code in zip(ids, scales, codes)]
+        )
+
+    def get(self, ids: list) -> dict:
+        """{id: 归一化的 float32 向量}，没有保存的 ID 不出现在结果中"""
+        if not ids:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT id, scale, code FROM rerank_vectors WHERE id IN ({','.join('?' * len(ids))})",
+            list(ids)
+        ).fetchall()
+        if not rows:
+            return {}
+        # 一次性反量化全部候选
+        codes = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.int8).reshape(len(rows), -1)
+        vectors = codes.astype(np.float32) * np.array([row[1] for row in rows], dtype=np.float32)[:, None]
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return {row[0]: vector for row, vector in zip(rows, vectors)}
+
+    def delete(self, ids: list):
+        if not ids:
+            return
+        self._conn().executemany("DELETE FROM rerank_vectors WHERE id = ?", [(memory_id,) for memory_id in ids])
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM rerank_vectors").fetchone()[0]
+
+
+def rerank(results: list, query, store: RerankStore, limit: int) -> list:
+    """用全维向量重新打分，results 为向量库返回的候选（带 id 和 score）"""
+    query = np.asarray(query, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    full = store.get([item.id for item in results])
+    for item in results:
+        vector = full.get(item.id)
+        if vector is not None:
+            # 归一化向量的平方欧氏距离 = 2 - 2cos；没有全维向量的候选保留首轮分数
+            item.score = float(2 - 2 * np.dot(query, vector))
+    results.sort(key=lambda item: item.score if item.score is not None else float("inf"))
+    return results[:limit]
+
+
+class CompactVectorStore:
+    """包装 mem0 的向量库：写入降维向量和重排向量，检索时取候选后重排
+
+    store 可以是 mem0 的 ChromaDB，也可以是分区模式的 PartitionedChromaDB。
+    """
+
+    def __init__(self, store, rerank_store: RerankStore, dims: int = None, factor: int = None):
+        self.store = store
+        self.rerank_store = rerank_store
+        self.dims = dims or config.COMPACT_DIMS
+        self.factor = factor or config.COMPACT_RERANK_FACTOR
+
+    def __getattr__(self, name):
+        # 其余接口（get、list、col_info 等）与向量无关，直接转发
+        return getattr(self.store, name)
+
+    def insert(self, vectors: list, payloads: list = None, ids: list = None):
+        self.store.insert(vectors=reduce(vectors, self.dims).tolist(), payloads=payloads, ids=ids)
+        self.rerank_store.put(ids, vectors)
+
+    def search(self, query: str, vectors: list, limit: int = 5, filters: dict = None) -> list:
+        candidates = self.store.search(
+            query=query,
+            vectors=reduce(vectors, self.dims).tolist(),
+            limit=limit * self.factor,
+            filters=filters
+        )
+        return rerank(candidates, vectors, self.rerank_store, limit)
+
+    def update(self, vector_id: str, vector: list = None, payload: dict = None):
+        self.store.update(
+            vector_id=vector_id,
+            vector=reduce(vector, self.dims).tolist() if vector is not None else None,
+            payload=payload
+        )
+        if vector is not None:
+            self.rerank_store.put([vector_id], [vector])
+
+    def delete(self, vector_id: str):
+        self.store.delete(vector_id=vector_id)
+        self.rerank_store.delete([vector_id])
+
+
+class CompactCollection:
+    """包装 Chroma 集合，供批量导入直接写入：upsert 时降维并保存重排向量"""
+
+    def __init__(self, collection, rerank_store: RerankStore, dims: int = None):
+        self.collection = collection
+        self.rerank_store = rerank_store
+        self.dims = dims or config.COMPACT_DIMS
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def upsert(self, ids: list, embeddings: list, metadatas: list = None):
+        self.collection.upsert(ids=ids, embeddings=reduce(embeddings, self.dims).tolist(), metadatas=metadatas)
+        self.rerank_store.put(ids, embeddings)
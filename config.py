@@ -4,6 +4,200 @@ from dotenv import load_dotenv
 load_dotenv()
 
 ZHIPU_API_KEY = os.getenv("ZHIPU_API_KEY")
+ZHIPU_BASE_URL = os.getenv("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/")
+# 每个进程到智谱聊天接口的 HTTP 连接池大小（同步调用共用一个，异步调用每个事件循环一个）
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
 
-if not ZHIPU_API_KEY:
-    raise ValueError("ZHIPU_API_KEY未设置")
+# Chroma 本地存储目录和集合名
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "zhipu_conversations")
+
+# 向量库部署方式：embedded 为进程内嵌 Chroma（只允许单进程），server 为连接 Chroma 服务（多 worker / 多节点）
+VECTOR_STORE_MODE = os.getenv("VECTOR_STORE_MODE", "embedded").lower()
+CHROMA_HOST = os.getenv("CHROMA_HOST", "127.0.0.1")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+CHROMA_SSL = os.getenv("CHROMA_SSL", "false").lower() == "true"
+CHROMA_AUTH_TOKEN = os.getenv("CHROMA_AUTH_TOKEN", "")
+CHROMA_HTTP_MAX_CONNECTIONS = int(os.getenv("CHROMA_HTTP_MAX_CONNECTIONS", "32"))
+CHROMA_HTTP_KEEPALIVE_SECS = float(os.getenv("CHROMA_HTTP_KEEPALIVE_SECS", "40"))
+
+# 记忆分区：none 为所有用户共用一个集合；user 为每个用户一个集合；hash 为按用户哈希分到固定数量的集合
+VECTOR_PARTITIONING = os.getenv("VECTOR_PARTITIONING", "none").lower()
+VECTOR_PARTITION_BUCKETS = int(os.getenv("VECTOR_PARTITION_BUCKETS", "64"))
+# 缓存的集合句柄数，以及记录所在分区的最近记忆 ID 数
+PARTITION_HANDLE_CACHE_SIZE = int(os.getenv("PARTITION_HANDLE_CACHE_SIZE", "1024"))
+PARTITION_ID_CACHE_SIZE = int(os.getenv("PARTITION_ID_CACHE_SIZE", "100000"))
+
+# 紧凑向量存储（默认关闭）：向量库只保存前 COMPACT_DIMS 维做首轮检索，全维向量按 int8 量化另存，
+# 检索时取 limit × COMPACT_RERANK_FACTOR 个候选用全维向量重排。启用时请使用新的 CHROMA_COLLECTION
+COMPACT_VECTORS_ENABLED = os.getenv("COMPACT_VECTORS_ENABLED", "false").lower() == "true"
+COMPACT_DIMS = int(os.getenv("COMPACT_DIMS", "256"))
+COMPACT_RERANK_FACTOR = int(os.getenv("COMPACT_RERANK_FACTOR", "8"))
+COMPACT_RERANK_PATH = os.getenv("COMPACT_RERANK_PATH", "./rerank_vectors.db")
+
+# 向量化后端：remote 使用智谱 embedding-3，onnx 使用本地 ONNX 模型
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "remote")
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR", "./models/bge-small-zh-v1.5")
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "4"))
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv("LOCAL_EMBEDDING_MAX_LENGTH", "512"))
+
+# 远程 embedding 接口单次请求的最大文本数
+REMOTE_EMBEDDING_BATCH_SIZE = int(os.getenv("REMOTE_EMBEDDING_BATCH_SIZE", "64"))
+
+# 记忆读写线程池大小，异步接口通过它执行阻塞的 mem0 调用
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "8"))
+
+# 记忆后写队列：聊天轮次先写入本地日志，由后台线程批量写入 mem0
+MEMORY_QUEUE_PATH = os.getenv("MEMORY_QUEUE_PATH", "./memory_queue.db")
+MEMORY_QUEUE_WORKERS = int(os.getenv("MEMORY_QUEUE_WORKERS", "2"))
+MEMORY_QUEUE_BATCH_SIZE = int(os.getenv("MEMORY_QUEUE_BATCH_SIZE", "32"))
+MEMORY_QUEUE_MAX_RETRIES = int(os.getenv("MEMORY_QUEUE_MAX_RETRIES", "5"))
+# 领取记录的租约（秒），处理期间每隔三分之一租约续租一次；进程崩溃后租约过期的记录由其他 worker 接管
+MEMORY_QUEUE_LEASE_SECONDS = float(os.getenv("MEMORY_QUEUE_LEASE_SECONDS", "600"))
+
+# 查询向量缓存：进程内 LRU + 磁盘内存映射数组
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache")
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "2048"))
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "20000"))
+
+# 检索结果缓存条目数（按用户版本号失效）
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+# 检索结果缓存有效期（秒，0 表示不过期）。多进程部署时其他进程的写入不会使本进程的缓存失效，需要靠过期兜底
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "30" if VECTOR_STORE_MODE == "server" else "0"))
+
+# 在 /chat 响应中返回 Server-Timing 头（各阶段耗时）
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "false").lower() == "true"
+
+# 提示词组装：记忆和最近对话共享的 token 预算
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_ITEM_MAX_TOKENS = int(os.getenv("CONTEXT_ITEM_MAX_TOKENS", "300"))
+CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", "10"))
+# 用于计数的 tokenizer.json，未设置时按字符估算
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", "")
+
+# 网络搜索：共享的 SearXNG MCP 服务进程池和结果缓存
+SEARXNG_MCP_DIR = os.getenv("SEARXNG_MCP_DIR", "/Users/mac/code/python/searxng-mcp")
+SEARXNG_BASE_URL = os.getenv("SEARXNG_BASE_URL", "http://127.0.0.1:8888")
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_MAX_CONCURRENCY = int(os.getenv("MCP_MAX_CONCURRENCY", "8"))
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "30"))
+MCP_HEALTH_INTERVAL = float(os.getenv("MCP_HEALTH_INTERVAL", "30"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+
+# 语义响应缓存（默认关闭）：相同上下文下相似的问题直接返回之前的回答
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+# user：按用户隔离；global：所有用户共享（上下文指纹仍然必须相同）
+RESPONSE_CACHE_SCOPE = os.getenv("RESPONSE_CACHE_SCOPE", "user")
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+
+# 批量对话接口：单次请求的最大条数和默认并发数
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# 上游准入控制：每个上游一个令牌桶（每秒请求数、突发量）和并发上限，超出的请求排队等待
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+ADMISSION_MAX_QUEUE_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "20"))
+# 排队等待的最长时间（秒），超过后返回 503
+ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "10"))
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "10"))
+LLM_BURST = int(os.getenv("LLM_BURST", "20"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+EMBEDDING_RATE_LIMIT = float(os.getenv("EMBEDDING_RATE_LIMIT", "20"))
+EMBEDDING_BURST = int(os.getenv("EMBEDDING_BURST", "40"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "16"))
+# mem0 写入（每次写入包含事实提取和记忆更新两次 LLM 调用，按 1 次计）
+MEM0_RATE_LIMIT = float(os.getenv("MEM0_RATE_LIMIT", "2"))
+MEM0_BURST = int(os.getenv("MEM0_BURST", "4"))
+MEM0_MAX_CONCURRENCY = int(os.getenv("MEM0_MAX_CONCURRENCY", "4"))
+
+# 超时与重试：单次尝试的超时（秒），失败后指数退避重试
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# 流式输出：等待第一个分片和相邻分片之间的超时
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "20"))
+LLM_IDLE_TIMEOUT = float(os.getenv("LLM_IDLE_TIMEOUT", "30"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "10"))
+MEM0_LLM_TIMEOUT = float(os.getenv("MEM0_LLM_TIMEOUT", "60"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2"))
+# 重试预算：最近 10 秒内的重试（含对冲）数不超过请求数 × RATIO + 每秒保底数 × 10
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("RETRY_BUDGET_MIN_PER_SECOND", "1"))
+# 对冲请求：幂等调用超过最近延迟的该分位数后再发一份
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "16"))
+# 记忆检索的截止时间（秒），超过后不带记忆继续对话
+CONTEXT_DEADLINE = float(os.getenv("CONTEXT_DEADLINE", "3"))
+
+# 记忆导出每次从向量库读取的条数；导入每批写入的条数和并行的工作线程数（按用户分配）
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "256"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+
+# 关键词检索（默认关闭）：本地按用户的倒排索引（BM25），与向量检索融合；启用前的记忆用 scripts/build_keyword_index.py 建索引
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX_ENABLED", "false").lower() == "true"
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", "./keyword_index.db")
+# bigram：中文按相邻二字切分（无额外依赖）；jieba：需要安装 jieba。修改后请重建索引
+KEYWORD_TOKENIZER = os.getenv("KEYWORD_TOKENIZER", "bigram").lower()
+# 检索模式：vector / hybrid（关键词和向量分数加权融合）/ keyword；未启用关键词索引时总是 vector
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+# 融合时关键词分数的权重（0~1），向量分数的权重为 1 - HYBRID_KEYWORD_WEIGHT
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "0.5"))
+# 混合检索时每一路取 limit × 倍数个候选
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "3"))
+# 关键词快速路径：最相关的关键词命中覆盖了查询中至少这一比例的信息量（按 IDF 加权）时直接返回，不做向量化
+KEYWORD_FAST_PATH = os.getenv("KEYWORD_FAST_PATH", "true").lower() == "true"
+KEYWORD_FAST_PATH_COVERAGE = float(os.getenv("KEYWORD_FAST_PATH_COVERAGE", "0.8"))
+
+# 记忆写入预筛选（默认关闭）：在本地判断每条消息做 LLM 事实提取（extract）、原文保存（raw，只向量化）还是丢弃（drop）
+MEMORY_FILTER_ENABLED = os.getenv("MEMORY_FILTER_ENABLED", "false").lower() == "true"
+# 按角色的策略：auto / extract / raw / drop，auto 按规则（或本地分类器）判断；未列出的角色按 extract 处理
+MEMORY_FILTER_POLICIES = os.getenv("MEMORY_FILTER_POLICIES", "user:auto,assistant:drop")
+# auto 判断为不含用户信息（但不是寒暄）时的处理方式
+MEMORY_FILTER_FALLBACK = os.getenv("MEMORY_FILTER_FALLBACK", "raw").lower()
+# 去掉标点和空白后少于 MIN_CHARS 个字符的消息丢弃；超过 MAX_CHARS 或含代码块的消息不做提取
+MEMORY_FILTER_MIN_CHARS = int(os.getenv("MEMORY_FILTER_MIN_CHARS", "4"))
+MEMORY_FILTER_MAX_CHARS = int(os.getenv("MEMORY_FILTER_MAX_CHARS", "2000"))
+# 本地分类器（scripts/eval_memory_filter.py --train 生成），为空时只用规则
+MEMORY_FILTER_MODEL_PATH = os.getenv("MEMORY_FILTER_MODEL_PATH", "")
+MEMORY_FILTER_THRESHOLD = float(os.getenv("MEMORY_FILTER_THRESHOLD", "0.5"))
+# 不为空时把每条消息和判断结果追加到该 NDJSON 文件，供离线评估（包含对话原文，注意保护隐私）
+MEMORY_FILTER_RECORD_PATH = os.getenv("MEMORY_FILTER_RECORD_PATH", "")
+
+# 后台记忆整理（默认关闭）：每隔 CONSOLIDATION_INTERVAL 秒处理有新写入的用户，按向量相似度合并近似重复的记忆
+CONSOLIDATION_ENABLED = os.getenv("CONSOLIDATION_ENABLED", "false").lower() == "true"
+CONSOLIDATION_INTERVAL = float(os.getenv("CONSOLIDATION_INTERVAL", "600"))
+CONSOLIDATION_STATE_PATH = os.getenv("CONSOLIDATION_STATE_PATH", "./consolidation.db")
+# 余弦相似度不低于 SIMILARITY 的记忆归为一簇交给 LLM 合并；不低于 DUPLICATE_SIMILARITY 的直接去重，不调用 LLM
+CONSOLIDATION_SIMILARITY = float(os.getenv("CONSOLIDATION_SIMILARITY", "0.85"))
+CONSOLIDATION_DUPLICATE_SIMILARITY = float(os.getenv("CONSOLIDATION_DUPLICATE_SIMILARITY", "0.97"))
+CONSOLIDATION_MAX_CLUSTER = int(os.getenv("CONSOLIDATION_MAX_CLUSTER", "10"))
+# 每次 LLM 调用合并的簇数
+CONSOLIDATION_LLM_BATCH = int(os.getenv("CONSOLIDATION_LLM_BATCH", "10"))
+# 每个用户的记忆条数上限（0 表示不限制），超出时按 lru / age / score 淘汰
+CONSOLIDATION_MAX_MEMORIES = int(os.getenv("CONSOLIDATION_MAX_MEMORIES", "0"))
+CONSOLIDATION_EVICTION = os.getenv("CONSOLIDATION_EVICTION", "lru").lower()
+
+# 启动预热：进程启动后在后台打开向量库、建立连接并做一次向量化，完成前 /readyz 返回 503
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+# 预热时是否做一次真实的向量化（远程 embedding 会产生一次调用）
+WARMUP_EMBEDDING = os.getenv("WARMUP_EMBEDDING", "true").lower() == "true"
+# 预热失败后的重试间隔（秒）
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+
+
+def validate():
+    """检查必需的配置，缺失时抛出 ValueError
+
+    导入 config 不做检查，进程可以先启动、在 /readyz 中报告配置错误；创建上游客户端前调用。
+    """
+    if not ZHIPU_API_KEY:
+        raise ValueError("ZHIPU_API_KEY未设置")
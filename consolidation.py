@@ -0,0 +1,386 @@
+"""后台记忆整理：合并近似重复的记忆，限制每个用户的记忆条数
+
+每个用户的记忆随对话持续增长，同一件事会被反复记录。整理任务定期处理有新写入的用户：
+
+1. 只看上次整理之后新增或修改过的记忆（按 updated_at / created_at 与该用户的水位比较），
+   把它们与该用户的全部记忆按向量余弦相似度聚类（并查集）
+2. 簇内与更新的记忆几乎相同（相似度 ≥ CONSOLIDATION_DUPLICATE_SIMILARITY 或文本哈希相同）的
+   直接删除，只保留最新的一条；去重后仍有多条的簇批量交给 LLM 合并，每次调用处理
+   CONSOLIDATION_LLM_BATCH 个簇，合并结果写入后删除原记忆
+3. 条数超过 CONSOLIDATION_MAX_MEMORIES 时按 CONSOLIDATION_EVICTION 淘汰：
+   lru（最久未被检索）、age（最早写入）、score（被检索次数最少）
+
+检索记录由 MemoryManager 在内存中累计（UsageTracker），整理时写入 SQLite 状态文件，
+水位也保存在同一文件中。删除会写入 mem0 的历史记录。
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+
+import admission
+import config
+import metrics
+import resilience
+from embedding_cache import CachedEmbedder, embed_many
+from partitioning import partition_scope
+
+CONSOLIDATE_PROMPT = """你负责整理用户的长期记忆。下面 JSON 中 groups 的每一组都是关于同一件事的相似记忆（按时间从旧到新排列）。
+请把每一组合并成一条简洁、完整的记忆，保留所有不重复的信息；组内信息冲突时以较新的为准。
+只输出 JSON：{"merged": ["第 1 组的合并结果", "第 2 组的合并结果", ...]}，条数和顺序与输入的组一致。"""
+
+
+class UsageTracker:
+    """在内存中累计记忆的写入和检索，由整理任务定期取走"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._written = set()
+        self._retrievals = {}
+
+    def record_write(self, user_id: str):
+        with self._lock:
+            self._written.add(user_id)
+
+    def record_retrieval(self, user_id: str, memory_ids: list):
+        now = time.time()
+        with self._lock:
+            for memory_id in memory_ids:
+                _, _, hits = self._retrievals.get(memory_id, (user_id, now, 0))
+                self._retrievals[memory_id] = (user_id, now, hits + 1)
+
+    def drain(self) -> tuple:
+        """取走累计的 (写入过的用户, {memory_id: (user_id, 最近检索时间, 次数)})"""
+        with self._lock:
+            written, self._written = self._written, set()
+            retrievals, self._retrievals = self._retrievals, {}
+        return written, retrievals
+
+
+def _changed_at(payload: dict) -> str:
+    return payload.get("updated_at") or payload.get("created_at") or ""
+
+
+def _same_hash(a: dict, b: dict) -> bool:
+    """两条记录都有 hash 且相同；导入或旧版本的记录可能没有 hash"""
+    return bool(a.get("hash")) and a.get("hash") == b.get("hash")
+
+
+def _clusters(vectors: np.ndarray, new: list, threshold: float, max_size: int) -> list:
+    """把新记忆与全部记忆按相似度聚类，返回至少两条的簇（下标列表）"""
+    parent = list(range(len(vectors)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    similarities = vectors[new] @ vectors.T
+    for row, i in enumerate(new):
+        for j in np.nonzero(similarities[row] >= threshold)[0]:
+            if j != i:
+                parent[find(int(j))] = find(i)
+
+    groups = {}
+    for i in range(len(vectors)):
+        groups.setdefault(find(i), []).append(i)
+    # 链式相似可能连成很大的簇，只合并其中最新的 max_size 条，其余留到下次
+    return [members[-max_size:] for members in groups.values() if len(members) > 1]
+
+
+class MemoryConsolidator:
+    """按用户整理记忆，可以在后台线程中定期运行"""
+
+    def __init__(self, memory_manager, path: str = None, interval: float = None):
+        self.memory_manager = memory_manager
+        self.path = path or config.CONSOLIDATION_STATE_PATH
+        self.interval = interval or config.CONSOLIDATION_INTERVAL
+        self.similarity = config.CONSOLIDATION_SIMILARITY
+        self.duplicate_similarity = config.CONSOLIDATION_DUPLICATE_SIMILARITY
+        self.max_memories = config.CONSOLIDATION_MAX_MEMORIES
+        self.eviction = config.CONSOLIDATION_EVICTION
+        self.llm_batch = config.CONSOLIDATION_LLM_BATCH
+        self.max_cluster = config.CONSOLIDATION_MAX_CLUSTER
+        if self.eviction not in ("lru", "age", "score"):
+            raise ValueError(f"未知的 CONSOLIDATION_EVICTION: {self.eviction}")
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._pending = set()
+        self._init_state()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_state(self):
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS consolidation_state (
+                    user_id TEXT PRIMARY KEY,
+                    watermark TEXT NOT NULL,
+                    last_run_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS memory_usage (
+                    memory_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    last_retrieved_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_user ON memory_usage (user_id)")
+
+    def flush_usage(self) -> set:
+        """把内存中累计的检索记录写入状态文件，返回有新写入的用户"""
+        written, retrievals = self.memory_manager.usage.drain()
+        if retrievals:
+            with closing(self._connect()) as conn:
+                conn.executemany("""
+                    INSERT INTO memory_usage (memory_id, user_id, last_retrieved_at, hits) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(memory_id) DO UPDATE SET
+                        last_retrieved_at = MAX(last_retrieved_at, excluded.last_retrieved_at),
+                        hits = hits + excluded.hits
+                """, [(memory_id, *row) for memory_id, row in retrievals.items()])
+        self._pending |= written
+        return written
+
+    def _watermark(self, conn, user_id: str) -> str:
+        row = conn.execute("SELECT watermark FROM consolidation_state WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else ""
+
+    def _merge(self, user_id: str, groups: list) -> list:
+        """一次 LLM 调用合并多个簇，返回与 groups 一一对应的文本；格式不对时抛出 ValueError"""
+        payload = {"groups": [[{"text": text, "time": when} for text, when in group] for group in groups]}
+        messages = [
+            {"role": "system", "content": CONSOLIDATE_PROMPT},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+        ]
+        llm = self.memory_manager.memory.llm
+        with admission.user_scope(user_id), admission.get_limiter("mem0").slot(user_id), \
+                metrics.upstream_call("mem0", "memory_consolidate"):
+            response = resilience.retry("mem0", lambda: llm.generate_response(
+                messages=messages,
+                response_format={"type": "json_object"}
+            ))
+        # 去掉可能的 ```json 代码块
+        text = re.sub(r"^```(?:json)?\s*|\s*```$", "", response.strip())
+        merged = json.loads(text).get("merged")
+        if not isinstance(merged, list) or len(merged) != len(groups) or \
+                not all(isinstance(item, str) and item.strip() for item in merged):
+            raise ValueError("LLM 返回的合并结果与输入的组数不一致")
+        return [item.strip() for item in merged]
+
+    def _embedder(self):
+        embedder = self.memory_manager.memory.embedding_model
+        # 合并后的记忆文本不会作为查询出现，不写入查询向量缓存
+        return embedder.embedder if isinstance(embedder, CachedEmbedder) else embedder
+
+    def _insert_merged(self, user_id: str, texts: list, sources: list) -> list:
+        """写入合并后的记忆，sources 为每条合并结果对应的原记录元数据列表"""
+        vectors = embed_many(self._embedder(), texts)
+        ids, payloads = [], []
+        for text, originals in zip(texts, sources):
+            roles = {payload.get("role") for payload in originals}
+            role = roles.pop() if len(roles) == 1 else None
+            ids.append(str(uuid.uuid4()))
+            payloads.append({
+                "data": text,
+                "hash": hashlib.md5(text.encode()).hexdigest(),
+                # 沿用原记忆中最新的创建时间（不超过本次水位），不会被下一次整理当作新记忆
+                "created_at": max(payload.get("created_at", "") for payload in originals),
+                "user_id": user_id,
+                "role": role or "conversation",
+                "consolidated_from": len(originals),
+            })
+        with partition_scope(user_id):
+            self.memory_manager.memory.vector_store.insert(vectors=vectors, payloads=payloads, ids=ids)
+        for memory_id, payload in zip(ids, payloads):
+            self.memory_manager.memory.db.add_history(memory_id, None, payload["data"], "ADD", role=payload["role"])
+        return ids
+
+    def _victims(self, conn, user_id: str, ids: list, payloads: list, count: int) -> list:
+        """按淘汰策略选出 count 条要删除的记忆"""
+        usage = {
+            row[0]: (row[1], row[2]) for row in conn.execute(
+                "SELECT memory_id, last_retrieved_at, hits FROM memory_usage WHERE user_id = ?", (user_id,)
+            )
+        }
+
+        def created(payload):
+            try:
+                return datetime.fromisoformat(payload.get("created_at", "")).timestamp()
+            except ValueError:
+                return 0.0
+
+        def lru(i):
+            # 从未被检索过的记忆按写入时间计算，刚写入的记忆不会马上被淘汰
+            return max(usage.get(ids[i], (0.0, 0))[0], created(payloads[i]))
+
+        def age(i):
+            return payloads[i].get("created_at", "")
+
+        def score(i):
+            return usage.get(ids[i], (0.0, 0))[1], payloads[i].get("created_at", "")
+
+        key = {"lru": lru, "age": age, "score": score}[self.eviction]
+        return [ids[i] for i in sorted(range(len(ids)), key=key)[:count]]
+
+    def consolidate_user(self, user_id: str) -> dict:
+        """整理一个用户的记忆，返回统计信息"""
+        stats = {"before": 0, "after": 0, "duplicates": 0, "merged_groups": 0, "merged": 0, "created": 0,
+                 "evicted": 0, "llm_calls": 0, "failed_batches": 0}
+        collection = self.memory_manager.partitions.collection_for(user_id, create=False)
+        if collection is None:
+            return stats
+        where = {"user_id": user_id}
+        with closing(self._connect()) as conn:
+            watermark = self._watermark(conn, user_id)
+            snapshot = collection.get(where=where, include=["metadatas"])
+            ids, payloads = snapshot["ids"], snapshot["metadatas"]
+            stats["before"] = stats["after"] = len(ids)
+            new = [i for i, payload in enumerate(payloads) if _changed_at(payload) > watermark]
+            over_cap = self.max_memories and len(ids) > self.max_memories
+            if not new and not over_cap:
+                return stats
+            # LLM 合并失败的簇中的新记忆下次还要处理，水位不越过其中最早的一条
+            failed = []
+
+            removed = set()
+            if new and len(ids) > 1:
+                # 重新读取一次，ID、记录和向量来自同一次读取，按下标一一对应；
+                # 两次读取之间被删除或新写入的记忆不会让向量错位
+                snapshot = collection.get(where=where, include=["metadatas", "embeddings"])
+                ids, payloads = snapshot["ids"], snapshot["metadatas"]
+                stats["before"] = stats["after"] = len(ids)
+                new = [i for i, payload in enumerate(payloads) if _changed_at(payload) > watermark]
+                vectors = np.asarray(snapshot["embeddings"], dtype=np.float32).reshape(len(ids), -1)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                to_merge = []
+                for members in _clusters(vectors, new, self.similarity, self.max_cluster):
+                    # 从新到旧检查，与已保留的记忆文本相同或几乎相同的直接删除，不交给 LLM
+                    members.sort(key=lambda i: payloads[i].get("created_at", ""), reverse=True)
+                    kept, duplicates = [], []
+                    for i in members:
+                        if any(_same_hash(payloads[i], payloads[j]) or
+                               float(vectors[i] @ vectors[j]) >= self.duplicate_similarity for j in kept):
+                            duplicates.append(ids[i])
+                        else:
+                            kept.append(i)
+                    if duplicates:
+                        stats["duplicates"] += self.memory_manager.delete_memories(user_id, duplicates)
+                        removed.update(duplicates)
+                        metrics.MEMORY_CONSOLIDATION.inc(len(duplicates), action="duplicate")
+                    if len(kept) > 1:
+                        # 交给 LLM 时按时间从旧到新
+                        to_merge.append(kept[::-1])
+
+                for start in range(0, len(to_merge), self.llm_batch):
+                    batch = to_merge[start:start + self.llm_batch]
+                    groups = [[(payloads[i].get("data", ""), payloads[i].get("created_at", "")) for i in members]
+                              for members in batch]
+                    stats["llm_calls"] += 1
+                    try:
+                        texts = self._merge(user_id, groups)
+                    except Exception as e:
+                        print(f"合并记忆失败（{user_id}），本批保持不变: {e}")
+                        stats["failed_batches"] += 1
+                        failed.extend(_changed_at(payloads[i]) for members in batch for i in members)
+                        continue
+                    # 读取之后被 mem0 更新过的记忆不参与合并，避免覆盖新写入的内容
+                    current = collection.get(ids=[ids[i] for members in batch for i in members], include=["metadatas"])
+                    current = dict(zip(current["ids"], current["metadatas"]))
+                    keep = [k for k, members in enumerate(batch)
+                            if all(current.get(ids[i]) == payloads[i] for i in members)]
+                    if not keep:
+                        continue
+                    self._insert_merged(user_id, [texts[k] for k in keep],
+                                        [[payloads[i] for i in batch[k]] for k in keep])
+                    originals = [ids[i] for k in keep for i in batch[k]]
+                    self.memory_manager.delete_memories(user_id, originals)
+                    removed.update(originals)
+                    stats["merged_groups"] += len(keep)
+                    stats["merged"] += len(originals)
+                    stats["created"] += len(keep)
+                    metrics.MEMORY_CONSOLIDATION.inc(len(originals) - len(keep), action="merge")
+
+            if self.max_memories:
+                current = collection.get(where=where, include=["metadatas"])
+                excess = len(current["ids"]) - self.max_memories
+                if excess > 0:
+                    victims = self._victims(conn, user_id, current["ids"], current["metadatas"], excess)
+                    stats["evicted"] = self.memory_manager.delete_memories(user_id, victims)
+                    removed.update(victims)
+                    metrics.MEMORY_CONSOLIDATION.inc(stats["evicted"], action="evict")
+
+            limit = min((changed for changed in failed if changed > watermark), default=None)
+            next_watermark = max([watermark] + [_changed_at(payloads[i]) for i in new
+                                                if limit is None or _changed_at(payloads[i]) < limit])
+            if removed:
+                conn.executemany("DELETE FROM memory_usage WHERE memory_id = ?", [(i,) for i in removed])
+            conn.execute(
+                "INSERT OR REPLACE INTO consolidation_state (user_id, watermark, last_run_at) VALUES (?, ?, ?)",
+                (user_id, next_watermark, time.time())
+            )
+        stats["after"] = stats["before"] - stats["duplicates"] - stats["merged"] + stats["created"] - stats["evicted"]
+        return stats
+
+    def run_once(self, users=None) -> dict:
+        """整理指定用户；users 为 None 时整理上次运行后有新写入的用户。返回汇总统计"""
+        self.flush_usage()
+        if users is None:
+            users, self._pending = self._pending, set()
+        start = time.perf_counter()
+        report = {"users": 0, "before": 0, "after": 0, "duplicates": 0, "merged_groups": 0, "merged": 0,
+                  "created": 0, "evicted": 0, "llm_calls": 0, "failed_batches": 0, "failed_users": 0}
+        for user_id in sorted(users):
+            try:
+                stats = self.consolidate_user(user_id)
+            except Exception as e:
+                print(f"整理记忆失败（{user_id}）: {e}")
+                report["failed_users"] += 1
+                continue
+            report["users"] += 1
+            for key, value in stats.items():
+                report[key] += value
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        report["shrink_ratio"] = round(1 - report["after"] / report["before"], 4) if report["before"] else 0.0
+        if report["after"] != report["before"]:
+            print(f"记忆整理：{report['users']} 个用户，{report['before']} -> {report['after']} 条"
+                  f"（减少 {report['shrink_ratio']:.1%}），LLM 调用 {report['llm_calls']} 次")
+        return report
+
+    def start(self):
+        """启动后台整理线程，每隔 interval 秒整理一次有新写入的用户"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"记忆整理失败: {e}")
+
+        self._thread = threading.Thread(target=run, name="memory-consolidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # 保留尚未写入的检索记录
+        self.flush_usage()
@@ -0,0 +1,150 @@
+"""按 token 预算组装记忆和最近对话
+
+main.py 和 app.py 共用。记忆按检索分数、对话按新近程度估值，在预算内贪心装入，
+放不下的条目截断或丢弃；与最近对话重复的记忆直接去掉。对话只保留从最新一条往前连续的
+一段，某条放不下时更早的对话全部丢弃，不会出现中间缺了几轮的对话。
+"""
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import config
+
+_CJK_RANGES = "\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef"
+_CJK = re.compile(f"[{_CJK_RANGES}]")
+_WORD = re.compile(f"[A-Za-z0-9_]+|[^\\sA-Za-z0-9_{_CJK_RANGES}]")
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """加载 TOKENIZER_PATH 指定的 tokenizer.json；未配置时返回 None，使用估算"""
+    if not config.TOKENIZER_PATH:
+        return None
+    from tokenizers import Tokenizer
+    return Tokenizer.from_file(config.TOKENIZER_PATH)
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    # 估算：每个中日韩字符约 1 个 token，英文单词约 1.3 个 token
+    cjk = len(_CJK.findall(text))
+    words = len(_WORD.findall(text))
+    return cjk + int(words * 1.3 + 0.5)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按 token 数截断，末尾加省略号"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) + 1 <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…"
+
+
+def _bigrams(text: str) -> set:
+    text = re.sub(r"\s+", "", text.lower())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def _is_duplicate(memory: str, history_texts: list, threshold: float = 0.8) -> bool:
+    """记忆内容已经出现在最近对话中（包含或字符二元组高度重合）"""
+    grams = _bigrams(memory)
+    for text in history_texts:
+        if memory.strip() and memory.strip() in text:
+            return True
+        other = _bigrams(text)
+        if len(grams & other) / max(1, len(grams)) >= threshold:
+            return True
+    return False
+
+
+def _relevance(mem: dict, rank: int) -> float:
+    """检索结果的相关度（0~1，越大越相关）
+
+    混合 / 关键词检索的结果带 match 字段，score 已是 0~1 的相关度；只走向量检索时 score 是
+    Chroma 的 L2 距离（单位向量上为 2 - 2·余弦相似度），换算回余弦相似度。没有分数时按排名估值。
+    """
+    score = mem.get("score")
+    if score is None:
+        return 1.0 / (1 + rank)
+    if "match" in mem:
+        return min(max(float(score), 0.0), 1.0)
+    return min(max(1.0 - float(score) / 2, 0.0), 1.0)
+
+
+@dataclass
+class AssembledContext:
+    memories: list = field(default_factory=list)
+    history: list = field(default_factory=list)
+    tokens_used: int = 0
+    tokens_saved: int = 0
+    dropped: int = 0
+    truncated: int = 0
+    deduped: int = 0
+
+
+def assemble_context(memories: list, history: list = None, budget: int = None,
+                     max_item_tokens: int = None) -> AssembledContext:
+    """在 token 预算内挑选记忆和最近对话
+
+    memories: mem0 检索结果（已按相关度排序），取其中的 "memory" 字段，按 "score" 估值
+    history:  最近的对话消息 [{"role", "content"}]，按时间顺序
+    返回的 memories 为文本列表（保持检索顺序），history 为消息列表（保持时间顺序）。
+    """
+    budget = budget if budget is not None else config.CONTEXT_TOKEN_BUDGET
+    max_item_tokens = max_item_tokens or config.CONTEXT_ITEM_MAX_TOKENS
+    history = history or []
+    result = AssembledContext()
+
+    history_texts = [m["content"] for m in history]
+    baseline = sum(count_tokens(t) for t in history_texts)
+
+    candidates = []
+    for rank, mem in enumerate(memories):
+        text = mem.get("memory") or ""
+        baseline += count_tokens(text)
+        if not text or _is_duplicate(text, history_texts):
+            result.deduped += 1
+            continue
+        candidates.append((_relevance(mem, rank), "memory", rank, text))
+    for age, msg in enumerate(reversed(history)):
+        # 最近一轮对话价值最高，之后按新近程度递减
+        candidates.append((1.5 / (1 + age), "history", len(history) - 1 - age, msg["content"]))
+
+    chosen = {"memory": {}, "history": {}}
+    remaining = budget
+    history_closed = False
+    # 对话的估值随新旧单调递减，排序后按从新到旧的顺序出现
+    for _, kind, index, text in sorted(candidates, key=lambda c: c[0], reverse=True):
+        if kind == "history" and history_closed:
+            result.dropped += 1
+            continue
+        limit = min(remaining, max_item_tokens)
+        tokens = count_tokens(text)
+        if tokens > limit:
+            if limit < 16:
+                result.dropped += 1
+                if kind == "history":
+                    history_closed = True
+                continue
+            text = truncate_to_tokens(text, limit)
+            tokens = count_tokens(text)
+            result.truncated += 1
+        chosen[kind][index] = text
+        remaining -= tokens
+
+    result.memories = [chosen["memory"][i] for i in sorted(chosen["memory"])]
+    result.history = [
+        {"role": history[i]["role"], "content": chosen["history"][i]} for i in sorted(chosen["history"])
+    ]
+    result.tokens_used = budget - remaining
+    result.tokens_saved = max(0, baseline - result.tokens_used)
+    return result
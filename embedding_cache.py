@@ -0,0 +1,240 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+import metrics
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本：NFKC、折叠空白，保证等价的问法命中同一个缓存键"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def embed_many(embedder, texts: list) -> list:
+    """一次调用获取多条文本的向量
+
+    本地模型直接用 embed_batch；mem0 的 OpenAI 兼容 embedder 只有单条接口，
+    这里把文本按 REMOTE_EMBEDDING_BATCH_SIZE 分组放进同一个请求。
+    """
+    if hasattr(embedder, "embed_batch"):
+        return embedder.embed_batch(texts)
+    client = getattr(embedder, "client", None)
+    if client is None or not hasattr(client, "embeddings"):
+        return [embedder.embed(text, "search") for text in texts]
+
+    vectors = []
+    size = config.REMOTE_EMBEDDING_BATCH_SIZE
+    for start in range(0, len(texts), size):
+        response = client.embeddings.create(
+            input=[text.replace("\n", " ") for text in texts[start:start + size]],
+            model=embedder.config.model,
+            dimensions=embedder.config.embedding_dims
+        )
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return vectors
+
+
+class EmbeddingCache:
+    """两级向量缓存：进程内 LRU + 磁盘上的内存映射 float32 数组
+
+    磁盘层由 vectors.f32（固定容量的槽位数组）和 index.db（键到槽位的索引）组成，
+    槽位用满后按最近使用时间淘汰。
+    """
+
+    def __init__(self, directory: str = None, memory_size: int = None, disk_size: int = None):
+        self.directory = directory or config.EMBEDDING_CACHE_DIR
+        self.memory_size = memory_size or config.EMBEDDING_CACHE_MEMORY_SIZE
+        self.disk_size = disk_size or config.EMBEDDING_CACHE_DISK_SIZE
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._vectors = None
+        self._dims = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(
+            os.path.join(self.directory, "index.db"),
+            check_same_thread=False,
+            isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._open_vectors()
+
+    def _open_vectors(self, dims: int = None):
+        """打开磁盘层；dims 为 None 时只打开已经确定维度的磁盘层
+
+        多个 worker 进程共享磁盘层：维度的确定、vectors.f32 的新建或重建都在同一个写事务里完成，
+        拿到锁后重新读取维度，后来的进程沿用先到者的维度并以 r+ 打开，不会截断已写入的文件。
+        """
+        path = os.path.join(self.directory, "vectors.f32")
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'dims'").fetchone()
+            if row:
+                dims = int(row[0])
+            elif dims is None:
+                self._db.execute("COMMIT")
+                return
+            else:
+                self._db.execute("INSERT INTO meta (name, value) VALUES ('dims', ?)", (str(dims),))
+            mode = "r+"
+            if not os.path.exists(path) or os.path.getsize(path) != self.disk_size * dims * 4:
+                # 新建，或容量变化时重建磁盘层
+                self._db.execute("DELETE FROM entries")
+                mode = "w+"
+            self._vectors = np.memmap(path, dtype=np.float32, mode=mode, shape=(self.disk_size, dims))
+            self._dims = dims
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str):
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits_memory += 1
+                metrics.CACHE_REQUESTS.inc(cache="embedding", result="memory_hit")
+                return vector
+
+            if self._vectors is not None:
+                row = self._db.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                if row:
+                    vector = self._vectors[row[0]].tolist()
+                    self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+                    self._remember(key, vector)
+                    self.hits_disk += 1
+                    metrics.CACHE_REQUESTS.inc(cache="embedding", result="disk_hit")
+                    return vector
+
+            self.misses += 1
+            metrics.CACHE_REQUESTS.inc(cache="embedding", result="miss")
+            return None
+
+    def put(self, key: str, vector):
+        with self._lock:
+            self._remember(key, list(vector))
+            if self._vectors is None:
+                self._open_vectors(len(vector))
+            if len(vector) != self._dims:
+                return
+
+            # 多个 worker 进程共享磁盘层，槽位分配和写入放在一个写事务里，避免两个进程拿到同一槽位
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                if row:
+                    slot = row[0]
+                else:
+                    slot = self._allocate_slot()
+                self._vectors[slot] = np.asarray(vector, dtype=np.float32)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                    (key, slot, time.time())
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _allocate_slot(self) -> int:
+        # 只在淘汰时删除条目且槽位立即复用，所以已用槽位始终是 [0, count)
+        count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count < self.disk_size:
+            return count
+        # 磁盘层已满，淘汰最久未使用的条目并复用其槽位
+        key, slot = self._db.execute(
+            "SELECT key, slot FROM entries ORDER BY last_used LIMIT 1"
+        ).fetchone()
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        return slot
+
+    def _remember(self, key: str, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_size:
+            self._lru.popitem(last=False)
+
+    def flush(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+
+    def stats(self) -> dict:
+        total = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / total if total else 0.0,
+            "memory_entries": len(self._lru),
+        }
+
+
+class CachedEmbedder:
+    """包装 mem0 的 embedding 模型，相同模型和文本的查询向量直接从缓存返回
+
+    只缓存检索（memory_action 为 search）的向量：mem0 写入和更新记忆时的文本几乎不会重复，
+    缓存它们只会把有用的查询向量挤出 LRU 和磁盘层。
+    """
+
+    def __init__(self, embedder, cache: EmbeddingCache, model: str):
+        self.embedder = embedder
+        self.cache = cache
+        self.model = model
+        self.config = embedder.config
+
+    def embed(self, text, memory_action=None):
+        if memory_action != "search":
+            return self._embed_upstream(self.embedder.embed, text, memory_action)
+        key = cache_key(self.model, text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self._embed_upstream(self.embedder.embed, text, memory_action)
+            self.cache.put(key, vector)
+        return vector
+
+    def _embed_upstream(self, func, *args):
+        with metrics.upstream_call("embedding", "embedding"):
+            return func(*args)
+
+    def embed_batch(self, texts: list) -> list:
+        """批量获取向量，只对未命中的文本调用底层 embedder"""
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self._embed_upstream(embed_many, self.embedder, [texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                self.cache.put(keys[i], vector)
+                vectors[i] = vector
+        return vectors
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
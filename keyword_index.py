@@ -0,0 +1,296 @@
+"""按用户的关键词倒排索引（BM25）和混合检索
+
+向量检索每次都要先向量化查询，而且对人名、订单号、中文专有名词这类精确匹配并不敏感。
+关键词索引保存在本地 SQLite 中，按 (user_id, token) 组织倒排表，检索只读取该用户的
+倒排记录，BM25 的文档数和平均长度也按用户统计。
+
+- 分词：英文和数字按词切分（带连字符的编号同时保留整体和各段），中文按相邻二字切分，
+  不需要额外依赖；KEYWORD_TOKENIZER=jieba 时改用 jieba 的搜索引擎模式分词
+- 同步：KeywordIndexedStore 包装 mem0 的向量库，mem0 的写入、更新、删除和记忆整理都经过它；
+  批量删除、清空和导入由 MemoryManager 直接更新索引。索引中残留的 ID 在读取记忆时被过滤掉
+- 检索：fuse 把两路分数各自归一化后加权合并；关键词命中覆盖了查询中大部分信息量
+  （按 IDF 加权）时可以直接返回，不做向量化
+
+启用前已有的记忆用 scripts/build_keyword_index.py 建立索引。
+"""
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+import config
+
+# BM25 参数
+K1 = 1.5
+B = 0.75
+
+_ASCII = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+_jieba = None
+
+
+def _ascii_tokens(text: str) -> list:
+    tokens = []
+    for word in _ASCII.findall(text):
+        tokens.append(word)
+        parts = re.split(r"[-_.]", word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def tokenize(text: str, tokenizer: str = None) -> list:
+    """把文本切分为检索词，文档和查询使用同一种切分"""
+    text = (text or "").lower()
+    tokenizer = tokenizer or config.KEYWORD_TOKENIZER
+    if tokenizer == "jieba":
+        global _jieba
+        if _jieba is None:
+            # jieba 是可选依赖，只在启用时导入
+            import jieba
+            _jieba = jieba
+        cjk = [word for run in _CJK.findall(text) for word in _jieba.lcut_for_search(run)]
+    else:
+        # 中文按相邻二字切分，单独的汉字保留为一个词
+        cjk = []
+        for run in _CJK.findall(text):
+            cjk.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+    return _ascii_tokens(text) + cjk
+
+
+class KeywordIndex:
+    """SQLite 中按用户组织的倒排索引"""
+
+    def __init__(self, path: str = None, tokenizer: str = None):
+        self.path = path or config.KEYWORD_INDEX_PATH
+        self.tokenizer = tokenizer or config.KEYWORD_TOKENIZER
+        # 每次检索都要读取，每个线程复用一个连接
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS kw_postings (
+                user_id TEXT NOT NULL,
+                token TEXT NOT NULL,
+                id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (user_id, token, id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS kw_docs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                terms TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_kw_docs_user ON kw_docs (user_id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS kw_users (
+                user_id TEXT PRIMARY KEY,
+                docs INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            )
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _remove(conn, ids: list):
+        """删除这些文档的倒排记录并更新用户统计（调用方负责事务）"""
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id, user_id, length, terms FROM kw_docs WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for memory_id, user_id, length, terms in rows:
+                conn.executemany("DELETE FROM kw_postings WHERE user_id = ? AND token = ? AND id = ?",
+                                 [(user_id, token, memory_id) for token in terms.split("\n") if token])
+                conn.execute("UPDATE kw_users SET docs = docs - 1, total_length = total_length - ? WHERE user_id = ?",
+                             (length, user_id))
+            conn.executemany("DELETE FROM kw_docs WHERE id = ?", [(row[0],) for row in rows])
+
+    def add(self, ids: list, payloads: list):
+        """索引（或重新索引）记忆，payload 中需要有 data 和 user_id"""
+        docs = []
+        for memory_id, payload in zip(ids, payloads):
+            user_id = (payload or {}).get("user_id")
+            if user_id is None:
+                continue
+            counts = Counter(tokenize(payload.get("data", ""), self.tokenizer))
+            docs.append((memory_id, user_id, counts))
+        if not docs:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, [doc[0] for doc in docs])
+            for memory_id, user_id, counts in docs:
+                length = sum(counts.values())
+                conn.executemany(
+                    "INSERT INTO kw_postings (user_id, token, id, tf, length) VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, token, memory_id, tf, length) for token, tf in counts.items()]
+                )
+                conn.execute("INSERT INTO kw_docs (id, user_id, length, terms) VALUES (?, ?, ?, ?)",
+                             (memory_id, user_id, length, "\n".join(counts)))
+                conn.execute("""
+                    INSERT INTO kw_users (user_id, docs, total_length) VALUES (?, 1, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET docs = docs + 1, total_length = total_length + excluded.total_length
+                """, (user_id, length))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, ids: list):
+        if not ids:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, list(ids))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete_user(self, user_id: str):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kw_postings WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM kw_docs WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM kw_users WHERE user_id = ?", (user_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("kw_postings", "kw_docs", "kw_users"):
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def count(self, user_id: str = None) -> int:
+        if user_id is None:
+            return self._conn().execute("SELECT COUNT(*) FROM kw_docs").fetchone()[0]
+        row = self._conn().execute("SELECT docs FROM kw_users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def search(self, user_id: str, query: str, limit: int = 5) -> list:
+        """BM25 检索，返回 [(memory_id, score, coverage), ...]，按分数从高到低
+
+        coverage 为该记忆包含的查询词占全部查询词 IDF 之和的比例（0~1），用于判断命中是否足够强。
+        """
+        terms = list(dict.fromkeys(tokenize(query, self.tokenizer)))
+        if not terms:
+            return []
+        conn = self._conn()
+        stats = conn.execute("SELECT docs, total_length FROM kw_users WHERE user_id = ?", (user_id,)).fetchone()
+        if not stats or not stats[0]:
+            return []
+        docs, average = stats[0], max(stats[1] / stats[0], 1.0)
+        rows = conn.execute(
+            f"SELECT token, id, tf, length FROM kw_postings WHERE user_id = ? AND token IN ({','.join('?' * len(terms))})",
+            [user_id, *terms]
+        ).fetchall()
+        df = Counter(row[0] for row in rows)
+        # 用户的记忆中没有出现过的查询词按最大 IDF 计入分母
+        idf = {term: math.log(1 + (docs - df[term] + 0.5) / (df[term] + 0.5)) for term in terms}
+        total_idf = sum(idf.values())
+        scores, weights = Counter(), Counter()
+        for token, memory_id, tf, length in rows:
+            scores[memory_id] += idf[token] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average))
+            weights[memory_id] += idf[token]
+        return [(memory_id, score, weights[memory_id] / total_idf if total_idf else 0.0)
+                for memory_id, score in scores.most_common(limit)]
+
+
+def _normalize(values: list) -> list:
+    """按候选内的最小值和最大值缩放到 0~1，全部相同时都为 1"""
+    low, high = min(values), max(values)
+    return [(value - low) / (high - low) if high > low else 1.0 for value in values]
+
+
+def fuse(vector_results: list, keyword_results: list, limit: int, weight: float = None) -> list:
+    """按分数加权合并两路结果（mem0 格式的记忆字典）
+
+    向量结果的 score 是距离（越小越相似），关键词结果的 score 是命中覆盖比例，各自在候选内
+    归一化后按 (1 - weight) : weight 相加，只出现在一路中的记忆另一路记 0。
+    score 改为融合后的相关度（0~1），match 标明命中来源。
+    """
+    weight = config.HYBRID_KEYWORD_WEIGHT if weight is None else weight
+    merged = {}
+    sources = (
+        ("vector", vector_results, [-(item.get("score") or 0.0) for item in vector_results], 1 - weight),
+        ("keyword", keyword_results, [item.get("score") or 0.0 for item in keyword_results], weight),
+    )
+    for source, results, scores, source_weight in sources:
+        if not results:
+            continue
+        for item, score in zip(results, _normalize(scores)):
+            entry = merged.setdefault(item["id"], {"item": item, "score": 0.0, "sources": []})
+            entry["score"] += source_weight * score
+            entry["sources"].append(source)
+    ranked = sorted(merged.values(), key=lambda entry: entry["score"], reverse=True)[:limit]
+    results = []
+    for entry in ranked:
+        item = dict(entry["item"])
+        item["score"] = entry["score"]
+        item["match"] = "both" if len(entry["sources"]) == 2 else entry["sources"][0]
+        results.append(item)
+    return results
+
+
+class KeywordIndexedStore:
+    """包装 mem0 的向量库，写入、更新、删除时同步关键词索引"""
+
+    def __init__(self, store, index: KeywordIndex):
+        self.store = store
+        self.index = index
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def insert(self, vectors: list, payloads: list = None, ids: list = None):
+        self.store.insert(vectors=vectors, payloads=payloads, ids=ids)
+        self.index.add(ids, payloads or [])
+
+    def update(self, vector_id: str, vector: list = None, payload: dict = None):
+        self.store.update(vector_id=vector_id, vector=vector, payload=payload)
+        if payload is not None:
+            self.index.add([vector_id], [payload])
+
+    def delete(self, vector_id: str):
+        self.store.delete(vector_id=vector_id)
+        self.index.delete([vector_id])
+
+
+class KeywordIndexedCollection:
+    """包装 Chroma 集合，供批量导入直接写入：upsert 时同步关键词索引"""
+
+    def __init__(self, collection, index: KeywordIndex):
+        self.collection = collection
+        self.index = index
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def upsert(self, ids: list, embeddings: list, metadatas: list = None):
+        self.collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+        self.index.add(ids, metadatas or [])
@@ -0,0 +1,77 @@
+import os
+import threading
+
+import numpy as np
+import onnxruntime as ort
+from mem0.configs.embeddings.base import BaseEmbedderConfig
+from tokenizers import Tokenizer
+
+import config
+
+
+class OnnxEmbedder:
+    """本地 ONNX 句向量模型，替代远程 embedding-3
+
+    模型目录需要包含 model.onnx 和 tokenizer.json（例如导出的 bge-small-zh），
+    输出做 mean pooling 后 L2 归一化。接口与 mem0 的 embedder 一致，可直接替换
+    Memory.embedding_model。
+    """
+
+    def __init__(self, model_dir: str = None, threads: int = None,
+                 batch_size: int = None, max_length: int = None):
+        self.model_dir = model_dir or config.LOCAL_EMBEDDING_MODEL_DIR
+        self.batch_size = batch_size or config.LOCAL_EMBEDDING_BATCH_SIZE
+        self.max_length = max_length or config.LOCAL_EMBEDDING_MAX_LENGTH
+        self.model_name = f"onnx:{os.path.basename(os.path.normpath(self.model_dir))}"
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or config.LOCAL_EMBEDDING_THREADS
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(self.model_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding()
+        # tokenizers 的 Tokenizer 不保证多线程安全
+        self._lock = threading.Lock()
+
+        dims = self.session.get_outputs()[0].shape[-1]
+        self.config = BaseEmbedderConfig(
+            model=self.model_name,
+            embedding_dims=dims if isinstance(dims, int) else None
+        )
+
+    def embed(self, text, memory_action=None):
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts: list) -> list:
+        """批量推理，按 batch_size 切分"""
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._run(texts[start:start + self.batch_size]))
+        return vectors
+
+    def _run(self, texts: list) -> list:
+        texts = [t.replace("\n", " ") for t in texts]
+        with self._lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        if hidden.ndim == 3:
+            # mean pooling，忽略 padding 位置
+            mask = attention_mask[..., None].astype(np.float32)
+            hidden = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(hidden, axis=1, keepdims=True)
+        return (hidden / np.clip(norms, 1e-12, None)).tolist()
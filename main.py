@@ -1,78 +1,406 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from langchain_community.chat_models import ChatZhipuAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+import asyncio
+import json
+import re
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List, Optional
+from pydantic import BaseModel, Field
+import admission
 import config
-from memory_manager import MemoryManager
+import metrics
+import resilience
+import resources
+from context_builder import assemble_context
 
-app = FastAPI(title="智谱AI对话API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # LLM、mem0 和向量库都在首次使用时创建；启动时在后台预热，完成前 /readyz 返回 503
+    metrics.QUEUE_DEPTH.set_function(resources.memory_queue_depth, queue="memory_write")
+    if config.WARMUP_ON_STARTUP:
+        resources.start_warmup()
+    yield
+    resources.shutdown()
 
-llm = ChatZhipuAI(
-    model="glm-4-flash",
-    api_key=config.ZHIPU_API_KEY,
-    temperature=0.7,
-)
-
-memory_manager = MemoryManager()
+app = FastAPI(title="智谱AI对话API", lifespan=lifespan)
 
 class ChatRequest(BaseModel):
     user_id: str
     message: str
     use_memory: bool = True
+    # 跳过语义响应缓存，强制调用 LLM
+    bypass_cache: bool = False
 
 class ChatResponse(BaseModel):
     response: str
     user_id: str
+    cached: bool = False
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest]
+    # 检索和 LLM 调用的最大并发数，默认取 BATCH_CONCURRENCY
+    concurrency: Optional[int] = Field(None, ge=1, le=64)
+
+class MemoryDeleteRequest(BaseModel):
+    ids: List[str] = Field(..., max_length=1000)
+
+async def build_messages(request: ChatRequest, timings: dict = None, context: list = None):
+    """构建发送给 LLM 的消息列表，返回消息和节省的 token 数
+
+    context 为已检索好的记忆（批量接口预先检索），为 None 时在这里检索；检索超过
+    CONTEXT_DEADLINE 或失败时不带记忆继续。
+    """
+    # langchain 导入较慢，放到首次构建消息时
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    messages = [SystemMessage(content="你是一个智能助手")]
+    tokens_saved = 0
+
+    if request.use_memory:
+        if context is None:
+            with metrics.stage_timer("context", timings):
+                memory_manager = await resources.aget(resources.get_memory_manager)
+                context = await memory_manager.aget_context_within(
+                    request.user_id,
+                    request.message
+                )
+        assembled = assemble_context(context)
+        tokens_saved = assembled.tokens_saved
+        metrics.PROMPT_TOKENS.inc(assembled.tokens_used, kind="used")
+        metrics.PROMPT_TOKENS.inc(assembled.tokens_saved, kind="saved")
+        if assembled.memories:
+            context_text = "\n".join(assembled.memories)
+            messages.append(SystemMessage(content=f"历史上下文:\n{context_text}"))
+
+    messages.append(HumanMessage(content=request.message))
+    return messages, tokens_saved
+
+def use_response_cache(request: ChatRequest) -> bool:
+    return config.RESPONSE_CACHE_ENABLED and not request.bypass_cache
+
+def cache_context(messages: list) -> list:
+    """除当前问题外的全部提示内容（系统提示、记忆），作为响应缓存的上下文指纹"""
+    return [m.content for m in messages[:-1]]
+
+async def lookup_response(request: ChatRequest, messages: list, timings: dict = None):
+    """查询语义响应缓存，未启用、未命中或查询失败时返回 None
+
+    缓存是可选的加速，向量化失败或被准入控制拒绝时按未命中处理，继续调用 LLM。
+    """
+    if not use_response_cache(request):
+        return None
+    with metrics.stage_timer("response_cache", timings):
+        try:
+            response_cache = await resources.aget(resources.get_response_cache)
+            return await response_cache.alookup(
+                request.user_id, request.message, cache_context(messages)
+            )
+        except Exception as e:
+            print(f"查询响应缓存失败，按未命中处理: {e}")
+            metrics.CACHE_REQUESTS.inc(cache="response", result="miss")
+            return None
+
+async def store_response(request: ChatRequest, messages: list, response_text: str):
+    """把回答写入语义响应缓存，失败时只打印错误"""
+    if not use_response_cache(request):
+        return
     try:
-        messages = [SystemMessage(content="你是一个智能助手")]
-        
-        if request.use_memory:
-            context = memory_manager.get_context(
-                request.user_id,
-                request.message
+        await resources.get_response_cache().astore(
+            request.user_id, request.message, cache_context(messages), response_text
+        )
+    except Exception as e:
+        print(f"写入响应缓存失败: {e}")
+
+async def generate_reply(request: ChatRequest, messages: list, timings: dict = None):
+    """先查响应缓存，未命中时调用 LLM；返回回复和是否来自缓存"""
+    cached = await lookup_response(request, messages, timings)
+    if cached is not None:
+        return cached, True
+    llm = await resources.aget(resources.get_llm)
+    async with admission.get_limiter("llm").aslot(request.user_id):
+        with metrics.upstream_call("llm", "llm", timings):
+            llm_response = await resilience.aretry(
+                "llm", lambda: llm.ainvoke(messages), timeout=config.LLM_TIMEOUT
             )
-            if context:
-                context_text = "\n".join([m["memory"] for m in context])
-                messages.append(SystemMessage(content=f"历史上下文:\n{context_text}"))
-        
-        messages.append(HumanMessage(content=request.message))
-        
-        response = llm.invoke(messages)
-        response_text = response.content
+    await store_response(request, messages, llm_response.content)
+    return llm_response.content, False
+
+def rejection_detail(e: admission.AdmissionRejected) -> dict:
+    return {"detail": str(e), "status": e.status_code, "retry_after": e.retry_after}
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, response: Response):
+    timings = {}
+    try:
+        messages, tokens_saved = await build_messages(request, timings)
+        response_text, cached = await generate_reply(request, messages, timings)
         
         if request.use_memory:
-            memory_manager.add_message(
-                request.user_id,
-                request.message,
-                "user"
-            )
-            memory_manager.add_message(
-                request.user_id,
-                response_text,
-                "assistant"
-            )
+            # 写入本地日志后立即返回，mem0 提取在后台完成
+            with metrics.stage_timer("persist", timings):
+                resources.get_memory_queue().enqueue_turn(
+                    request.user_id,
+                    request.message,
+                    response_text
+                )
         
+        if config.TIMING_HEADERS:
+            response.headers["Server-Timing"] = server_timing(timings)
+            response.headers["X-Prompt-Tokens-Saved"] = str(tokens_saved)
         return ChatResponse(
             response=response_text,
-            user_id=request.user_id
+            user_id=request.user_id,
+            cached=cached
         )
     
+    except admission.AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """SSE 流式对话：逐个推送 token，结束时在 done 事件中附带首 token 时间和总耗时"""
+    start = time.perf_counter()
+
+    async def event_stream():
+        ttft = None
+        chunks = []
+        completed = False
+        try:
+            messages, tokens_saved = await build_messages(request)
+            cached = await lookup_response(request, messages)
+            if cached is not None:
+                # 命中缓存时一次推送完整回答
+                ttft = time.perf_counter() - start
+                chunks.append(cached)
+                yield sse_event("token", {"content": cached})
+            else:
+                llm = await resources.aget(resources.get_llm)
+                async with admission.get_limiter("llm").aslot(request.user_id):
+                    with metrics.upstream_call("llm", "llm_stream"):
+                        async for chunk in resilience.astream(
+                            "llm",
+                            lambda: llm.astream(messages),
+                            first_timeout=config.LLM_FIRST_TOKEN_TIMEOUT,
+                            idle_timeout=config.LLM_IDLE_TIMEOUT
+                        ):
+                            if await http_request.is_disconnected():
+                                return
+                            if not chunk.content:
+                                continue
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                                metrics.TTFT_SECONDS.observe(ttft)
+                            chunks.append(chunk.content)
+                            yield sse_event("token", {"content": chunk.content})
+                await store_response(request, messages, "".join(chunks))
+            completed = True
+            yield sse_event("done", {
+                "user_id": request.user_id,
+                "ttft_ms": round((ttft or 0) * 1000, 1),
+                "total_ms": round((time.perf_counter() - start) * 1000, 1),
+                "prompt_tokens_saved": tokens_saved,
+                "cached": cached is not None,
+            })
+        except asyncio.CancelledError:
+            # 客户端断开时 Starlette 会取消生成器，不保存不完整的回复
+            raise
+        except admission.AdmissionRejected as e:
+            yield sse_event("error", rejection_detail(e))
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            # 流关闭后再保存记忆，只保存完整生成的回复
+            if completed and request.use_memory:
+                resources.get_memory_queue().enqueue_turn(
+                    request.user_id,
+                    request.message,
+                    "".join(chunks)
+                )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/chat/batch")
+async def chat_batch(batch: ChatBatchRequest):
+    """批量对话：按完成顺序以 NDJSON 逐行返回结果
+
+    所有查询先用一次批量向量化调用完成检索，再以有界并发调用 LLM。每行带上条目在
+    请求中的 index；单条失败时该行包含 error，不影响其他条目。
+    """
+    if len(batch.requests) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"单次最多 {config.BATCH_MAX_ITEMS} 条")
+    concurrency = batch.concurrency or config.BATCH_CONCURRENCY
+
+    async def results():
+        memory_items = [(i, r) for i, r in enumerate(batch.requests) if r.use_memory]
+        contexts = {}
+        if memory_items:
+            with metrics.stage_timer("context_batch"):
+                memory_manager = await resources.aget(resources.get_memory_manager)
+                found = await memory_manager.asearch_many(
+                    [(r.user_id, r.message) for _, r in memory_items],
+                    concurrency=concurrency
+                )
+            contexts = {i: result for (i, _), result in zip(memory_items, found)}
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(index: int, request: ChatRequest) -> dict:
+            async with semaphore:
+                try:
+                    context = contexts.get(index)
+                    if isinstance(context, Exception):
+                        raise context
+                    messages, _ = await build_messages(request, context=context)
+                    response_text, cached = await generate_reply(request, messages)
+                    if request.use_memory:
+                        resources.get_memory_queue().enqueue_turn(
+                            request.user_id,
+                            request.message,
+                            response_text
+                        )
+                    return {"index": index, "user_id": request.user_id,
+                            "response": response_text, "cached": cached}
+                except admission.AdmissionRejected as e:
+                    return {"index": index, "user_id": request.user_id, "error": str(e),
+                            "status": e.status_code, "retry_after": e.retry_after}
+                except Exception as e:
+                    return {"index": index, "user_id": request.user_id, "error": str(e)}
+
+        tasks = [asyncio.create_task(run(i, r)) for i, r in enumerate(batch.requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消尚未完成的条目
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @app.get("/memory/{user_id}")
-async def get_memory(user_id: str):
+async def get_memory(
+    user_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    role: Optional[str] = None,
+    since: Optional[str] = Query(None, description="ISO 日期或时间，只返回此后创建的记忆"),
+    until: Optional[str] = Query(None, description="ISO 日期或时间，只返回此前创建的记忆"),
+):
+    """分页读取记忆，最新的在前；用返回的 next_offset 请求下一页"""
+    try:
+        memory_manager = await resources.aget(resources.get_memory_manager)
+        page = await memory_manager.alist_memories(
+            user_id, offset=offset, limit=limit, role=role, since=since, until=until
+        )
+        return {"user_id": user_id, **page}
+    except ValueError as e:
+        # since / until 不是有效的 ISO 日期或时间
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/memory/{user_id}/count")
+async def count_memory(user_id: str, role: Optional[str] = None):
+    try:
+        memory_manager = await resources.aget(resources.get_memory_manager)
+        return {"user_id": user_id, "count": await memory_manager.acount_memories(user_id, role)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/memory/{user_id}/delete")
+async def delete_memory(user_id: str, request: MemoryDeleteRequest):
+    """批量删除记忆，只删除属于该用户的条目"""
+    try:
+        memory_manager = await resources.aget(resources.get_memory_manager)
+        deleted = await memory_manager.adelete_memories(user_id, request.ids)
+        return {"user_id": user_id, "deleted": deleted}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/memory/{user_id}/export")
+async def export_memory(user_id: str, gzip: bool = False, vectors: bool = True):
+    """流式导出记忆：NDJSON，gzip=true 时压缩；vectors=false 时不导出向量"""
+    import memory_transfer
+
+    memory_manager = await resources.aget(resources.get_memory_manager)
+    lines = memory_manager.export_memories(user_id, include_vectors=vectors)
+    filename = re.sub(r"[^\w.-]", "_", f"memories_{user_id}.ndjson") + (".gz" if gzip else "")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if gzip:
+        return StreamingResponse(memory_transfer.gzip_chunks(lines), media_type="application/gzip", headers=headers)
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+@app.post("/memory/import")
+async def import_memory(request: Request, user_id: Optional[str] = None):
+    """批量导入导出文件（NDJSON 或 gzip），不经过 mem0 的事实提取
+
+    请求体边读边导入，不会整个读入内存。指定 user_id 时全部导入到该用户下。
+    """
+    import memory_transfer
+
+    memory_manager = await resources.aget(resources.get_memory_manager)
+    loop = asyncio.get_running_loop()
+    body = request.stream().__aiter__()
+
+    def chunks():
+        # 导入在线程中执行，从事件循环逐块取请求体
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(body.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+
     try:
-        memories = memory_manager.get_all_memories(user_id)
-        return {"user_id": user_id, "memories": memories}
+        stats = await asyncio.to_thread(
+            memory_manager.import_memories, memory_transfer.iter_lines(chunks()), user_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"导入失败: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"user_id": user_id, **stats}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus 格式的指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/livez")
+async def livez():
+    """存活探针：进程和事件循环正常即返回，不检查上游"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    """就绪探针：预热完成（向量库已打开、连接已建立）前返回 503"""
+    state = resources.readiness()
+    if not state["ready"] and not config.WARMUP_ON_STARTUP:
+        # 关闭了启动预热时，由第一次就绪探测触发
+        state = await asyncio.to_thread(resources.warmup)
+    if not state["ready"]:
+        response.status_code = 503
+    return {"status": "ok" if state["ready"] else "starting", **state}
 
 @app.get("/health")
 async def health():
+    # 兼容旧的探针配置，等同于 /livez
     return {"status": "ok"}
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+"""记忆写入前的本地预筛选
+
+每次写入记忆，mem0 都会调用一次 LLM 做事实提取，寒暄、致谢和不含用户信息的长回答也不例外。
+预筛选在本地逐条判断消息的处理方式：
+
+- extract：交给 mem0 做 LLM 事实提取（原有行为）
+- raw：不做提取，原文向量化后保存（mem0 的 infer=False），只有一次向量化调用
+- drop：不写入记忆
+
+按角色配置策略（MEMORY_FILTER_POLICIES，例如 user:auto,assistant:drop），auto 按规则判断：
+空消息、寒暄致谢和过短的消息丢弃；代码块或超长的消息、以及看不出用户自身信息的消息按
+MEMORY_FILTER_FALLBACK 处理；其余（第一人称陈述、偏好、计划等）做提取。配置了
+MEMORY_FILTER_MODEL_PATH 时，最后一步改用本地分类器（字符 n-gram 哈希特征的逻辑回归，
+由 scripts/eval_memory_filter.py --train 训练）判断。
+
+MEMORY_FILTER_RECORD_PATH 不为空时把每条消息和判断结果追加到 NDJSON 文件，供离线评估。
+"""
+import json
+import math
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import config
+import metrics
+
+DECISIONS = ("extract", "raw", "drop")
+POLICIES = ("auto",) + DECISIONS
+
+# 整条消息只由这些词组成（忽略标点、空白和表情）时视为寒暄
+_ACKNOWLEDGEMENT = re.compile(
+    r"^(?:你好|您好|嗨|哈喽|哈啰|在吗|在不在|谢谢你|谢谢|多谢|感谢|辛苦了|好的|好滴|好|行|可以|"
+    r"嗯|哦|噢|啊|哈|呵|收到|明白了|明白|懂了|知道了|了解|再见|拜拜|晚安|早安|早上好|中午好|晚上好|早|"
+    r"不客气|没事|没关系|对的|对|是的|不是|是|不用了|hi|hello|hey|thankyou|thanks|thank|thx|"
+    r"goodbye|bye|okay|ok|yes|yep|nope|no|sure|cool|nice|great|lol)+$",
+    re.I
+)
+# 请求和提问中的“我”不是在陈述自己的信息
+_REQUEST_PHRASES = re.compile(
+    r"(?:帮|给|替|为|告诉|教|跟|和|让|请)我|我(?:想|要|需要)?(?:问|知道|了解|请教)|"
+    r"\b(?:tell|show|give|help|let)\s+me\b|\bcan\s+(?:i|you)\b",
+    re.I
+)
+_FIRST_PERSON = re.compile(r"我|咱|俺|本人|\b(?:i|i'm|im|i've|i'd|my|me|mine|myself|we|our|us)\b", re.I)
+# 不带第一人称也多半是在说用户自己的事
+_PERSONAL_TOPICS = re.compile(
+    r"喜欢|讨厌|爱吃|不吃|过敏|住在|搬到|生日|岁|名字|叫做|职业|上班|公司|学校|专业|老婆|老公|妻子|丈夫|"
+    r"孩子|儿子|女儿|父母|爸爸|妈妈|宠物|计划|打算|准备|目标|习惯|平时|经常|每天|周末|记住|别忘|提醒|"
+    r"\b(?:remember|prefer|favou?rite|allergic|birthday|live in|work at|name is)\b",
+    re.I
+)
+
+
+def _meaningful(text: str) -> str:
+    return re.sub(r"[\W_]+", "", text)
+
+
+class NgramClassifier:
+    """字符 1~3-gram 哈希特征的逻辑回归，判断消息是否包含值得提取的用户信息"""
+
+    def __init__(self, weights: np.ndarray = None, bias: float = 0.0, dims: int = 1 << 18):
+        self.dims = dims
+        self.weights = weights if weights is not None else np.zeros(dims, dtype=np.float32)
+        self.bias = bias
+
+    def features(self, text: str) -> np.ndarray:
+        text = text.lower()
+        grams = {text[i:i + n] for n in (1, 2, 3) for i in range(len(text) - n + 1)}
+        return np.fromiter({zlib.crc32(gram.encode("utf-8")) % self.dims for gram in grams}, dtype=np.int64)
+
+    def predict(self, text: str) -> float:
+        index = self.features(text)
+        if not len(index):
+            return 0.0
+        z = float(self.weights[index].sum()) / math.sqrt(len(index)) + self.bias
+        return 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0)))
+
+    def fit(self, texts: list, labels: list, epochs: int = 20, lr: float = 0.5, l2: float = 1e-4, seed: int = 0):
+        """随机梯度下降，labels 为 0 / 1"""
+        samples = [(self.features(text), float(label)) for text, label in zip(texts, labels)]
+        samples = [(index, label) for index, label in samples if len(index)]
+        order = np.random.default_rng(seed)
+        for _ in range(epochs):
+            for k in order.permutation(len(samples)):
+                index, label = samples[k]
+                scale = 1.0 / math.sqrt(len(index))
+                z = float(self.weights[index].sum()) * scale + self.bias
+                gradient = 1.0 / (1.0 + math.exp(-max(min(z, 30.0), -30.0))) - label
+                self.weights[index] -= lr * (gradient * scale + l2 * self.weights[index])
+                self.bias -= lr * gradient
+        return self
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, dims=self.dims)
+
+    @classmethod
+    def load(cls, path: str) -> "NgramClassifier":
+        data = np.load(path)
+        return cls(data["weights"].astype(np.float32), float(data["bias"]), int(data["dims"]))
+
+
+def parse_policies(spec: str) -> dict:
+    """"user:auto,assistant:drop" -> {"user": "auto", "assistant": "drop"}"""
+    policies = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        role, _, policy = item.partition(":")
+        policy = policy.strip().lower()
+        if policy not in POLICIES:
+            raise ValueError(f"未知的记忆预筛选策略: {item}")
+        policies[role.strip()] = policy
+    return policies
+
+
+class MemoryFilter:
+    """按角色策略判断每条消息做提取、原文保存还是丢弃
+
+    未配置策略的角色按 extract 处理，与不启用预筛选时相同。
+    """
+
+    def __init__(self, policies: dict = None, fallback: str = None, min_chars: int = None,
+                 max_chars: int = None, model_path: str = None, threshold: float = None,
+                 record_path: str = None):
+        self.policies = policies if policies is not None else parse_policies(config.MEMORY_FILTER_POLICIES)
+        self.fallback = fallback or config.MEMORY_FILTER_FALLBACK
+        if self.fallback not in DECISIONS:
+            raise ValueError(f"未知的 MEMORY_FILTER_FALLBACK: {self.fallback}")
+        self.min_chars = min_chars if min_chars is not None else config.MEMORY_FILTER_MIN_CHARS
+        self.max_chars = max_chars or config.MEMORY_FILTER_MAX_CHARS
+        self.threshold = threshold if threshold is not None else config.MEMORY_FILTER_THRESHOLD
+        model_path = model_path if model_path is not None else config.MEMORY_FILTER_MODEL_PATH
+        self.classifier = NgramClassifier.load(model_path) if model_path else None
+        self.record_path = record_path if record_path is not None else config.MEMORY_FILTER_RECORD_PATH
+        self._record_lock = threading.Lock()
+
+    def decide(self, content: str, role: str = "user") -> tuple:
+        """返回 (decision, reason)"""
+        policy = self.policies.get(role, "extract")
+        if policy != "auto":
+            return policy, "policy"
+        text = (content or "").strip()
+        meaningful = _meaningful(text)
+        if not meaningful:
+            return "drop", "empty"
+        if _ACKNOWLEDGEMENT.match(meaningful):
+            return "drop", "greeting"
+        if len(meaningful) < self.min_chars:
+            return "drop", "short"
+        if "```" in text or len(text) > self.max_chars:
+            return self.fallback, "long"
+        if role != "user":
+            # 规则和分类器只针对用户消息，其他角色在 auto 下不做提取
+            return self.fallback, "role"
+        if self.classifier is not None:
+            if self.classifier.predict(text) >= self.threshold:
+                return "extract", "model"
+            return self.fallback, "model"
+        if _FIRST_PERSON.search(_REQUEST_PHRASES.sub("", text)):
+            return "extract", "first_person"
+        if _PERSONAL_TOPICS.search(text):
+            return "extract", "topic"
+        return self.fallback, "no_fact"
+
+    def split(self, user_id: str, messages: list) -> tuple:
+        """把消息分成 (需要提取的, 原文保存的)，丢弃的不返回"""
+        extract, raw, records = [], [], []
+        for message in messages:
+            role = message.get("role", "user")
+            decision, reason = self.decide(message.get("content", ""), role)
+            metrics.MEMORY_FILTER_DECISIONS.inc(role=role, decision=decision)
+            if decision == "extract":
+                extract.append(message)
+            elif decision == "raw":
+                raw.append(message)
+            if self.record_path:
+                records.append({"ts": time.time(), "user_id": user_id, "role": role,
+                                "content": message.get("content", ""), "decision": decision, "reason": reason})
+        if messages and not extract:
+            metrics.MEMORY_EXTRACTION_SKIPPED.inc()
+        if records:
+            self._record(records)
+        return extract, raw
+
+    def _record(self, records: list):
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        try:
+            with self._record_lock, open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            print(f"记录预筛选结果失败: {e}")
@@ -1,16 +1,80 @@
 from mem0 import Memory
+from mem0.memory import main as mem0_main
+import admission
 import config
+import memory_transfer
+import metrics
+import resilience
+from compact_vectors import CompactCollection, CompactVectorStore, RerankStore
+from consolidation import UsageTracker
+from embedding_cache import EmbeddingCache, CachedEmbedder
+from keyword_index import KeywordIndex, KeywordIndexedCollection, KeywordIndexedStore, fuse
+from memory_filter import MemoryFilter
+from partitioning import PartitionRouter, PartitionedChromaDB, partition_scope
+from vector_store import create_chroma_client
 import os
-from datetime import datetime
-import json
+import asyncio
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# 与 mem0 get_all 返回格式一致：这些字段提升到顶层，其余元数据放在 metadata 中
+PROMOTED_KEYS = ("user_id", "agent_id", "run_id", "actor_id", "role")
+CORE_KEYS = {"data", "hash", "created_at", "updated_at", "created_ts", *PROMOTED_KEYS}
+
+
+def format_memory(memory_id: str, payload: dict) -> dict:
+    """把 Chroma 中的一条记录转换成 mem0 的记忆格式"""
+    item = {
+        "id": memory_id,
+        "memory": payload.get("data"),
+        "hash": payload.get("hash"),
+        "created_at": payload.get("created_at"),
+        "updated_at": payload.get("updated_at"),
+    }
+    item.update({key: payload[key] for key in PROMOTED_KEYS if key in payload})
+    extra = {k: v for k, v in payload.items() if k not in CORE_KEYS}
+    if extra:
+        item["metadata"] = extra
+    return item
+
+
+class TimestampedStore:
+    """mem0 向量库的包装：写入和更新时按 created_at 补上数值的 created_ts"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def insert(self, vectors: list, payloads: list = None, ids: list = None):
+        if payloads:
+            payloads = [memory_transfer.stamp_created_ts(dict(payload)) for payload in payloads]
+        return self.store.insert(vectors=vectors, payloads=payloads, ids=ids)
+
+    def update(self, vector_id: str, vector: list = None, payload: dict = None):
+        if payload is not None:
+            payload = memory_transfer.stamp_created_ts(dict(payload))
+        return self.store.update(vector_id=vector_id, vector=vector, payload=payload)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
 
 class MemoryManager:
     """管理用户对话记忆的类，使用 mem0 和智谱 AI"""
 
     def __init__(self):
+        config.validate()
+        # 向量库客户端按 VECTOR_STORE_MODE 创建（嵌入式模式会先做单进程检查）。
+        # mem0 初始化时会 deepcopy 向量库配置，客户端持有锁无法复制，让它复制时返回自身
+        chroma_client = create_chroma_client()
+        chroma_client.__deepcopy__ = lambda memo: chroma_client
+
         # 设置环境变量让 mem0 使用智谱 API
         os.environ["OPENAI_API_KEY"] = config.ZHIPU_API_KEY
-        os.environ["OPENAI_BASE_URL"] = "https://open.bigmodel.cn/api/paas/v4/"
+        os.environ["OPENAI_BASE_URL"] = config.ZHIPU_BASE_URL
 
         mem_config = {
             "llm": {
@@ -30,63 +94,511 @@ class MemoryManager:
             "vector_store": {
                 "provider": "chroma",
                 "config": {
-                    "collection_name": "zhipu_conversations",
-                    "path": "./chroma_db",
+                    "collection_name": config.CHROMA_COLLECTION,
+                    # 传入客户端时 path 不会被使用，但 mem0 的配置校验要求提供
+                    "client": chroma_client,
+                    "path": config.CHROMA_PATH,
                 }
             }
         }
 
         self.memory = Memory.from_config(mem_config)
+        # mem0 在自己的线程池中做向量化和向量库操作，让工作线程继承调用方的用户上下文
+        admission.propagate_context(mem0_main)
+        # 分区模式下替换 mem0 的向量库，按 user_id 把记忆路由到各自的集合
+        self.partitions = PartitionRouter(chroma_client, config.CHROMA_COLLECTION)
+        if self.partitions.partitioned:
+            self.memory.vector_store = PartitionedChromaDB(self.memory.vector_store, self.partitions)
+        # 数值的创建时间，分页浏览按时间范围过滤时在 Chroma 中完成
+        self.memory.vector_store = TimestampedStore(self.memory.vector_store)
+        self._timestamped_users = set()
+        # 紧凑模式下向量库只保存降维向量，全维向量量化后另存，检索时用于重排
+        self.rerank_store = None
+        if config.COMPACT_VECTORS_ENABLED:
+            self.rerank_store = RerankStore()
+            self.memory.vector_store = CompactVectorStore(self.memory.vector_store, self.rerank_store)
+        # 关键词索引：包装在最外层，mem0 的写入、更新和删除都会同步到索引
+        self.keyword_index = None
+        self.keyword_fast_path = config.KEYWORD_FAST_PATH
+        if config.KEYWORD_INDEX_ENABLED:
+            self.keyword_index = KeywordIndex()
+            self.memory.vector_store = KeywordIndexedStore(self.memory.vector_store, self.keyword_index)
+        # mem0 创建的 OpenAI 客户端没有超时；向量化的重试由 resilience 统一处理（受重试预算约束）
+        self.memory.llm.client = self.memory.llm.client.with_options(timeout=config.MEM0_LLM_TIMEOUT)
+        self.memory.embedding_model.client = self.memory.embedding_model.client.with_options(
+            timeout=config.EMBEDDING_TIMEOUT, max_retries=0
+        )
+        self.embedding_model_name = mem_config["embedder"]["config"]["model"]
+        if config.EMBEDDING_BACKEND == "onnx":
+            # 本地 ONNX 模型替换远程 embedder，依赖较重，只在启用时导入
+            from local_embedder import OnnxEmbedder
+            self.memory.embedding_model = OnnxEmbedder()
+            self.embedding_model_name = self.memory.embedding_model.model_name
+        else:
+            # 远程 embedding 调用经过准入控制；放在缓存下层，缓存命中不占用配额。
+            # 重试和对冲在准入之上，每次尝试各自取得许可
+            self.memory.embedding_model = resilience.ResilientEmbedder(
+                admission.RateLimitedEmbedder(self.memory.embedding_model)
+            )
 
-    def add_message(self, user_id: str, message: str, role: str):
-        """添加对话消息到记忆中"""
-        self.memory.add(
-            message,
-            user_id=user_id,
-            metadata={"role": role}
+        self.embedding_cache = None
+        if config.EMBEDDING_CACHE_ENABLED:
+            # 重复的查询直接命中缓存，不再请求远程 embedding 接口
+            self.embedding_cache = EmbeddingCache()
+            self.memory.embedding_model = CachedEmbedder(
+                self.memory.embedding_model,
+                self.embedding_cache,
+                self.embedding_model_name
+            )
+        # 按用户缓存检索结果，键中带上用户的版本号，写入后版本号递增使旧结果失效
+        self._result_cache = OrderedDict()
+        self._user_versions = defaultdict(int)
+        self._cache_lock = threading.Lock()
+        # 写入前在本地预筛选，寒暄和不含用户信息的消息不做 LLM 事实提取
+        self.memory_filter = MemoryFilter() if config.MEMORY_FILTER_ENABLED else None
+        # 记录有写入的用户和被检索到的记忆，供后台记忆整理使用
+        self.usage = UsageTracker()
+
+        # mem0 只有同步实现，异步接口把调用放到有界线程池中执行，避免阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.MEMORY_WORKERS,
+            thread_name_prefix="memory"
         )
 
-    def get_context(self, user_id: str, query: str, limit: int = 5):
-        """搜索相关的记忆上下文"""
-        results = self.memory.search(
-            query,
-            user_id=user_id,
-            limit=limit
+    def warmup(self):
+        """打开集合并做一次向量化，首个请求不再承担建连和模型加载的开销"""
+        self.partitions.warmup()
+        if config.WARMUP_EMBEDDING:
+            embedder = self.memory.embedding_model
+            if isinstance(embedder, CachedEmbedder):
+                # 绕过向量缓存，确保真正建立到 embedding 服务的连接
+                embedder = embedder.embedder
+            embedder.embed("warmup", "search")
+
+    async def _run_in_executor(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(func, *args, **kwargs)
         )
+
+    def _cached(self, user_id: str, key: tuple, loader):
+        """从结果缓存读取，未命中时调用 loader 并写入缓存"""
+        with self._cache_lock:
+            cache_key = (user_id, self._user_versions[user_id]) + key
+            cached = self._result_cache.get(cache_key)
+            if cached is not None and (not cached[0] or cached[0] > time.monotonic()):
+                self._result_cache.move_to_end(cache_key)
+                metrics.CACHE_REQUESTS.inc(cache="result", result="hit")
+                return copy.copy(cached[1])
+
+        metrics.CACHE_REQUESTS.inc(cache="result", result="miss")
+        results = loader()
+
+        with self._cache_lock:
+            # 加载期间如果发生了写入，版本号已变化，这份结果不会再被读到
+            expires_at = time.monotonic() + config.RESULT_CACHE_TTL if config.RESULT_CACHE_TTL else 0
+            self._result_cache[cache_key] = (expires_at, results)
+            self._result_cache.move_to_end(cache_key)
+            while len(self._result_cache) > config.RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+        return copy.copy(results)
+
+    def _invalidate(self, user_id: str = None):
+        """递增用户的版本号；不知道用户时清空全部缓存"""
+        with self._cache_lock:
+            if user_id is None:
+                self._result_cache.clear()
+                for uid in self._user_versions:
+                    self._user_versions[uid] += 1
+            else:
+                self._user_versions[user_id] += 1
+
+    def _extract(self, user_id: str, messages, metadata: dict):
+        """mem0 做 LLM 事实提取后写入"""
+        with admission.user_scope(user_id), partition_scope(user_id), \
+                admission.get_limiter("mem0").slot(user_id), metrics.upstream_call("mem0", "memory_add"):
+            self.memory.add(
+                messages,
+                user_id=user_id,
+                metadata=metadata
+            )
+
+    def _add_raw(self, user_id: str, messages: list):
+        """原文保存，不调用 LLM（只向量化），每条记录的 role 取自消息本身"""
+        with admission.user_scope(user_id), partition_scope(user_id), \
+                metrics.upstream_call("mem0", "memory_add_raw"):
+            self.memory.add(messages, user_id=user_id, infer=False)
+
+    def add_message(self, user_id: str, message: str, role: str):
+        """添加对话消息到记忆中"""
+        try:
+            if self.memory_filter is None:
+                self._extract(user_id, message, {"role": role})
+                return
+            extract, raw = self.memory_filter.split(user_id, [{"role": role, "content": message}])
+            if extract:
+                self._extract(user_id, message, {"role": role})
+            if raw:
+                self._add_raw(user_id, raw)
+        finally:
+            self.usage.record_write(user_id)
+            self._invalidate(user_id)
+
+    def _vector_search(self, user_id: str, query: str, limit: int) -> list:
+        with admission.user_scope(user_id), partition_scope(user_id), \
+                metrics.upstream_call("mem0", "memory_search"):
+            # 检索是幂等的，慢请求可以对冲
+            results = resilience.idempotent("memory_search", lambda: self.memory.search(
+                query,
+                user_id=user_id,
+                limit=limit
+            ))
         # mem0 返回格式: {'results': [...]}
         return results.get('results', [])
 
+    def _keyword_search(self, user_id: str, query: str, limit: int) -> list:
+        """关键词检索，按命中读取记忆；score 为命中覆盖的查询信息量比例，索引中残留的 ID 被跳过"""
+        with metrics.stage_timer("keyword_search"):
+            hits = self.keyword_index.search(user_id, query, limit)
+            collection = self.partitions.collection_for(user_id, create=False)
+            if not hits or collection is None:
+                return []
+            found = collection.get(ids=[hit[0] for hit in hits], where={"user_id": user_id}, include=["metadatas"])
+        payloads = dict(zip(found["ids"], found["metadatas"]))
+        results = []
+        for memory_id, _, coverage in hits:
+            if memory_id in payloads:
+                item = format_memory(memory_id, payloads[memory_id])
+                item.update(score=coverage, match="keyword")
+                results.append(item)
+        return results
+
+    def get_context(self, user_id: str, query: str, limit: int = 5, mode: str = None):
+        """搜索相关的记忆上下文
+
+        mode 为 vector / hybrid / keyword，默认取 RETRIEVAL_MODE；未启用关键词索引时总是 vector。
+        hybrid 模式下关键词命中足够强时直接返回关键词结果，不做向量化。
+        """
+        mode = (mode or config.RETRIEVAL_MODE) if self.keyword_index is not None else "vector"
+
+        def load():
+            if mode == "vector":
+                metrics.MEMORY_RETRIEVALS.inc(path="vector")
+                return self._vector_search(user_id, query, limit)
+            candidates = limit * config.HYBRID_CANDIDATE_FACTOR
+            keyword = self._keyword_search(user_id, query, candidates)
+            if mode == "keyword":
+                metrics.MEMORY_RETRIEVALS.inc(path="keyword")
+                return keyword[:limit]
+            if self.keyword_fast_path and keyword and keyword[0]["score"] >= config.KEYWORD_FAST_PATH_COVERAGE:
+                metrics.MEMORY_RETRIEVALS.inc(path="keyword_fast")
+                return keyword[:limit]
+            metrics.MEMORY_RETRIEVALS.inc(path="hybrid")
+            return fuse(self._vector_search(user_id, query, candidates), keyword, limit)
+        results = self._cached(user_id, ("search", query, limit, mode), load)
+        self.usage.record_retrieval(user_id, [item["id"] for item in results if "id" in item])
+        return results
+
+    def add_messages(self, user_id: str, messages: list, done: set = None):
+        """把一轮或多轮对话作为一次调用写入记忆，mem0 只做一次事实提取
+
+        启用预筛选时只把需要提取的消息交给 mem0，都不需要时不调用 LLM。
+        done 记录已完成的步骤（extract / raw），中途失败后用同一个集合重试时跳过这些步骤，
+        不会重复写入。
+        """
+        done = done if done is not None else set()
+        try:
+            raw = []
+            if self.memory_filter is not None:
+                messages, raw = self.memory_filter.split(user_id, messages)
+            if messages and "extract" not in done:
+                self._extract(user_id, messages, {"role": "conversation"})
+                done.add("extract")
+            if raw and "raw" not in done:
+                self._add_raw(user_id, raw)
+                done.add("raw")
+        finally:
+            self.usage.record_write(user_id)
+            self._invalidate(user_id)
+
+    async def aadd_message(self, user_id: str, message: str, role: str):
+        """异步添加对话消息到记忆中"""
+        await self._run_in_executor(self.add_message, user_id, message, role)
+
+    async def aget_context(self, user_id: str, query: str, limit: int = 5, mode: str = None):
+        """异步搜索相关的记忆上下文"""
+        return await self._run_in_executor(self.get_context, user_id, query, limit, mode)
+
+    def _degraded(self, reason: str, error: Exception = None) -> list:
+        metrics.CONTEXT_DEGRADED.inc(reason=reason)
+        if error is not None:
+            print(f"检索记忆失败，不带记忆继续: {error}")
+        return []
+
+    def get_context_within(self, user_id: str, query: str, limit: int = 5, deadline: float = None):
+        """在截止时间内检索记忆，超时或失败时返回空列表"""
+        future = self._executor.submit(self.get_context, user_id, query, limit)
+        try:
+            return future.result(timeout=deadline or config.CONTEXT_DEADLINE)
+        except resilience.TIMEOUT_ERRORS:
+            return self._degraded("timeout")
+        except Exception as e:
+            return self._degraded("error", e)
+
+    async def aget_context_within(self, user_id: str, query: str, limit: int = 5, deadline: float = None):
+        """异步版 get_context_within；超时后后台检索继续完成，结果仍会写入结果缓存"""
+        try:
+            return await asyncio.wait_for(
+                self.aget_context(user_id, query, limit),
+                deadline or config.CONTEXT_DEADLINE
+            )
+        except resilience.TIMEOUT_ERRORS:
+            return self._degraded("timeout")
+        except Exception as e:
+            return self._degraded("error", e)
+
+    def prefetch_query_embeddings(self, queries: list):
+        """用一次批量向量化调用算出全部查询向量，写入查询向量缓存"""
+        if self.embedding_cache is None or not queries:
+            return
+        with metrics.stage_timer("embedding_batch"):
+            self.memory.embedding_model.embed_batch(list(dict.fromkeys(queries)))
+
+    async def asearch_many(self, items: list, limit: int = 5, concurrency: int = None) -> list:
+        """批量检索 [(user_id, query), ...]，结果与输入一一对应
+
+        先批量向量化全部查询，随后的逐条检索直接命中查询向量缓存；检索并发数受
+        concurrency 限制。单条失败时对应位置返回异常对象，不影响其他条目。
+        """
+        try:
+            await self._run_in_executor(self.prefetch_query_embeddings, [query for _, query in items])
+        except Exception as e:
+            # 批量向量化失败时退回逐条检索，由各条目自行报告错误
+            print(f"批量向量化失败: {e}")
+        semaphore = asyncio.Semaphore(concurrency or config.MEMORY_WORKERS)
+
+        async def search(user_id, query):
+            async with semaphore:
+                return await self.aget_context_within(user_id, query, limit)
+
+        return await asyncio.gather(
+            *(search(user_id, query) for user_id, query in items),
+            return_exceptions=True
+        )
+
     def get_all_memories(self, user_id: str):
         """获取用户的所有记忆"""
-        all_memories = self.memory.get_all(user_id=user_id)
-        # mem0 返回格式: {'results': [...]}
-        return all_memories.get('results', [])
+        def load():
+            with partition_scope(user_id):
+                all_memories = self.memory.get_all(user_id=user_id)
+            # mem0 返回格式: {'results': [...]}
+            return all_memories.get('results', [])
+        return self._cached(user_id, ("all",), load)
+
+    async def aget_all_memories(self, user_id: str):
+        """异步获取用户的所有记忆"""
+        return await self._run_in_executor(self.get_all_memories, user_id)
+
+    @staticmethod
+    def _where(user_id: str, role: str = None, since: float = None, until: float = None) -> dict:
+        conditions = [{"user_id": user_id}]
+        if role:
+            conditions.append({"role": role})
+        if since is not None:
+            conditions.append({"created_ts": {"$gte": since}})
+        if until is not None:
+            conditions.append({"created_ts": {"$lt": until}})
+        return {"$and": conditions} if len(conditions) > 1 else conditions[0]
+
+    def _ensure_created_ts(self, user_id: str, collection):
+        """按时间过滤前确认该用户的记录都有 created_ts，旧版本写入的记录补上（每个用户每个进程检查一次）"""
+        if user_id in self._timestamped_users:
+            return
+        total = len(collection.get(where={"user_id": user_id}, include=[])["ids"])
+        stamped = len(collection.get(where=self._where(user_id, since=0.0), include=[])["ids"])
+        if stamped < total:
+            result = collection.get(where={"user_id": user_id}, include=["metadatas"])
+            missing = [(memory_id, memory_transfer.stamp_created_ts(dict(payload)))
+                       for memory_id, payload in zip(result["ids"], result["metadatas"])
+                       if "created_ts" not in payload]
+            missing = [(memory_id, payload) for memory_id, payload in missing if "created_ts" in payload]
+            if missing:
+                collection.update(ids=[m[0] for m in missing], metadatas=[m[1] for m in missing])
+        self._timestamped_users.add(user_id)
+
+    def count_memories(self, user_id: str, role: str = None) -> int:
+        """记忆条数，只读取 ID，不加载记忆内容"""
+        def load():
+            collection = self.partitions.collection_for(user_id, create=False)
+            if collection is None:
+                return 0
+            return len(collection.get(where=self._where(user_id, role), include=[])["ids"])
+        return self._cached(user_id, ("count", role), load)
 
-    def delete_memory(self, memory_id: str):
+    def list_memories(self, user_id: str, offset: int = 0, limit: int = 20, role: str = None,
+                      since: str = None, until: str = None, newest_first: bool = True) -> dict:
+        """分页读取用户的记忆，只加载当前页
+
+        默认按写入顺序倒序（最新的在前）。role 按角色过滤；since / until 为 ISO 格式的
+        日期或时间（不带时区时按本机时区），按创建时间过滤（[since, until)），格式不对时抛出
+        ValueError。返回 {"memories", "total", "offset", "limit", "next_offset"}，
+        next_offset 为 None 表示没有下一页。
+        """
+        since_ts = memory_transfer.to_timestamp(since) if since else None
+        until_ts = memory_transfer.to_timestamp(until) if until else None
+
+        def load():
+            collection = self.partitions.collection_for(user_id, create=False)
+            where = self._where(user_id, role, since_ts, until_ts)
+            if collection is None:
+                total, rows = 0, []
+            else:
+                if since_ts is None and until_ts is None:
+                    total = self.count_memories(user_id, role)
+                else:
+                    # 时间范围在 Chroma 中按数值的 created_ts 过滤，只读取 ID 计数
+                    self._ensure_created_ts(user_id, collection)
+                    total = len(collection.get(where=where, include=[])["ids"])
+                # 倒序时从末尾换算出 Chroma 的偏移量，仍然只读取一页
+                end = total - offset if newest_first else min(total, offset + limit)
+                start = max(0, end - limit) if newest_first else offset
+                rows = []
+                if end > start:
+                    result = collection.get(where=where, offset=start, limit=end - start, include=["metadatas"])
+                    rows = list(zip(result["ids"], result["metadatas"]))
+                    if newest_first:
+                        rows.reverse()
+            return {
+                "memories": [format_memory(memory_id, payload) for memory_id, payload in rows],
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "next_offset": offset + limit if offset + limit < total else None,
+            }
+        return self._cached(user_id, ("page", offset, limit, role, since, until, newest_first), load)
+
+    async def alist_memories(self, user_id: str, **kwargs) -> dict:
+        """异步分页读取记忆，参数同 list_memories"""
+        return await self._run_in_executor(self.list_memories, user_id, **kwargs)
+
+    async def acount_memories(self, user_id: str, role: str = None) -> int:
+        return await self._run_in_executor(self.count_memories, user_id, role)
+
+    def delete_memory(self, memory_id: str, user_id: str = None):
         """删除指定的记忆"""
         try:
-            self.memory.delete(memory_id)
+            if user_id is None:
+                existing = self.memory.get(memory_id)
+                user_id = existing.get("user_id") if existing else None
+            with partition_scope(user_id):
+                self.memory.delete(memory_id)
             return True
         except Exception as e:
             print(f"删除记忆失败: {e}")
             return False
+        finally:
+            self._invalidate(user_id)
+
+    def delete_memories(self, user_id: str, memory_ids: list) -> int:
+        """批量删除用户的多条记忆，返回实际删除的条数
+
+        一次读取、一次删除，只删除属于该用户的记忆；和 mem0 逐条删除一样写入历史记录。
+        向量库出错时抛出异常，由调用方报告失败。
+        """
+        if not memory_ids:
+            return 0
+        try:
+            collection = self.partitions.collection_for(user_id, create=False)
+            if collection is None:
+                return 0
+            existing = collection.get(ids=list(memory_ids), where={"user_id": user_id}, include=["metadatas"])
+            if existing["ids"]:
+                collection.delete(ids=existing["ids"])
+                if self.rerank_store is not None:
+                    self.rerank_store.delete(existing["ids"])
+                if self.keyword_index is not None:
+                    self.keyword_index.delete(existing["ids"])
+            for memory_id, payload in zip(existing["ids"], existing["metadatas"]):
+                self.memory.db.add_history(
+                    memory_id,
+                    payload.get("data"),
+                    None,
+                    "DELETE",
+                    actor_id=payload.get("actor_id"),
+                    role=payload.get("role"),
+                    is_deleted=1
+                )
+            return len(existing["ids"])
+        finally:
+            self._invalidate(user_id)
+
+    async def adelete_memories(self, user_id: str, memory_ids: list) -> int:
+        return await self._run_in_executor(self.delete_memories, user_id, memory_ids)
 
     def delete_all_memories(self, user_id: str):
         """删除用户的所有记忆"""
         try:
-            self.memory.delete_all(user_id=user_id)
+            # 不使用 mem0 的 delete_all：它只列出前 100 条，删除后还会 reset 重建整个集合，
+            # 未分区时会清空所有用户的记忆。直接读取该用户的全部 ID 批量删除，删空的分区随后移除
+            collection = self.partitions.collection_for(user_id, create=False)
+            ids = collection.get(where={"user_id": user_id}, include=[])["ids"] if collection else []
+            if self.delete_memories(user_id, ids) != len(ids):
+                return False
+            self.partitions.drop_if_empty(user_id)
+            if self.keyword_index is not None:
+                self.keyword_index.delete_user(user_id)
             return True
         except Exception as e:
             print(f"删除所有记忆失败: {e}")
             return False
+        finally:
+            self._invalidate(user_id)
 
-    def export_memories(self, user_id: str) -> str:
-        """导出用户的所有记忆为 JSON 格式"""
-        memories = self.get_all_memories(user_id)
-        export_data = {
-            "user_id": user_id,
-            "export_time": datetime.now().isoformat(),
-            "total_memories": len(memories),
-            "memories": memories
-        }
-        return json.dumps(export_data, ensure_ascii=False, indent=2)
+    def export_memories(self, user_id: str, include_vectors: bool = True):
+        """逐行产出用户记忆的 NDJSON 导出内容，按页读取向量库，内存占用与记忆数无关
+
+        user_id 为 None 时导出全部用户（分区模式下依次读取每个分区）。紧凑模式下向量库中
+        只有降维向量，导出不含向量，导入时重新向量化。
+        """
+        if user_id is None:
+            collections = self.partitions.collections()
+        else:
+            collections = [c for c in [self.partitions.collection_for(user_id, create=False)] if c is not None]
+        return memory_transfer.export_lines(
+            collections,
+            user_id,
+            model=self.embedding_model_name,
+            include_vectors=include_vectors and self.rerank_store is None
+        )
+
+    def _import_collection(self, user_id: str):
+        collection = self.partitions.collection_for(user_id)
+        if self.rerank_store is not None:
+            # 紧凑模式：写入时降维并保存重排向量
+            collection = CompactCollection(collection, self.rerank_store)
+        if self.keyword_index is not None:
+            collection = KeywordIndexedCollection(collection, self.keyword_index)
+        return collection
+
+    def import_memories(self, lines, user_id: str = None) -> dict:
+        """批量导入导出文件中的记忆，不经过 mem0 的事实提取；返回统计信息
+
+        user_id 不为空时全部导入到该用户下。向量模型与导出时相同时复用文件中的向量。
+        """
+        embedder = self.memory.embedding_model
+        if isinstance(embedder, CachedEmbedder):
+            # 导入的文本不会再作为查询出现，不写入查询向量缓存
+            embedder = embedder.embedder
+        importer = memory_transfer.MemoryImporter(
+            self._import_collection,
+            embedder,
+            self.embedding_model_name,
+            user_id=user_id
+        )
+        try:
+            return importer.run(lines)
+        finally:
+            for uid in importer.users:
+                self.usage.record_write(uid)
+                self._invalidate(uid)
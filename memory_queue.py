@@ -0,0 +1,222 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from itertools import groupby
+
+import config
+import metrics
+
+
+class MemoryWriteQueue:
+    """对话记忆的后写队列
+
+    聊天轮次先写入本地 SQLite 日志后立即返回，由后台线程批量写入 mem0。
+    同一用户的用户消息和助手回复合并为一次 memory.add，失败按指数退避重试，
+    进程崩溃后未完成的记录会在租约过期后被重新处理。
+
+    一次领取跨多个用户的一批记录，但一个用户同时只有一批记录在处理，并且总是从该用户
+    最早的未完成记录开始，多个 worker 之间同一用户的写入不会并发或乱序。处理期间定期续租，
+    慢的 mem0 写入不会被其他 worker 重复领取。一组记录中已完成的步骤（事实提取、原文保存）
+    记录在日志中，重试时只执行失败的步骤。
+    """
+
+    def __init__(self, memory_manager, path: str = None, workers: int = None,
+                 batch_size: int = None, max_retries: int = None, lease_seconds: float = None):
+        self.memory_manager = memory_manager
+        self.path = path or config.MEMORY_QUEUE_PATH
+        self.workers = workers or config.MEMORY_QUEUE_WORKERS
+        self.batch_size = batch_size or config.MEMORY_QUEUE_BATCH_SIZE
+        self.max_retries = max_retries or config.MEMORY_QUEUE_MAX_RETRIES
+        self.lease_seconds = lease_seconds or config.MEMORY_QUEUE_LEASE_SECONDS
+
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._init_journal()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_journal(self):
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS memory_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    messages TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    done_steps TEXT NOT NULL DEFAULT ''
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(memory_journal)")}
+            if "done_steps" not in columns:
+                # 旧版本创建的日志
+                conn.execute("ALTER TABLE memory_journal ADD COLUMN done_steps TEXT NOT NULL DEFAULT ''")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_journal_status ON memory_journal (status, next_attempt_at)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_user ON memory_journal (user_id, id)")
+
+    def enqueue_turn(self, user_id: str, user_message: str, assistant_message: str) -> int:
+        """记录一轮对话，写入日志后立即返回记录 ID"""
+        messages = [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_message},
+        ]
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO memory_journal (user_id, messages, created_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(messages, ensure_ascii=False), time.time())
+            )
+            entry_id = cursor.lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        return entry_id
+
+    def pending_count(self) -> int:
+        """日志中尚未写入 mem0 的记录数"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM memory_journal WHERE status != 'failed'"
+            ).fetchone()
+        return row[0]
+
+    def start(self):
+        """启动后台写入线程，同时会接管上次崩溃遗留的记录"""
+        if self._threads:
+            return
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"memory-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim_batch(self, conn):
+        """领取一批到期记录（跨用户，最多 batch_size 条），租约过期的处理中记录视为崩溃遗留
+
+        只领取最早的未完成记录已经到期的用户：该用户有记录正在处理（租约未过期）或在退避中时
+        整个用户跳过。每个用户从最早的记录起连续领取到期、且已完成步骤相同的记录。
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            users = conn.execute("""
+                SELECT j.user_id FROM memory_journal j
+                JOIN (SELECT user_id, MIN(id) AS first_id FROM memory_journal
+                      WHERE status != 'failed' GROUP BY user_id) f ON j.id = f.first_id
+                WHERE (j.status = 'pending' AND j.next_attempt_at <= ?)
+                   OR (j.status = 'processing' AND j.lease_until < ?)
+                ORDER BY j.id LIMIT ?
+            """, (now, now, self.batch_size)).fetchall()
+            rows = []
+            for (user_id,) in users:
+                if len(rows) >= self.batch_size:
+                    break
+                candidates = conn.execute("""
+                    SELECT id, user_id, messages, attempts, done_steps, status, next_attempt_at, lease_until
+                    FROM memory_journal WHERE user_id = ? AND status != 'failed' ORDER BY id LIMIT ?
+                """, (user_id, self.batch_size - len(rows))).fetchall()
+                for row in candidates:
+                    due = (row[5] == "pending" and row[6] <= now) or (row[5] == "processing" and row[7] < now)
+                    if not due or row[4] != candidates[0][4]:
+                        break
+                    rows.append(row[:5])
+            if rows:
+                conn.executemany(
+                    "UPDATE memory_journal SET status = 'processing', lease_until = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows]
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _worker(self):
+        conn = self._connect()
+        try:
+            while not self._stopping:
+                try:
+                    rows = self._claim_batch(conn)
+                except sqlite3.OperationalError as e:
+                    print(f"领取记忆日志失败: {e}")
+                    rows = []
+                if not rows:
+                    with self._wakeup:
+                        self._wakeup.wait(timeout=1.0)
+                    continue
+                self._process(conn, rows)
+        finally:
+            conn.close()
+
+    def _renew_leases(self, ids: list, stop: threading.Event):
+        """处理期间每隔三分之一租约续租一次，直到 stop 被设置"""
+        with closing(self._connect()) as conn:
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    conn.executemany(
+                        "UPDATE memory_journal SET lease_until = ? WHERE id = ? AND status = 'processing'",
+                        [(time.time() + self.lease_seconds, i) for i in ids]
+                    )
+                except sqlite3.OperationalError as e:
+                    print(f"续租记忆日志失败: {e}")
+
+    def _process(self, conn, rows):
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew_leases, args=([row[0] for row in rows], stop),
+                                   name="memory-queue-lease", daemon=True)
+        renewer.start()
+        try:
+            # 领取时每个用户的记录是连续的一组，同一用户的多轮对话合并为一次 mem0 写入
+            for user_id, group in groupby(rows, key=lambda r: r[1]):
+                self._process_user(conn, user_id, list(group))
+        finally:
+            stop.set()
+            renewer.join()
+
+    def _process_user(self, conn, user_id: str, group: list):
+        messages = []
+        for row in group:
+            messages.extend(json.loads(row[2]))
+        done = set(filter(None, group[0][4].split(",")))
+        try:
+            self.memory_manager.add_messages(user_id, messages, done)
+            conn.executemany("DELETE FROM memory_journal WHERE id = ?", [(row[0],) for row in group])
+        except Exception as e:
+            print(f"写入记忆失败，稍后重试: {e}")
+            self._mark_failed(conn, group, str(e), done)
+
+    def _mark_failed(self, conn, group, error: str, done: set):
+        now = time.time()
+        done_steps = ",".join(sorted(done))
+        updates = []
+        for row_id, _, _, attempts, _ in group:
+            attempts += 1
+            status = "failed" if attempts >= self.max_retries else "pending"
+            if status == "pending":
+                metrics.UPSTREAM_RETRIES.inc(upstream="mem0")
+            delay = min(2 ** attempts, 300)
+            updates.append((status, attempts, now + delay, error, done_steps, row_id))
+        conn.executemany("""
+            UPDATE memory_journal
+            SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, done_steps = ?, lease_until = 0
+            WHERE id = ?
+        """, updates)
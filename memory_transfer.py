@@ -0,0 +1,231 @@
+"""记忆的流式导出和批量导入
+
+导出格式为 NDJSON：第一行是 header（格式版本、向量模型名、维度），之后每行一条记忆，
+包含 ID、Chroma 中的原始元数据和可选的向量（float32 小端序的 base64）。导出按页读取
+Chroma，内存占用与记忆总数无关，可以再经 gzip 流式压缩。
+
+导入直接写入向量库，不经过 mem0 的事实提取。向量模型名与当前一致时复用文件中的向量，
+否则按批重新向量化。记录按用户分配到固定的工作线程：不同用户并行导入，同一用户的
+记录保持原有顺序（分页浏览依赖写入顺序）。
+"""
+import base64
+import json
+import queue
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+import config
+from embedding_cache import embed_many
+
+FORMAT_VERSION = 1
+
+
+def to_timestamp(value: str) -> float:
+    """ISO 日期或时间转换为 Unix 时间戳；不带时区时按本机时区，ValueError 表示格式不对"""
+    return datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
+
+
+def stamp_created_ts(payload: dict) -> dict:
+    """按 created_at 补上数值的 created_ts，供 Chroma 按时间范围过滤（字符串不能比较大小）"""
+    try:
+        payload["created_ts"] = to_timestamp(payload["created_at"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    return payload
+
+
+def encode_vector(vector) -> str:
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_vector(text: str) -> list:
+    return np.frombuffer(base64.b64decode(text), dtype="<f4").tolist()
+
+
+def export_lines(collection, user_id: str = None, model: str = None, include_vectors: bool = True,
+                 page_size: int = None):
+    """逐行产出导出内容（每行以换行结尾）；user_id 为 None 时导出整个集合
+
+    collection 可以是一个集合，也可以是集合列表（分区模式下依次导出每个分区）。
+    """
+    page_size = page_size or config.EXPORT_PAGE_SIZE
+    where = {"user_id": user_id} if user_id else None
+    include = ["metadatas", "embeddings"] if include_vectors else ["metadatas"]
+    header = {
+        "type": "header",
+        "version": FORMAT_VERSION,
+        "user_id": user_id,
+        "export_time": datetime.now().isoformat(),
+        "embedding_model": model if include_vectors else None,
+    }
+    yield json.dumps(header, ensure_ascii=False) + "\n"
+
+    for source in collection if isinstance(collection, (list, tuple)) else [collection]:
+        offset = 0
+        while True:
+            page = source.get(where=where, offset=offset, limit=page_size, include=include)
+            if not page["ids"]:
+                break
+            embeddings = page["embeddings"] if include_vectors else None
+            for i, memory_id in enumerate(page["ids"]):
+                record = {"type": "memory", "id": memory_id, "payload": page["metadatas"][i]}
+                if embeddings is not None:
+                    record["embedding"] = encode_vector(embeddings[i])
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+            offset += len(page["ids"])
+
+
+def gzip_chunks(lines, level: int = 6):
+    """把文本行流式压缩为 gzip 数据块"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= 256 * 1024:
+            chunk = compressor.compress(b"".join(buffer))
+            buffer, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b"".join(buffer)) + compressor.flush()
+
+
+def iter_lines(chunks):
+    """把字节块（NDJSON，可以是 gzip 压缩的）拆成文本行，自动识别 gzip"""
+    decompressor = None
+    pending = b""
+    first = True
+    for chunk in chunks:
+        if first and chunk:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(47)
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8")
+    if decompressor is not None:
+        pending += decompressor.flush()
+    for line in pending.split(b"\n"):
+        if line.strip():
+            yield line.decode("utf-8")
+
+
+class MemoryImporter:
+    """把导出的记录批量写入 Chroma 集合
+
+    collection 为目标集合，或按 user_id 返回目标集合的函数（分区模式），embedder 用于重新向量化（应绕过查询向量缓存），model 为当前
+    向量模型名。指定 user_id 时把全部记录导入到该用户下，并按原 ID 派生新 ID，避免覆盖
+    原用户的记录；重复导入同一文件是幂等的。
+    """
+
+    def __init__(self, collection, embedder, model: str, user_id: str = None,
+                 batch_size: int = None, workers: int = None):
+        # 统一成按用户取集合的函数，未分区时所有用户写入同一个集合
+        self.collection_for = collection if callable(collection) else (lambda user_id: collection)
+        self.embedder = embedder
+        self.model = model
+        self.user_id = user_id
+        self.batch_size = batch_size or config.IMPORT_BATCH_SIZE
+        self.workers = workers or config.IMPORT_WORKERS
+
+        self._lock = threading.Lock()
+        self.stats = {"imported": 0, "reused_embeddings": 0, "embedded": 0, "skipped": 0, "users": 0}
+        self.users = set()
+
+    def _prepare(self, record: dict, reuse: bool):
+        payload = dict(record["payload"])
+        memory_id = record["id"]
+        if self.user_id:
+            memory_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.user_id}:{memory_id}"))
+            payload["user_id"] = self.user_id
+        stamp_created_ts(payload)
+        vector = decode_vector(record["embedding"]) if reuse and record.get("embedding") else None
+        return memory_id, payload, vector
+
+    def _write(self, batch: list):
+        texts = [payload.get("data", "") for _, payload, vector in batch if vector is None]
+        fresh = iter(embed_many(self.embedder, texts)) if texts else iter(())
+        ids, vectors, payloads = [], [], []
+        for memory_id, payload, vector in batch:
+            ids.append(memory_id)
+            vectors.append(vector if vector is not None else next(fresh))
+            payloads.append(payload)
+        # 同一批记录属于同一个用户
+        collection = self.collection_for(batch[0][1].get("user_id", ""))
+        collection.upsert(ids=ids, embeddings=vectors, metadatas=payloads)
+        with self._lock:
+            self.stats["imported"] += len(batch)
+            self.stats["embedded"] += len(texts)
+            self.stats["reused_embeddings"] += len(batch) - len(texts)
+
+    def _worker(self, tasks: queue.Queue, errors: list):
+        while True:
+            batch = tasks.get()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            except Exception as e:
+                # 出错后继续消费队列，避免读取线程阻塞在已满的队列上
+                errors.append(e)
+
+    def run(self, lines) -> dict:
+        """导入全部行，返回统计信息；lines 为 iter_lines 产出的文本行"""
+        start = time.perf_counter()
+        lines = iter(lines)
+        header = json.loads(next(lines, "{}"))
+        if header.get("type") != "header" or header.get("version") != FORMAT_VERSION:
+            raise ValueError("不是有效的记忆导出文件")
+        # 模型相同才复用文件中的向量，否则所有记录重新向量化
+        reuse = bool(header.get("embedding_model")) and header["embedding_model"] == self.model
+
+        # 每个工作线程一个有界队列：同一用户总是进入同一队列，读取速度受写入速度约束
+        queues = [queue.Queue(maxsize=2) for _ in range(self.workers)]
+        errors = []
+        threads = [
+            threading.Thread(target=self._worker, args=(q, errors), name=f"import-{i}", daemon=True)
+            for i, q in enumerate(queues)
+        ]
+        for thread in threads:
+            thread.start()
+
+        buffers = {}
+        try:
+            for line in lines:
+                record = json.loads(line)
+                if record.get("type") != "memory" or not record.get("payload", {}).get("data"):
+                    self.stats["skipped"] += 1
+                    continue
+                memory_id, payload, vector = self._prepare(record, reuse)
+                user = payload.get("user_id", "")
+                self.users.add(user)
+                buffer = buffers.setdefault(user, [])
+                buffer.append((memory_id, payload, vector))
+                if len(buffer) >= self.batch_size:
+                    queues[hash(user) % self.workers].put(buffers.pop(user))
+                if errors:
+                    break
+            for user, buffer in buffers.items():
+                queues[hash(user) % self.workers].put(buffer)
+        finally:
+            for q in queues:
+                q.put(None)
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        self.stats["users"] = len(self.users)
+        self.stats["seconds"] = round(time.perf_counter() - start, 3)
+        return dict(self.stats)
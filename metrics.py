@@ -0,0 +1,201 @@
+"""进程内指标，按 Prometheus 文本格式导出
+
+只实现本项目用到的 Counter / Gauge / Histogram，避免引入 prometheus_client 依赖。
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, func, **labels):
+        """导出时调用 func 取值，适合队列长度这类现算的指标"""
+        with self._lock:
+            self._functions[self._key(labels)] = func
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                items.append((key, func()))
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            items = [(k, dict(v, counts=list(v["counts"]))) for k, v in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+def render() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("chat_stage_seconds", "对话各阶段耗时（秒）", ("stage",))
+TTFT_SECONDS = Histogram("chat_ttft_seconds", "流式输出首 token 时间（秒）")
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "上游调用失败次数", ("upstream",))
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "上游调用重试次数", ("upstream",))
+CACHE_REQUESTS = Counter("cache_requests_total", "缓存查询次数", ("cache", "result"))
+PROMPT_TOKENS = Counter("prompt_context_tokens_total", "提示词中记忆和历史的 token 数", ("kind",))
+QUEUE_DEPTH = Gauge("queue_depth", "队列中等待处理的条目数", ("queue",))
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "等待上游调用许可的请求数", ("upstream",))
+ADMISSION_WAIT_SECONDS = Histogram("admission_wait_seconds", "获得上游调用许可前的等待时间（秒）", ("upstream",))
+ADMISSION_REJECTED = Counter("admission_rejected_total", "准入被拒绝的次数", ("upstream", "reason"))
+HEDGED_REQUESTS = Counter("upstream_hedged_requests_total", "对冲请求次数（sent：已发出，won：先于原请求返回）",
+                          ("upstream", "result"))
+RETRY_BUDGET_EXHAUSTED = Counter("retry_budget_exhausted_total", "重试预算耗尽而放弃重试的次数", ("upstream",))
+CONTEXT_DEGRADED = Counter("chat_context_degraded_total", "记忆检索超时或失败、不带记忆继续的次数", ("reason",))
+MEMORY_RETRIEVALS = Counter("memory_retrievals_total",
+                            "记忆检索次数（vector / hybrid / keyword / keyword_fast：关键词快速路径，未向量化）", ("path",))
+MEMORY_FILTER_DECISIONS = Counter("memory_filter_decisions_total", "记忆写入预筛选的判断结果（extract/raw/drop）",
+                                  ("role", "decision"))
+MEMORY_EXTRACTION_SKIPPED = Counter("memory_extraction_skipped_total", "预筛选后不需要 LLM 事实提取、省下的 mem0 提取调用次数")
+MEMORY_CONSOLIDATION = Counter("memory_consolidation_removed_total",
+                               "记忆整理减少的条数（duplicate：去重，merge：合并，evict：超出上限淘汰）", ("action",))
+
+
+@contextmanager
+def stage_timer(stage: str, timings: dict = None):
+    """记录一个阶段的耗时到直方图，同时写入本次请求的 timings 字典"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = elapsed
+
+
+@contextmanager
+def upstream_call(upstream: str, stage: str, timings: dict = None):
+    """一次上游调用：记录阶段耗时，失败时累计错误次数"""
+    try:
+        with stage_timer(stage, timings):
+            yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream=upstream)
+        raise
@@ -0,0 +1,279 @@
+"""按用户分区的向量集合
+
+默认（VECTOR_PARTITIONING=none）所有用户的记忆都在同一个 Chroma 集合中，只靠 user_id
+元数据过滤区分，检索耗时随全部用户的记忆总量增长。分区模式把记忆拆到多个集合：
+
+- user：每个用户一个集合，检索只扫描该用户自己的记忆
+- hash：按 user_id 的 CRC32 分到 VECTOR_PARTITION_BUCKETS 个集合，集合数有上限，
+  适合用户数很多、每个用户记忆很少的场景
+
+PartitionRouter 负责把用户映射到集合名，并用 LRU 缓存集合句柄；PartitionedChromaDB
+替换 mem0 的 ChromaDB 向量库，按每次调用中的 user_id 路由。mem0 按 ID 读取、更新、删除
+记忆时不带 user_id（而且可能在它自己的线程池里调用），依次按以下方式定位分区：
+partition_scope 标记的当前用户、最近读写过的 ID 所在分区、逐个分区查找。
+
+已有的单集合数据用 scripts/migrate_partitions.py 在线迁移。
+"""
+import contextlib
+import contextvars
+import hashlib
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import config
+
+# 当前调用所属的用户，用于定位不带 user_id 的按 ID 操作
+current_partition_user = contextvars.ContextVar("current_partition_user", default=None)
+
+MODES = ("none", "user", "hash")
+
+
+@contextlib.contextmanager
+def partition_scope(user_id: str):
+    """标记当前线程中的向量库操作属于哪个用户"""
+    token = current_partition_user.set(user_id)
+    try:
+        yield
+    finally:
+        current_partition_user.reset(token)
+
+
+class PartitionRouter:
+    """把用户映射到分区集合，缓存集合句柄
+
+    mode 为 none 时所有用户都映射到 base_name 集合，行为与未分区时完全相同。
+    """
+
+    def __init__(self, client, base_name: str, mode: str = None, buckets: int = None,
+                 cache_size: int = None, id_cache_size: int = None):
+        self.client = client
+        self.base_name = base_name
+        self.mode = (mode or config.VECTOR_PARTITIONING).lower()
+        if self.mode not in MODES:
+            raise ValueError(f"未知的 VECTOR_PARTITIONING: {self.mode}")
+        self.buckets = buckets or config.VECTOR_PARTITION_BUCKETS
+        self.cache_size = cache_size or config.PARTITION_HANDLE_CACHE_SIZE
+        self.id_cache_size = id_cache_size or config.PARTITION_ID_CACHE_SIZE
+
+        self._lock = threading.Lock()
+        self._handles = OrderedDict()
+        # 记忆 ID -> 集合名，mem0 按 ID 更新 / 删除前总会先检索或读取到这条记忆
+        self._locations = OrderedDict()
+        self._pattern = re.compile(
+            rf"^{re.escape(base_name)}_(u_[A-Za-z0-9_-]*[0-9a-f]{{12}}|h\d{{4}})$"
+        )
+
+    @property
+    def partitioned(self) -> bool:
+        return self.mode != "none"
+
+    def name_for(self, user_id: str) -> str:
+        """用户对应的集合名"""
+        if self.mode == "none":
+            return self.base_name
+        user_id = user_id or ""
+        if self.mode == "hash":
+            return f"{self.base_name}_h{zlib.crc32(user_id.encode('utf-8')) % self.buckets:04d}"
+        # Chroma 的集合名只允许字母、数字、._-，保留一段可读前缀，再用摘要保证唯一
+        readable = re.sub(r"[^A-Za-z0-9_-]", "-", user_id)[:32]
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:12]
+        return f"{self.base_name}_u_{readable}_{digest}"
+
+    def is_partition(self, name: str) -> bool:
+        return bool(self._pattern.match(name))
+
+    def _handle(self, name: str, create: bool):
+        with self._lock:
+            collection = self._handles.get(name)
+            if collection is not None:
+                self._handles.move_to_end(name)
+                return collection
+        if create:
+            collection = self.client.get_or_create_collection(name)
+        else:
+            try:
+                collection = self.client.get_collection(name)
+            except Exception:
+                # 集合不存在：该用户还没有记忆，读操作直接返回空结果，不创建空集合
+                return None
+        with self._lock:
+            self._handles[name] = collection
+            self._handles.move_to_end(name)
+            while len(self._handles) > self.cache_size:
+                self._handles.popitem(last=False)
+        return collection
+
+    def collection_for(self, user_id: str, create: bool = True):
+        """用户所在的集合；create 为 False 且集合不存在时返回 None"""
+        return self._handle(self.name_for(user_id), create)
+
+    def collections(self) -> list:
+        """全部分区集合（未分区时只有基础集合），按名称排序"""
+        if not self.partitioned:
+            collection = self._handle(self.base_name, create=False)
+            return [collection] if collection is not None else []
+        names = sorted(c.name for c in self.client.list_collections() if self.is_partition(c.name))
+        return [c for c in (self._handle(name, create=False) for name in names) if c is not None]
+
+    def forget(self, name: str):
+        with self._lock:
+            self._handles.pop(name, None)
+
+    def drop_if_empty(self, user_id: str) -> bool:
+        """按用户分区时删除该用户已经没有记录的集合"""
+        if self.mode != "user":
+            return False
+        collection = self.collection_for(user_id, create=False)
+        if collection is None or collection.count():
+            return False
+        self.client.delete_collection(name=collection.name)
+        self.forget(collection.name)
+        return True
+
+    def remember(self, ids, collection):
+        """记录这些 ID 所在的集合"""
+        if not self.partitioned or not ids:
+            return
+        with self._lock:
+            for memory_id in ids:
+                self._locations[memory_id] = collection.name
+                self._locations.move_to_end(memory_id)
+            while len(self._locations) > self.id_cache_size:
+                self._locations.popitem(last=False)
+
+    def locate(self, memory_id: str):
+        """查找记忆所在的集合，找不到时返回 None"""
+        if not self.partitioned:
+            return self.collection_for(None)
+        user_id = current_partition_user.get()
+        if user_id is not None:
+            collection = self.collection_for(user_id, create=False)
+            if collection is not None and collection.get(ids=[memory_id], include=[])["ids"]:
+                return collection
+        with self._lock:
+            name = self._locations.get(memory_id)
+        if name is not None:
+            collection = self._handle(name, create=False)
+            if collection is not None:
+                return collection
+        # 兜底：逐个分区查找（只读取 ID）
+        for collection in self.collections():
+            if collection.get(ids=[memory_id], include=[])["ids"]:
+                self.remember([memory_id], collection)
+                return collection
+        return None
+
+    def warmup(self):
+        """打开基础集合；分区模式下列出一次全部分区"""
+        if self.partitioned:
+            return len(self.collections())
+        return self.collection_for(None).count()
+
+
+class PartitionedChromaDB:
+    """按 user_id 路由的 mem0 向量库，接口与 mem0 的 ChromaDB 相同
+
+    base 为 mem0 创建的 ChromaDB 实例，复用它的结果解析和过滤条件转换。
+    """
+
+    def __init__(self, base, router: PartitionRouter):
+        self.base = base
+        self.router = router
+        self.client = base.client
+        self.collection_name = base.collection_name
+
+    @staticmethod
+    def _user(filters: dict):
+        return (filters or {}).get("user_id")
+
+    def insert(self, vectors: list, payloads: list = None, ids: list = None):
+        payloads = payloads or [{} for _ in vectors]
+        groups = OrderedDict()
+        for i, payload in enumerate(payloads):
+            groups.setdefault(payload.get("user_id") or current_partition_user.get(), []).append(i)
+        for user_id, indexes in groups.items():
+            collection = self.router.collection_for(user_id)
+            group_ids = [ids[i] for i in indexes]
+            collection.add(
+                ids=group_ids,
+                embeddings=[vectors[i] for i in indexes],
+                metadatas=[payloads[i] for i in indexes]
+            )
+            self.router.remember(group_ids, collection)
+
+    def search(self, query: str, vectors: list, limit: int = 5, filters: dict = None) -> list:
+        where = self.base._generate_where_clause(filters) if filters else None
+        user_id = self._user(filters)
+        if user_id is not None:
+            collection = self.router.collection_for(user_id, create=False)
+            collections = [collection] if collection is not None else []
+        else:
+            # 没有 user_id 时（例如只按 agent_id 过滤）检索全部分区再按距离合并
+            collections = self.router.collections()
+        results = []
+        for collection in collections:
+            output = self.base._parse_output(
+                collection.query(query_embeddings=vectors, where=where, n_results=limit)
+            )
+            self.router.remember([item.id for item in output], collection)
+            results.extend(output)
+        results.sort(key=lambda item: item.score if item.score is not None else float("inf"))
+        return results[:limit]
+
+    def get(self, vector_id: str):
+        collection = self.router.locate(vector_id)
+        if collection is None:
+            return None
+        output = self.base._parse_output(collection.get(ids=[vector_id]))
+        return output[0] if output else None
+
+    def update(self, vector_id: str, vector: list = None, payload: dict = None):
+        collection = self.router.locate(vector_id)
+        if collection is None:
+            raise ValueError(f"记忆 {vector_id} 不存在")
+        collection.update(ids=vector_id, embeddings=vector, metadatas=payload)
+
+    def delete(self, vector_id: str):
+        collection = self.router.locate(vector_id)
+        if collection is not None:
+            collection.delete(ids=vector_id)
+
+    def list(self, filters: dict = None, limit: int = 100) -> list:
+        where = self.base._generate_where_clause(filters) if filters else None
+        user_id = self._user(filters)
+        if user_id is not None:
+            collection = self.router.collection_for(user_id, create=False)
+            collections = [collection] if collection is not None else []
+        else:
+            collections = self.router.collections()
+        results = []
+        for collection in collections:
+            if limit is not None and len(results) >= limit:
+                break
+            output = self.base._parse_output(collection.get(
+                where=where, limit=None if limit is None else limit - len(results)
+            ))
+            self.router.remember([item.id for item in output], collection)
+            results.extend(output)
+        return [results]
+
+    def list_cols(self) -> list:
+        return self.router.collections()
+
+    def col_info(self):
+        return self.client.get_collection(name=self.collection_name)
+
+    def delete_col(self):
+        """删除全部分区集合（基础集合由 mem0 自己管理）"""
+        for collection in self.router.collections():
+            self.client.delete_collection(name=collection.name)
+            self.router.forget(collection.name)
+
+    def reset(self):
+        """mem0 的 delete_all 删除某个用户的记录后会调用 reset 重建整个集合，
+        分区模式下只清理当前用户已经为空的分区，不影响其他用户"""
+        user_id = current_partition_user.get()
+        if user_id is not None:
+            self.router.drop_if_empty(user_id)
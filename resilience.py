@@ -0,0 +1,272 @@
+"""上游调用的超时、重试和对冲请求
+
+- retry / aretry：失败按指数退避（带抖动）重试，只重试超时、连接错误和 408/429/5xx。
+  所有重试共享一个重试预算：最近一段时间内的重试数不超过请求数的一定比例，上游整体
+  故障时重试不会把流量放大数倍。
+- astream / stream：流式调用在输出第一个分片之前失败可以重试，开始输出后不再重试。
+- hedged：幂等调用（向量化、记忆检索）等待超过该上游最近延迟的分位数后再发一份相同的
+  请求，取先成功的结果。对冲请求同样消耗重试预算。
+
+同步调用的单次超时由客户端自身设置（见 MemoryManager），异步调用用 asyncio.wait_for。
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import admission
+import config
+import metrics
+
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+# Python 3.10 中 asyncio 和 concurrent.futures 的超时异常还不是内置 TimeoutError 的别名
+TIMEOUT_ERRORS = (TimeoutError, concurrent.futures.TimeoutError, asyncio.TimeoutError)
+
+
+def is_retryable(error: Exception) -> bool:
+    """超时、连接错误和服务端过载可以重试；本地准入拒绝和请求本身的错误不重试"""
+    # 调用到这里时上游客户端已导入这两个库，放在函数内避免拖慢启动
+    import httpx
+    import openai
+
+    if isinstance(error, admission.AdmissionRejected):
+        return False
+    if isinstance(error, TIMEOUT_ERRORS + (ConnectionError, httpx.TimeoutException,
+                                           httpx.NetworkError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def backoff(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间：指数增长、有上限、全抖动"""
+    return random.uniform(0, min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class RetryBudget:
+    """滑动窗口内的重试预算：允许的重试数 = 请求数 × ratio + 每秒保底 × 窗口长度"""
+
+    def __init__(self, ratio: float, min_per_second: float, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._lock = threading.Lock()
+        self._requests = deque()
+        self._retries = deque()
+
+    def _prune(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            allowed = len(self._requests) * self.ratio + self.min_per_second * self.window
+            if len(self._retries) >= allowed:
+                return False
+            self._retries.append(now)
+            return True
+
+
+class LatencyTracker:
+    """最近若干次成功调用的耗时，用于计算对冲延迟"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float):
+        """样本不足时返回 None"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+budget = RetryBudget(config.RETRY_BUDGET_RATIO, config.RETRY_BUDGET_MIN_PER_SECOND)
+
+_lock = threading.Lock()
+_trackers = {}
+_pools = {}
+
+
+def latency(upstream: str) -> LatencyTracker:
+    tracker = _trackers.get(upstream)
+    if tracker is None:
+        with _lock:
+            tracker = _trackers.setdefault(upstream, LatencyTracker())
+    return tracker
+
+
+def _pool(upstream: str) -> ThreadPoolExecutor:
+    # 每个上游一个线程池：记忆检索内部的向量化也会对冲，共用线程池可能互相等待而死锁
+    pool = _pools.get(upstream)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(upstream)
+            if pool is None:
+                pool = _pools[upstream] = ThreadPoolExecutor(
+                    max_workers=config.HEDGE_WORKERS,
+                    thread_name_prefix=f"hedge-{upstream}"
+                )
+    return pool
+
+
+def _should_retry(upstream: str, error: Exception, attempt: int, attempts: int) -> bool:
+    if attempt + 1 >= attempts or not is_retryable(error):
+        return False
+    if not budget.try_spend():
+        metrics.RETRY_BUDGET_EXHAUSTED.inc(upstream=upstream)
+        return False
+    metrics.UPSTREAM_RETRIES.inc(upstream=upstream)
+    return True
+
+
+def retry(upstream: str, func, attempts: int = None):
+    """同步调用 func()，可重试的错误按指数退避重试"""
+    attempts = attempts or config.RETRY_MAX_ATTEMPTS
+    budget.record_request()
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if not _should_retry(upstream, e, attempt, attempts):
+                raise
+            time.sleep(backoff(attempt))
+
+
+async def aretry(upstream: str, factory, timeout: float = None, attempts: int = None):
+    """异步调用 factory() 返回的协程，每次尝试最多等待 timeout 秒"""
+    attempts = attempts or config.RETRY_MAX_ATTEMPTS
+    budget.record_request()
+    for attempt in range(attempts):
+        try:
+            return await asyncio.wait_for(factory(), timeout)
+        except Exception as e:
+            if not _should_retry(upstream, e, attempt, attempts):
+                raise
+            await asyncio.sleep(backoff(attempt))
+
+
+async def astream(upstream: str, factory, first_timeout: float = None,
+                  idle_timeout: float = None, attempts: int = None):
+    """逐个产出 factory() 返回的异步流的分片
+
+    第一个分片之前的失败和超时可以重试；开始输出后只检查分片间隔，超时直接报错。
+    """
+    attempts = attempts or config.RETRY_MAX_ATTEMPTS
+    budget.record_request()
+    for attempt in range(attempts):
+        stream = factory()
+        started = False
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        stream.__anext__(), idle_timeout if started else first_timeout
+                    )
+                except StopAsyncIteration:
+                    return
+                started = True
+                yield chunk
+        except Exception as e:
+            if started or not _should_retry(upstream, e, attempt, attempts):
+                raise
+        finally:
+            await stream.aclose()
+        await asyncio.sleep(backoff(attempt))
+
+
+def stream(upstream: str, factory, attempts: int = None):
+    """同步版 astream：第一个分片之前失败可以重试，超时由客户端设置"""
+    attempts = attempts or config.RETRY_MAX_ATTEMPTS
+    budget.record_request()
+    for attempt in range(attempts):
+        started = False
+        try:
+            for chunk in factory():
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or not _should_retry(upstream, e, attempt, attempts):
+                raise
+        time.sleep(backoff(attempt))
+
+
+def hedged(upstream: str, func):
+    """调用幂等的 func()；超过最近延迟的 HEDGE_QUANTILE 分位数仍未返回时再发一份，取先成功的结果"""
+    tracker = latency(upstream)
+    delay = tracker.quantile(config.HEDGE_QUANTILE) if config.HEDGE_ENABLED else None
+
+    def attempt():
+        start = time.perf_counter()
+        result = func()
+        tracker.record(time.perf_counter() - start)
+        return result
+
+    if delay is None:
+        return attempt()
+
+    # 在线程池中执行时保留当前用户等上下文变量
+    pool = _pool(upstream)
+    primary = pool.submit(contextvars.copy_context().run, attempt)
+    done, _ = wait([primary], timeout=max(delay, config.HEDGE_MIN_DELAY))
+    if done or not budget.try_spend():
+        return primary.result()
+
+    metrics.HEDGED_REQUESTS.inc(upstream=upstream, result="sent")
+    backup = pool.submit(contextvars.copy_context().run, attempt)
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    metrics.HEDGED_REQUESTS.inc(upstream=upstream, result="won")
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def idempotent(upstream: str, func, attempts: int = None):
+    """幂等调用：每次尝试都可对冲，失败后重试"""
+    return retry(upstream, lambda: hedged(upstream, func), attempts)
+
+
+class ResilientEmbedder:
+    """远程 embedder 的包装：单条向量化可对冲并重试，批量向量化只重试"""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.config = embedder.config
+
+    def embed(self, text, memory_action=None):
+        return idempotent("embedding", lambda: self.embedder.embed(text, memory_action))
+
+    def embed_batch(self, texts: list) -> list:
+        return retry("embedding", lambda: self.embedder.embed_batch(texts))
+
+    def __getattr__(self, name):
+        return getattr(self.embedder, name)
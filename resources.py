@@ -0,0 +1,173 @@
+"""进程级共享资源
+
+所有 Streamlit 会话和 API 请求共用同一个 MemoryManager（同一个 mem0 实例、
+Chroma 客户端和 OpenAI 兼容的连接池）和同一个 LLM 客户端（请求通过共享的 httpx 连接池
+发送，见 zhipu_client）。会话级的参数（例如 temperature）在每次调用时传入，不修改共享对象。
+
+mem0、chromadb、langchain 等依赖导入很慢，只在首次获取对应资源时导入，导入本模块
+本身几乎没有开销。warmup 在启动阶段提前创建全部资源，完成后进程才算就绪。
+"""
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING
+
+import config
+
+if TYPE_CHECKING:
+    from consolidation import MemoryConsolidator
+    from memory_manager import MemoryManager
+    from memory_queue import MemoryWriteQueue
+    from response_cache import ResponseCache
+    from zhipu_client import SharedClientChatZhipuAI
+
+_lock = threading.Lock()
+_memory_manager = None
+_memory_queue = None
+_response_cache = None
+_consolidator = None
+_llms = {}
+
+
+def get_memory_manager() -> "MemoryManager":
+    global _memory_manager
+    if _memory_manager is None:
+        with _lock:
+            if _memory_manager is None:
+                from memory_manager import MemoryManager
+                _memory_manager = MemoryManager()
+    return _memory_manager
+
+
+def get_memory_queue() -> "MemoryWriteQueue":
+    """共享的记忆后写队列，首次获取时启动后台线程"""
+    global _memory_queue
+    if _memory_queue is None:
+        memory_manager = get_memory_manager()
+        with _lock:
+            if _memory_queue is None:
+                from memory_queue import MemoryWriteQueue
+                queue = MemoryWriteQueue(memory_manager)
+                queue.start()
+                _memory_queue = queue
+    return _memory_queue
+
+
+def memory_queue_depth() -> int:
+    """后写队列中待处理的记录数，队列尚未创建时为 0"""
+    return _memory_queue.pending_count() if _memory_queue is not None else 0
+
+
+def get_response_cache() -> "ResponseCache":
+    """共享的语义响应缓存，与记忆检索共用向量化模型和查询向量缓存"""
+    global _response_cache
+    if _response_cache is None:
+        memory_manager = get_memory_manager()
+        with _lock:
+            if _response_cache is None:
+                from response_cache import ResponseCache
+                _response_cache = ResponseCache(memory_manager.memory.embedding_model)
+    return _response_cache
+
+
+def get_consolidator() -> "MemoryConsolidator":
+    """共享的记忆整理任务，CONSOLIDATION_ENABLED 时首次获取即启动后台线程"""
+    global _consolidator
+    if _consolidator is None:
+        memory_manager = get_memory_manager()
+        with _lock:
+            if _consolidator is None:
+                from consolidation import MemoryConsolidator
+                consolidator = MemoryConsolidator(memory_manager)
+                if config.CONSOLIDATION_ENABLED:
+                    consolidator.start()
+                _consolidator = consolidator
+    return _consolidator
+
+
+def get_llm(model: str = "glm-4-flash") -> "SharedClientChatZhipuAI":
+    """按模型名共享 LLM 客户端，所有模型共用同一个 HTTP 连接池，temperature 等参数请在调用时传入"""
+    llm = _llms.get(model)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(model)
+            if llm is None:
+                config.validate()
+                from zhipu_client import SharedClientChatZhipuAI
+                llm = SharedClientChatZhipuAI(
+                    model=model,
+                    api_key=config.ZHIPU_API_KEY,
+                    api_base=config.ZHIPU_BASE_URL.rstrip("/") + "/chat/completions",
+                    temperature=0.7,
+                )
+                _llms[model] = llm
+    return llm
+
+
+async def aget(getter):
+    """在事件循环中获取资源：预热完成前放到线程中获取，导入和初始化不阻塞事件循环"""
+    if _readiness["ready"]:
+        return getter()
+    return await asyncio.to_thread(getter)
+
+
+_warmup_lock = threading.Lock()
+_warmup_stop = threading.Event()
+_readiness = {"ready": False, "steps": {}, "error": None}
+
+
+def warmup() -> dict:
+    """校验配置、创建 LLM 客户端、打开向量库并做一次向量化、启动后写队列和记忆整理
+
+    可以重复调用：已就绪时直接返回；失败时记录出错的步骤，下次调用重新执行。
+    返回 readiness()。
+    """
+    with _warmup_lock:
+        if _readiness["ready"]:
+            return readiness()
+        steps = {}
+        name = None
+        try:
+            for name, func in (
+                ("config", config.validate),
+                ("llm", get_llm),
+                ("memory_manager", get_memory_manager),
+                ("vector_store_and_embedding", lambda: get_memory_manager().warmup()),
+                ("memory_queue", get_memory_queue),
+                ("consolidation", get_consolidator),
+            ):
+                start = time.perf_counter()
+                func()
+                steps[name] = round((time.perf_counter() - start) * 1000, 1)
+            _readiness.update(ready=True, steps=steps, error=None)
+        except Exception as e:
+            print(f"预热失败（{name}）: {e}")
+            _readiness.update(steps=steps, error=f"{name}: {e}")
+        return readiness()
+
+
+def start_warmup() -> threading.Thread:
+    """在后台线程中预热，失败后每隔 WARMUP_RETRY_INTERVAL 秒重试，直到就绪或进程退出"""
+    def run():
+        while not warmup()["ready"] and not _warmup_stop.wait(config.WARMUP_RETRY_INTERVAL):
+            pass
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> dict:
+    return {"ready": _readiness["ready"], "steps": dict(_readiness["steps"]), "error": _readiness["error"]}
+
+
+def shutdown():
+    """停止预热重试、后写队列和记忆整理，关闭 LLM 的 HTTP 连接（只停止已创建的资源）"""
+    _warmup_stop.set()
+    if _memory_queue is not None:
+        _memory_queue.stop()
+    if _consolidator is not None:
+        _consolidator.stop()
+    if _llms:
+        import zhipu_client
+        zhipu_client.close_clients()
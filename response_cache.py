@@ -0,0 +1,145 @@
+"""语义响应缓存：相似的问题在相同上下文下直接复用之前的回答
+
+缓存条目按（作用域、上下文指纹）分桶。上下文指纹是除当前问题外发给 LLM 的全部内容
+（系统提示、检索到的记忆、最近对话）的哈希，只有上下文完全相同时才可能命中，
+个性化的回答不会被错误地共享给其他用户或其他对话状态。桶内按问题向量的余弦相似度
+查找，超过阈值即命中。向量只保存在进程内，与 mem0 的集合分开。
+"""
+import asyncio
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+import config
+import metrics
+from embedding_cache import normalize_text
+
+
+@dataclass
+class _Entry:
+    bucket: str
+    vector: np.ndarray
+    prompt: str
+    response: str
+    expires_at: float
+
+
+class ResponseCache:
+    """进程内的语义响应缓存，TTL 过期 + LRU 淘汰
+
+    embedder 为 mem0 的向量化模型（带查询向量缓存），与记忆检索使用同一问题文本，
+    查询向量通常直接命中向量缓存。
+    """
+
+    def __init__(self, embedder, scope: str = None, threshold: float = None,
+                 ttl: float = None, max_size: int = None):
+        self.embedder = embedder
+        self.scope = scope or config.RESPONSE_CACHE_SCOPE
+        self.threshold = threshold or config.RESPONSE_CACHE_THRESHOLD
+        self.ttl = ttl or config.RESPONSE_CACHE_TTL
+        self.max_size = max_size or config.RESPONSE_CACHE_SIZE
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._entries = OrderedDict()
+        # 桶 -> {"ids": [...], "matrix": 按 ids 顺序堆叠的向量，变更后置空、查找时重建}
+        self._buckets = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _bucket_key(self, user_id: str, context: list) -> str:
+        owner = user_id if self.scope == "user" else "*"
+        digest = hashlib.sha256("\0".join(normalize_text(c) for c in context).encode("utf-8")).hexdigest()
+        return f"{owner}:{digest}"
+
+    def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(self.embedder.embed(prompt, "search"), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets[entry.bucket]
+        bucket["ids"].remove(entry_id)
+        bucket["matrix"] = None
+        if not bucket["ids"]:
+            del self._buckets[entry.bucket]
+
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.CACHE_REQUESTS.inc(cache="response", result="hit" if hit else "miss")
+
+    def lookup(self, user_id: str, prompt: str, context: list) -> Optional[str]:
+        """查找相同上下文下足够相似的问题，命中时返回缓存的回答"""
+        key = self._bucket_key(user_id, context)
+        with self._lock:
+            empty = key not in self._buckets
+        if empty:
+            # 桶为空时不必计算向量
+            self._record(False)
+            return None
+
+        vector = self._embed(prompt)
+        with self._lock:
+            now = time.time()
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                for entry_id in [i for i in bucket["ids"] if self._entries[i].expires_at < now]:
+                    self._remove(entry_id)
+                bucket = self._buckets.get(key)
+            if bucket is None:
+                self._record(False)
+                return None
+
+            if bucket["matrix"] is None:
+                bucket["matrix"] = np.stack([self._entries[i].vector for i in bucket["ids"]])
+            scores = bucket["matrix"] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self._record(False)
+                return None
+
+            entry_id = bucket["ids"][best]
+            self._entries.move_to_end(entry_id)
+            self._record(True)
+            return self._entries[entry_id].response
+
+    def store(self, user_id: str, prompt: str, context: list, response: str):
+        if not response:
+            return
+        key = self._bucket_key(user_id, context)
+        entry = _Entry(key, self._embed(prompt), prompt, response, time.time() + self.ttl)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            bucket = self._buckets.setdefault(key, {"ids": [], "matrix": None})
+            bucket["ids"].append(entry_id)
+            bucket["matrix"] = None
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    async def alookup(self, user_id: str, prompt: str, context: list) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.lookup, user_id, prompt, context)
+
+    async def astore(self, user_id: str, prompt: str, context: list, response: str):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.store, user_id, prompt, context, response)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,62 @@
+"""为已有的记忆建立关键词索引
+
+启用 KEYWORD_INDEX_ENABLED 之前写入的记忆不在索引中，修改 KEYWORD_TOKENIZER 后也需要重建。
+分页读取全部集合（分区模式下依次读取每个分区），按页写入索引；重复运行只会覆盖已有条目。
+嵌入式模式下请先停止 API 服务（同一个 Chroma 目录只允许一个进程打开）。
+
+运行:
+    python scripts/build_keyword_index.py
+    python scripts/build_keyword_index.py --user user123 --reset
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from keyword_index import KeywordIndex
+from partitioning import PartitionRouter
+from vector_store import create_chroma_client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user", help="只为该用户建立索引")
+    parser.add_argument("--reset", action="store_true", help="先删除已有索引（指定 --user 时只删除该用户的）")
+    parser.add_argument("--page-size", type=int, default=config.EXPORT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    index = KeywordIndex()
+    router = PartitionRouter(create_chroma_client(), config.CHROMA_COLLECTION)
+    if args.reset:
+        if args.user:
+            index.delete_user(args.user)
+        else:
+            index.clear()
+
+    if args.user:
+        collection = router.collection_for(args.user, create=False)
+        collections = [collection] if collection is not None else []
+    else:
+        collections = router.collections()
+    where = {"user_id": args.user} if args.user else None
+
+    total = 0
+    start = time.perf_counter()
+    for collection in collections:
+        offset = 0
+        while True:
+            page = collection.get(where=where, include=["metadatas"], limit=args.page_size, offset=offset)
+            index.add(page["ids"], page["metadatas"])
+            total += len(page["ids"])
+            if len(page["ids"]) < args.page_size:
+                break
+            offset += args.page_size
+    elapsed = time.perf_counter() - start
+    print(f"已索引 {total} 条记忆，{elapsed:.1f} 秒；索引中共 {index.count()} 条")
+
+
+if __name__ == "__main__":
+    main()
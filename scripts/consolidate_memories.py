@@ -0,0 +1,66 @@
+"""手动运行一次记忆整理
+
+服务中的后台整理只处理本进程内有新写入的用户；服务重启前的写入、批量导入到其他进程的
+记忆，用 --all 补做一次（按水位只处理上次整理之后新增的记忆）。
+嵌入式模式下请先停止 API 服务（同一个 Chroma 目录只允许一个进程打开）。
+
+运行:
+    python scripts/consolidate_memories.py --user user123
+    python scripts/consolidate_memories.py --all --max-memories 500 --eviction lru
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import resources
+from consolidation import MemoryConsolidator
+
+
+def all_users(memory_manager, page_size: int) -> set:
+    """分页读取全部集合的元数据，收集用户 ID"""
+    users = set()
+    for collection in memory_manager.partitions.collections():
+        offset = 0
+        while True:
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            users.update(metadata.get("user_id") for metadata in page["metadatas"] if metadata.get("user_id"))
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user", action="append", help="要整理的用户，可以重复指定")
+    target.add_argument("--all", action="store_true", help="整理全部用户")
+    parser.add_argument("--max-memories", type=int, help="覆盖 CONSOLIDATION_MAX_MEMORIES")
+    parser.add_argument("--eviction", choices=("lru", "age", "score"), help="覆盖 CONSOLIDATION_EVICTION")
+    parser.add_argument("--page-size", type=int, default=config.EXPORT_PAGE_SIZE)
+    parser.add_argument("--output", help="整理报告写入的 JSON 文件")
+    args = parser.parse_args()
+
+    try:
+        memory_manager = resources.get_memory_manager()
+        consolidator = MemoryConsolidator(memory_manager)
+        if args.max_memories is not None:
+            consolidator.max_memories = args.max_memories
+        if args.eviction:
+            consolidator.eviction = args.eviction
+        users = all_users(memory_manager, args.page_size) if args.all else set(args.user)
+        report = consolidator.run_once(users)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        resources.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""记忆写入预筛选的离线评估
+
+输入为 NDJSON，每行一条消息：{"role": "user", "content": "...", "label": "extract"}，
+MEMORY_FILTER_RECORD_PATH 记录的文件可以直接使用。label 表示这条消息是否值得做事实提取
+（extract 为是，其余为否）；没有 label 时可以用 --reference llm 让 mem0 的事实提取提示词
+逐条判断（提取出事实即为 extract），结果用 --write-labels 保存下来复用。
+
+报告各角色的判断分布、省下的提取调用比例、预筛选耗时，以及有标注时的：
+- recall：值得提取的消息中仍然做提取的比例
+- raw：值得提取但被原文保存的条数（信息还在，只是没有提炼）
+- lost：值得提取但被丢弃的条数
+- precision：做提取的消息中确实值得提取的比例
+
+--train 用有标注的用户消息训练本地分类器（保留 --holdout 比例做评估），保存后按
+MEMORY_FILTER_MODEL_PATH 加载。
+
+运行:
+    python scripts/eval_memory_filter.py benchmarks/memory_filter_sample.ndjson
+    python scripts/eval_memory_filter.py recorded.ndjson --reference llm --write-labels labeled.ndjson
+    python scripts/eval_memory_filter.py labeled.ndjson --train memory_filter.npz
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import config
+from memory_filter import MemoryFilter, NgramClassifier, parse_policies
+
+
+def read_records(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def llm_labels(records: list):
+    """用 mem0 的事实提取提示词为没有标注的用户消息打标注"""
+    import resources
+    from mem0.memory.utils import get_fact_retrieval_messages, parse_messages, remove_code_blocks
+
+    llm = resources.get_memory_manager().memory.llm
+    try:
+        for record in records:
+            if record.get("label") or record.get("role") != "user":
+                continue
+            system_prompt, user_prompt = get_fact_retrieval_messages(
+                parse_messages([{"role": "user", "content": record["content"]}])
+            )
+            response = llm.generate_response(
+                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+                response_format={"type": "json_object"}
+            )
+            try:
+                facts = json.loads(remove_code_blocks(response)).get("facts", [])
+            except ValueError:
+                facts = []
+            record["label"] = "extract" if facts else "drop"
+    finally:
+        resources.shutdown()
+
+
+def train(records: list, path: str, holdout: float) -> list:
+    """训练分类器并保存，返回留出的评估记录"""
+    labeled = [r for r in records if r.get("label") and r.get("role") == "user"]
+    order = np.random.default_rng(0).permutation(len(labeled))
+    cut = int(len(labeled) * (1 - holdout))
+    fit = [labeled[i] for i in order[:cut]]
+    classifier = NgramClassifier().fit([r["content"] for r in fit], [r["label"] == "extract" for r in fit])
+    classifier.save(path)
+    print(f"分类器已保存到 {path}（训练 {len(fit)} 条，评估 {len(labeled) - cut} 条）")
+    return [labeled[i] for i in order[cut:]]
+
+
+def evaluate(records: list, memory_filter: MemoryFilter) -> dict:
+    decisions, reasons, latencies = Counter(), Counter(), []
+    scored = Counter()
+    for record in records:
+        role = record.get("role", "user")
+        start = time.perf_counter()
+        decision, reason = memory_filter.decide(record.get("content", ""), role)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        decisions[(role, decision)] += 1
+        reasons[reason] += 1
+        label = record.get("label")
+        if label:
+            positive = label == "extract"
+            scored["positive"] += positive
+            scored["extracted"] += decision == "extract"
+            scored["true_positive"] += positive and decision == "extract"
+            scored["raw"] += positive and decision == "raw"
+            scored["lost"] += positive and decision == "drop"
+
+    total = len(records)
+    extracted = sum(count for (_, decision), count in decisions.items() if decision == "extract")
+    report = {
+        "messages": total,
+        "decisions": {f"{role}:{decision}": count for (role, decision), count in sorted(decisions.items())},
+        "reasons": dict(reasons.most_common()),
+        "extraction_calls_saved": round(1 - extracted / total, 4) if total else 0.0,
+        "filter_us_p50": round(float(np.percentile(latencies, 50)), 1) if latencies else 0.0,
+        "filter_us_p99": round(float(np.percentile(latencies, 99)), 1) if latencies else 0.0,
+    }
+    if scored["positive"]:
+        report.update(
+            labeled_positive=scored["positive"],
+            recall=round(scored["true_positive"] / scored["positive"], 4),
+            raw=scored["raw"],
+            lost=scored["lost"],
+            precision=round(scored["true_positive"] / scored["extracted"], 4) if scored["extracted"] else 0.0,
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="消息记录（NDJSON）")
+    parser.add_argument("--policies", default=config.MEMORY_FILTER_POLICIES)
+    parser.add_argument("--fallback", default=config.MEMORY_FILTER_FALLBACK, choices=("extract", "raw", "drop"))
+    parser.add_argument("--model", default=config.MEMORY_FILTER_MODEL_PATH, help="分类器文件，为空时只用规则")
+    parser.add_argument("--threshold", type=float, default=config.MEMORY_FILTER_THRESHOLD)
+    parser.add_argument("--reference", choices=("label", "llm"), default="label",
+                        help="标注来源：label 使用记录中的 label，llm 为没有标注的用户消息调用事实提取")
+    parser.add_argument("--write-labels", help="保存带标注的记录")
+    parser.add_argument("--train", help="训练分类器并保存到该路径，随后用它评估留出集")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--output", help="评估报告写入的 JSON 文件")
+    args = parser.parse_args()
+
+    records = read_records(args.input)
+    if args.reference == "llm":
+        llm_labels(records)
+    if args.write_labels:
+        with open(args.write_labels, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    report = {}
+    policies = parse_policies(args.policies)
+    rules = MemoryFilter(policies=policies, fallback=args.fallback, model_path="", record_path="")
+    if args.train:
+        records = train(records, args.train, args.holdout)
+        report["rules_holdout"] = evaluate(records, rules)
+        args.model = args.train
+    else:
+        report["rules"] = evaluate(records, rules)
+    if args.model:
+        model = MemoryFilter(policies=policies, fallback=args.fallback, model_path=args.model,
+                             threshold=args.threshold, record_path="")
+        report["model_holdout" if args.train else "model"] = evaluate(records, model)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""把单集合中的记忆迁移到分区集合（VECTOR_PARTITIONING=user / hash）
+
+每一轮同步按页读取源集合，把新增或修改过的记录（按 ID 和元数据比较）连同向量写入
+各自的分区，不重新向量化；指定 --prune 时再删除分区中源集合已经没有的记录。同步是
+幂等的，可以在服务运行期间反复执行（在线迁移需要服务模式 VECTOR_STORE_MODE=server，
+嵌入式模式下请先停止服务）。
+
+在线切换步骤：
+1. 服务继续使用单集合，运行 `--prune --until-stable` 直到一轮同步没有变化
+2. 设置 VECTOR_PARTITIONING（和 VECTOR_PARTITION_BUCKETS）后重启服务
+3. 不带 --prune 再同步一轮，补上切换期间写入源集合的记录
+4. 确认无误后用 --drop-source 删除源集合
+
+运行:
+    python scripts/migrate_partitions.py --mode user --prune --until-stable
+    python scripts/migrate_partitions.py --mode user
+    python scripts/migrate_partitions.py --mode user --drop-source
+"""
+import argparse
+import os
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from partitioning import PartitionRouter
+from vector_store import create_chroma_client
+
+
+def copy_changed(source, router: PartitionRouter, page_size: int) -> int:
+    """把源集合中新增或修改过的记录写入分区，返回写入的条数"""
+    copied = 0
+    offset = 0
+    while True:
+        page = source.get(offset=offset, limit=page_size, include=["metadatas", "embeddings"])
+        if not page["ids"]:
+            return copied
+        offset += len(page["ids"])
+
+        # 按用户分组，保持每个用户的写入顺序（分页浏览依赖写入顺序）
+        groups = OrderedDict()
+        for i, payload in enumerate(page["metadatas"]):
+            groups.setdefault(payload.get("user_id", ""), []).append(i)
+        for user_id, indexes in groups.items():
+            target = router.collection_for(user_id)
+            ids = [page["ids"][i] for i in indexes]
+            existing = target.get(ids=ids, include=["metadatas"])
+            current = dict(zip(existing["ids"], existing["metadatas"]))
+            changed = [i for i in indexes if current.get(page["ids"][i]) != page["metadatas"][i]]
+            if changed:
+                target.upsert(
+                    ids=[page["ids"][i] for i in changed],
+                    embeddings=[page["embeddings"][i] for i in changed],
+                    metadatas=[page["metadatas"][i] for i in changed]
+                )
+                copied += len(changed)
+
+
+def prune_deleted(source, router: PartitionRouter, page_size: int) -> int:
+    """删除分区中源集合已经没有的记录，返回删除的条数"""
+    pruned = 0
+    for collection in router.collections():
+        stale = []
+        offset = 0
+        while True:
+            page = collection.get(offset=offset, limit=page_size, include=[])
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            present = set(source.get(ids=page["ids"], include=[])["ids"])
+            stale.extend(memory_id for memory_id in page["ids"] if memory_id not in present)
+        # 扫描完再删除，避免删除后偏移量错位
+        for start in range(0, len(stale), page_size):
+            collection.delete(ids=stale[start:start + page_size])
+        pruned += len(stale)
+    return pruned
+
+
+def partition_total(router: PartitionRouter) -> int:
+    return sum(collection.count() for collection in router.collections())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default=config.VECTOR_PARTITIONING, choices=["user", "hash"])
+    parser.add_argument("--buckets", type=int, default=config.VECTOR_PARTITION_BUCKETS)
+    parser.add_argument("--source", default=config.CHROMA_COLLECTION)
+    parser.add_argument("--page-size", type=int, default=config.EXPORT_PAGE_SIZE)
+    parser.add_argument("--prune", action="store_true", help="删除分区中源集合已经没有的记录（切换前使用）")
+    parser.add_argument("--until-stable", action="store_true", help="重复同步直到一轮没有变化")
+    parser.add_argument("--max-passes", type=int, default=10)
+    parser.add_argument("--drop-source", action="store_true", help="条数一致时删除源集合")
+    args = parser.parse_args()
+
+    client = create_chroma_client()
+    source = client.get_collection(args.source)
+    router = PartitionRouter(client, args.source, mode=args.mode, buckets=args.buckets)
+
+    if args.drop_source:
+        source_total, target_total = source.count(), partition_total(router)
+        if source_total != target_total:
+            print(f"源集合 {source_total} 条，分区共 {target_total} 条，不一致，未删除源集合")
+            sys.exit(1)
+        client.delete_collection(args.source)
+        print(f"已删除源集合 {args.source}（{source_total} 条已全部迁移）")
+        return
+
+    for run in range(1, (args.max_passes if args.until_stable else 1) + 1):
+        start = time.perf_counter()
+        copied = copy_changed(source, router, args.page_size)
+        pruned = prune_deleted(source, router, args.page_size) if args.prune else 0
+        print(f"第 {run} 轮：写入 {copied} 条，删除 {pruned} 条，{time.perf_counter() - start:.1f} 秒")
+        if not copied and not pruned:
+            break
+
+    print(f"源集合 {source.count()} 条，{len(router.collections())} 个分区共 {partition_total(router)} 条")
+    if args.mode == "hash":
+        print(f"请设置 VECTOR_PARTITIONING=hash 和 VECTOR_PARTITION_BUCKETS={args.buckets} 后重启服务")
+    else:
+        print("请设置 VECTOR_PARTITIONING=user 后重启服务")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""用当前配置的 embedder 重新向量化已有的 Chroma 集合
+
+切换向量化后端（例如从远程 embedding-3 切到本地 ONNX）后，旧向量的维度和语义空间
+都不兼容，需要把记忆文本重新向量化写入新集合，再把 CHROMA_COLLECTION 指向新集合。
+
+运行:
+    EMBEDDING_BACKEND=onnx python scripts/reembed_collection.py \\
+        --source zhipu_conversations --target zhipu_conversations_onnx
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from chromadb.config import Settings
+
+import config
+from embedding_cache import embed_many
+from vector_store import create_chroma_client
+
+
+def build_embedder(backend: str):
+    if backend == "onnx":
+        from local_embedder import OnnxEmbedder
+        return OnnxEmbedder()
+    config.validate()
+    from mem0.configs.embeddings.base import BaseEmbedderConfig
+    from mem0.embeddings.openai import OpenAIEmbedding
+    return OpenAIEmbedding(BaseEmbedderConfig(
+        model="embedding-3",
+        api_key=config.ZHIPU_API_KEY,
+        openai_base_url=config.ZHIPU_BASE_URL,
+    ))
+
+
+def embed_batch(embedder, texts: list) -> list:
+    return embed_many(embedder, texts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=config.CHROMA_PATH, help="嵌入式模式下的 Chroma 目录")
+    parser.add_argument("--source", default=config.CHROMA_COLLECTION)
+    parser.add_argument("--target", required=True)
+    parser.add_argument("--backend", default=config.EMBEDDING_BACKEND, choices=["remote", "onnx"])
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.source == args.target:
+        parser.error("目标集合不能与源集合相同")
+
+    if config.VECTOR_STORE_MODE == "server":
+        client = create_chroma_client()
+    else:
+        client = chromadb.PersistentClient(path=args.path, settings=Settings(anonymized_telemetry=False))
+    source = client.get_collection(args.source)
+    target = client.get_or_create_collection(args.target, metadata=source.metadata)
+    embedder = build_embedder(args.backend)
+
+    total = source.count()
+    done = 0
+    start = time.perf_counter()
+    while done < total:
+        page = source.get(include=["metadatas"], limit=args.batch_size, offset=done)
+        if not page["ids"]:
+            break
+        texts = [m.get("data", "") for m in page["metadatas"]]
+        # upsert 保证中断后可以重复执行
+        target.upsert(
+            ids=page["ids"],
+            embeddings=embed_batch(embedder, texts),
+            metadatas=page["metadatas"]
+        )
+        done += len(page["ids"])
+        elapsed = time.perf_counter() - start
+        print(f"已迁移 {done}/{total} 条，{done / elapsed:.1f} 条/秒")
+
+    print(f"完成：{args.source} -> {args.target}，共 {done} 条")
+    print(f"请设置 CHROMA_COLLECTION={args.target} 和 EMBEDDING_BACKEND={args.backend} 后重启服务")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""记忆导出 / 导入命令行工具
+
+导出为 NDJSON，文件名以 .gz 结尾时 gzip 压缩；不指定 --user 时导出整个集合（所有用户）。
+导入直接写入向量库，不经过 mem0 的事实提取，向量模型相同时复用文件中的向量。
+嵌入式模式下请先停止 API 服务（同一个 Chroma 目录只允许一个进程打开）。
+
+运行:
+    python scripts/transfer_memories.py export --user user123 --output user123.ndjson.gz
+    python scripts/transfer_memories.py export --output backup.ndjson.gz
+    python scripts/transfer_memories.py import backup.ndjson.gz
+    python scripts/transfer_memories.py import user123.ndjson.gz --user user456
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resources
+from memory_transfer import gzip_chunks, iter_lines
+
+
+def read_chunks(path: str, size: int = 1024 * 1024):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def export(args):
+    memory_manager = resources.get_memory_manager()
+    lines = memory_manager.export_memories(args.user, include_vectors=not args.no_vectors)
+    count = -1  # 不计 header
+    start = time.perf_counter()
+
+    def counted():
+        nonlocal count
+        for line in lines:
+            count += 1
+            yield line
+
+    with open(args.output, "wb") as f:
+        if args.output.endswith(".gz"):
+            for chunk in gzip_chunks(counted()):
+                f.write(chunk)
+        else:
+            for line in counted():
+                f.write(line.encode("utf-8"))
+    elapsed = time.perf_counter() - start
+    print(f"已导出 {count} 条记忆到 {args.output}，{elapsed:.1f} 秒，{count / elapsed:.0f} 条/秒")
+
+
+def import_(args):
+    memory_manager = resources.get_memory_manager()
+    stats = memory_manager.import_memories(iter_lines(read_chunks(args.input)), user_id=args.user)
+    rate = stats["imported"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"已导入 {stats['imported']} 条记忆（{stats['users']} 个用户），"
+          f"复用向量 {stats['reused_embeddings']} 条，重新向量化 {stats['embedded']} 条，"
+          f"跳过 {stats['skipped']} 条；{stats['seconds']:.1f} 秒，{rate:.0f} 条/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="导出记忆")
+    export_parser.add_argument("--user", help="只导出该用户的记忆")
+    export_parser.add_argument("--output", required=True, help="输出文件，.gz 结尾时压缩")
+    export_parser.add_argument("--no-vectors", action="store_true", help="不导出向量，导入时重新向量化")
+    export_parser.set_defaults(func=export)
+
+    import_parser = commands.add_parser("import", help="导入记忆")
+    import_parser.add_argument("input", help="导出文件（NDJSON 或 gzip）")
+    import_parser.add_argument("--user", help="全部导入到该用户下")
+    import_parser.set_defaults(func=import_)
+
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    finally:
+        resources.shutdown()
+
+
+if __name__ == "__main__":
+    main()
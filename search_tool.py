@@ -1,34 +1,356 @@
-from langchain_mcp import MCPToolkit
-from typing import Optional, List
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, List
+
+from langchain_core.tools import BaseTool, ToolException
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.types import TextContent
+
+import config
+import metrics
+
+
+def normalize_arguments(arguments: dict) -> str:
+    """归一化工具参数作为缓存键：字符串去首尾空白、折叠空白、转小写"""
+    normalized = {
+        key: re.sub(r"\s+", " ", value).strip().lower() if isinstance(value, str) else value
+        for key, value in arguments.items()
+    }
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+class SearchResultCache:
+    """TTL + LRU 的搜索结果缓存，只在连接池的事件循环线程中访问"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+class _MCPServer:
+    """一个长驻的 MCP 服务进程及其会话
+
+    stdio_client 和 ClientSession 的上下文必须在同一个任务里进入和退出，
+    所以每个进程由一个独立任务持有，停止时通知该任务自行退出。
+    """
+
+    def __init__(self, params: StdioServerParameters):
+        self.params = params
+        self.session = None
+        self.tools = []
+        self.in_flight = 0
+        # 健康检查失败、等待进行中的调用结束后重启；期间不再分配新调用
+        self.draining = False
+        self.restarting = False
+        self._task = None
+        self._stop = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.session is not None and not self.draining
+
+    async def start(self, timeout: float):
+        self._stop = asyncio.Event()
+        ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run(ready))
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            print("启动 MCP 服务进程超时")
+
+    async def _run(self, ready: asyncio.Event):
+        try:
+            async with stdio_client(self.params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.tools = (await session.list_tools()).tools
+                    self.session = session
+                    ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            print(f"MCP 服务进程异常退出: {e}")
+        finally:
+            self.session = None
+            ready.set()
+
+    async def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, 5.0)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+        self.session = None
+
+    async def ping(self, timeout: float) -> bool:
+        if self.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+
+class MCPServerPool:
+    """共享的长驻 MCP 服务进程池
+
+    在独立线程的事件循环中维护若干服务进程，定期健康检查并重启失败的进程，
+    用信号量限制并发调用数。结果按归一化参数做 TTL + LRU 缓存，相同参数的并发
+    调用合并为一次上游请求。
+    """
+
+    def __init__(self, params: StdioServerParameters, size: int = None, max_concurrency: int = None,
+                 call_timeout: float = None, cache_ttl: float = None, cache_size: int = None):
+        self.params = params
+        self.size = size or config.MCP_POOL_SIZE
+        self.max_concurrency = max_concurrency or config.MCP_MAX_CONCURRENCY
+        self.call_timeout = call_timeout or config.MCP_CALL_TIMEOUT
+        self.health_interval = config.MCP_HEALTH_INTERVAL
+        self.cache = SearchResultCache(cache_size or config.SEARCH_CACHE_SIZE,
+                                       cache_ttl or config.SEARCH_CACHE_TTL)
+        self.upstream_calls = 0
+
+        self._servers = []
+        self._in_flight = {}
+        self._semaphore = None
+        self._health_task = None
+        self._restarts = set()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-pool", daemon=True)
+        self._thread.start()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def start(self, timeout: float = 60.0) -> bool:
+        """启动服务进程，至少一个可用时返回 True"""
+        return self._submit(self._start()).result(timeout)
+
+    async def _start(self) -> bool:
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._servers = [_MCPServer(self.params) for _ in range(self.size)]
+        await asyncio.gather(*(server.start(self.call_timeout) for server in self._servers))
+        self._health_task = asyncio.create_task(self._health_loop())
+        return any(server.healthy for server in self._servers)
+
+    def shutdown(self):
+        async def stop_all():
+            if self._health_task is not None:
+                self._health_task.cancel()
+            await asyncio.gather(*(server.stop() for server in self._servers))
+        try:
+            self._submit(stop_all()).result(10.0)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def tool_specs(self) -> list:
+        for server in self._servers:
+            if server.healthy:
+                return server.tools
+        return []
+
+    async def _restart(self, server: _MCPServer):
+        if server.restarting:
+            return
+        server.restarting = True
+        try:
+            await server.stop()
+            await server.start(self.call_timeout)
+        finally:
+            server.restarting = False
+            server.draining = False
+
+    def _restart_when_idle(self, server: _MCPServer):
+        """进程上没有进行中的调用时在后台重启，不阻塞当前调用返回"""
+        if server.draining and server.in_flight == 0 and not server.restarting:
+            task = asyncio.create_task(self._restart(server))
+            self._restarts.add(task)
+            task.add_done_callback(self._restarts.discard)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for server in self._servers:
+                if server.in_flight == 0 and (server.draining or not await server.ping(self.call_timeout)):
+                    print("MCP 服务进程健康检查失败，正在重启")
+                    await self._restart(server)
+
+    def _pick(self) -> Optional[_MCPServer]:
+        healthy = [server for server in self._servers if server.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda server: server.in_flight)
+
+    async def call_tool(self, name: str, arguments: dict) -> str:
+        key = (name, normalize_arguments(arguments))
+        cached = self.cache.get(key)
+        if cached is not None:
+            metrics.CACHE_REQUESTS.inc(cache="search", result="hit")
+            return cached
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            metrics.CACHE_REQUESTS.inc(cache="search", result="coalesced")
+            return await asyncio.shield(pending)
+
+        metrics.CACHE_REQUESTS.inc(cache="search", result="miss")
+        future = self._loop.create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._call_upstream(name, arguments)
+            self.cache.put(key, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # 没有合并等待者时也标记异常已被读取，避免事件循环打印警告
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def _call_upstream(self, name: str, arguments: dict) -> str:
+        async with self._semaphore:
+            last_error = None
+            # 进程不再响应时换一个进程重试一次；该进程上的调用都结束后再重启，不影响其他调用
+            for _ in range(2):
+                server = self._pick()
+                if server is None:
+                    raise ToolException("没有可用的 MCP 搜索服务")
+                server.in_flight += 1
+                try:
+                    self.upstream_calls += 1
+                    with metrics.upstream_call("search", "search"):
+                        result = await asyncio.wait_for(
+                            server.session.call_tool(name, arguments=arguments),
+                            self.call_timeout
+                        )
+                except asyncio.TimeoutError:
+                    # 单次调用超时只让这次调用失败
+                    raise ToolException(f"搜索调用超时（{self.call_timeout} 秒）")
+                except Exception as e:
+                    # 进程仍能响应 ping 时是这次调用本身出错，不重启
+                    if await server.ping(self.call_timeout):
+                        raise ToolException(f"搜索调用失败: {e}")
+                    last_error = e
+                    server.draining = True
+                    continue
+                finally:
+                    server.in_flight -= 1
+                    self._restart_when_idle(server)
+
+                text = "\n".join(block.text for block in result.content if isinstance(block, TextContent))
+                if result.isError:
+                    raise ToolException(text)
+                return text
+            raise ToolException(f"搜索调用失败: {last_error}")
+
+    def call_tool_sync(self, name: str, arguments: dict) -> str:
+        return self._submit(self.call_tool(name, arguments)).result(self.call_timeout * 2 + 10)
+
+    async def acall_tool(self, name: str, arguments: dict) -> str:
+        """在调用方自己的事件循环中等待连接池线程上的调用"""
+        return await asyncio.wrap_future(self._submit(self.call_tool(name, arguments)))
+
+
+class PooledMCPTool(BaseTool):
+    """通过共享连接池调用的 MCP 工具"""
+
+    pool: Any
+    handle_tool_error: bool = True
+
+    def _run(self, **kwargs) -> str:
+        return self.pool.call_tool_sync(self.name, kwargs)
+
+    async def _arun(self, **kwargs) -> str:
+        return await self.pool.acall_tool(self.name, kwargs)
+
+
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def searxng_server_params() -> StdioServerParameters:
+    return StdioServerParameters(
+        command="uv",
+        args=["--directory", config.SEARXNG_MCP_DIR, "run", "server.py"],
+        env={
+            "SEARXNG_BASE_URL": config.SEARXNG_BASE_URL,
+            "REQUEST_TIMEOUT": "30.0",
+            "MAX_RESULTS": "20"
+        }
+    )
+
+
+def get_search_pool() -> MCPServerPool:
+    """进程级共享的 SearXNG MCP 连接池，首次调用时启动"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = MCPServerPool(searxng_server_params())
+                if not pool.start():
+                    pool.shutdown()
+                    raise RuntimeError("MCP 搜索服务启动失败")
+                _pool = pool
+    return _pool
+
 
 class SearchTool:
     def __init__(self):
         self.enabled = False
-        self.toolkit = None
-        
+        self.pool = None
+        self._tools = []
+
     def initialize(self):
         try:
-            self.toolkit = MCPToolkit(
-                server_params={
-                    "command": "uv",
-                    "args": ["--directory", "/Users/mac/code/python/searxng-mcp", "run", "server.py"],
-                    "env": {
-                        "SEARXNG_BASE_URL": "http://127.0.0.1:8888",
-                        "REQUEST_TIMEOUT": "30.0",
-                        "MAX_RESULTS": "20"
-                    }
-                }
-            )
+            self.pool = get_search_pool()
             return True
         except Exception as e:
             print(f"初始化搜索工具失败: {e}")
             return False
-    
-    def get_tools(self):
-        if not self.enabled or not self.toolkit:
+
+    def get_tools(self) -> List[BaseTool]:
+        if not self.enabled or not self.pool:
             return []
-        return self.toolkit.get_tools()
-    
+        # 工具对象只构建一次，便于按工具集复用已构建的 agent
+        if not self._tools:
+            self._tools = [
+                PooledMCPTool(
+                    pool=self.pool,
+                    name=tool.name,
+                    description=tool.description or "",
+                    args_schema=tool.inputSchema,
+                )
+                for tool in self.pool.tool_specs()
+            ]
+        return self._tools
+
     def format_search_context(self, results: str) -> str:
         if not results:
             return ""
@@ -0,0 +1,130 @@
+import threading
+import time
+import types
+
+import pytest
+
+import admission
+from admission import AdmissionRejected, Limiter
+
+
+def _limiter(**kwargs):
+    options = dict(rate=0, burst=1, max_concurrency=1, max_queue=100, max_queue_per_user=10, timeout=5)
+    options.update(kwargs)
+    return Limiter("test", **options)
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.005)
+
+
+def _queue(limiter, user, granted):
+    """在线程中排队，拿到许可后记录用户并立即释放；返回线程"""
+    def run():
+        with limiter.slot(user):
+            granted.append(user)
+
+    depth = limiter.queue_depth()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    _wait_for(lambda: limiter.queue_depth() == depth + 1)
+    return thread
+
+
+def test_queued_users_are_served_round_robin():
+    limiter = _limiter()
+    granted = []
+    limiter.acquire("holder")
+    threads = [_queue(limiter, user, granted) for user in ("a", "a", "a", "b", "c")]
+
+    limiter.release()
+    for thread in threads:
+        thread.join(2)
+
+    assert granted == ["a", "b", "c", "a", "a"]
+    assert limiter.queue_depth() == 0
+
+
+def test_user_queue_full_is_rejected_with_429():
+    limiter = _limiter(max_queue_per_user=1)
+    granted = []
+    limiter.acquire("holder")
+    threads = [_queue(limiter, "a", granted)]
+
+    with pytest.raises(AdmissionRejected) as info:
+        limiter.acquire("a")
+    assert info.value.status_code == 429
+    assert info.value.reason == "user_queue_full"
+
+    # 其他用户不受影响
+    threads.append(_queue(limiter, "b", granted))
+    limiter.release()
+    for thread in threads:
+        thread.join(2)
+    assert granted == ["a", "b"]
+
+
+def test_global_queue_full_is_rejected_with_503():
+    limiter = _limiter(max_queue=1)
+    granted = []
+    limiter.acquire("holder")
+    thread = _queue(limiter, "a", granted)
+
+    with pytest.raises(AdmissionRejected) as info:
+        limiter.acquire("b")
+    assert info.value.status_code == 503
+    assert info.value.reason == "queue_full"
+
+    limiter.release()
+    thread.join(2)
+
+
+def test_wait_past_deadline_is_rejected_and_dequeued():
+    limiter = _limiter()
+    limiter.acquire("holder")
+
+    with pytest.raises(AdmissionRejected) as info:
+        limiter.acquire("a", timeout=0.05)
+    assert info.value.reason == "timeout"
+    assert info.value.status_code == 503
+    assert limiter.queue_depth() == 0
+
+    limiter.release()
+    with limiter.slot("a", timeout=0.05):
+        pass
+
+
+def test_token_bucket_limits_rate():
+    limiter = _limiter(rate=20, burst=1, max_concurrency=10)
+    start = time.monotonic()
+    for _ in range(3):
+        with limiter.slot("a"):
+            pass
+    # 桶里只有 1 个令牌，后两次各等约 50ms
+    assert time.monotonic() - start >= 0.08
+
+
+def test_propagate_context_carries_current_user_into_module_executors():
+    module = types.ModuleType("fake_mem0_main")
+    exec(
+        "import concurrent.futures\n"
+        "def run(fn):\n"
+        "    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:\n"
+        "        future = executor.submit(fn)\n"
+        "        concurrent.futures.wait([future])\n"
+        "        return future.result()\n",
+        module.__dict__,
+    )
+
+    with admission.user_scope("alice"):
+        assert module.run(admission.current_user.get) == ""
+        admission.propagate_context(module)
+        # 工作线程中读到的是调用方的真实用户，而不是默认的空用户
+        assert module.run(admission.current_user.get) == "alice"
+
+    import concurrent.futures
+    assert concurrent.futures.ThreadPoolExecutor is not admission.ContextThreadPoolExecutor
+
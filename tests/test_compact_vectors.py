@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from compact_vectors import CompactVectorStore, RerankStore, quantize, reduce, rerank
+
+
+def _random(n, dims=64, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dims)).astype(np.float32)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RerankStore(str(tmp_path / "rerank.db"))
+
+
+def test_reduce_truncates_and_normalizes():
+    reduced = reduce(_random(3), dims=16)
+
+    assert reduced.shape == (3, 16)
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0)
+    assert reduce([3.0, 4.0, 5.0], dims=2).tolist() == pytest.approx([0.6, 0.8])
+
+
+def test_quantize_is_int8_with_one_scale_per_vector():
+    vectors = _random(5)
+    scales, codes = quantize(vectors)
+
+    assert codes.dtype == np.int8
+    assert scales.shape == (5,)
+    assert np.abs(codes).max(axis=1).tolist() == [127] * 5
+    restored = codes.astype(np.float32) * scales[:, None]
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    assert np.abs(restored - normalized).max() < 0.01
+
+
+def test_rerank_store_round_trip(store):
+    vectors = _random(3)
+    store.put(["a", "b", "c"], vectors)
+
+    restored = store.get(["a", "c", "missing"])
+
+    assert set(restored) == {"a", "c"}
+    for key, i in (("a", 0), ("c", 2)):
+        cosine = restored[key] @ vectors[i] / np.linalg.norm(vectors[i])
+        assert cosine > 0.999
+
+    store.put(["a"], vectors[1:2])
+    assert store.get(["a"])["a"] @ restored["a"] < 0.999
+    store.delete(["a", "b"])
+    assert store.count() == 1
+    assert store.get([]) == {}
+
+
+def test_rerank_orders_candidates_by_full_dimension_distance(store):
+    query = _random(1, seed=1)[0]
+    far, near = _random(2, seed=2)
+    near = query + 0.05 * near
+    store.put(["far", "near"], [far, near])
+    # 首轮分数（降维后的距离）排序是错的，重排后应按全维距离排序
+    candidates = [SimpleNamespace(id="far", score=0.1), SimpleNamespace(id="near", score=0.9),
+                  SimpleNamespace(id="unknown", score=0.5)]
+
+    results = rerank(candidates, query, store, limit=3)
+
+    assert [item.id for item in results] == ["near", "unknown", "far"]
+    assert results[0].score == pytest.approx(0.0, abs=0.01)
+    # 没有全维向量的候选保留首轮分数
+    assert results[1].score == 0.5
+    assert len(rerank(candidates, query, store, limit=1)) == 1
+
+
+class FakeStore:
+    def __init__(self):
+        self.vectors = {}
+        self.limits = []
+
+    def insert(self, vectors, payloads=None, ids=None):
+        self.vectors.update(zip(ids, vectors))
+
+    def search(self, query, vectors, limit=5, filters=None):
+        self.limits.append(limit)
+        return [SimpleNamespace(id=i, score=2 - 2 * float(np.dot(v, vectors))) for i, v in self.vectors.items()]
+
+    def update(self, vector_id, vector=None, payload=None):
+        if vector is not None:
+            self.vectors[vector_id] = vector
+
+    def delete(self, vector_id):
+        self.vectors.pop(vector_id)
+
+    def col_info(self):
+        return "info"
+
+
+def test_compact_store_writes_reduced_vectors_and_reranks(store):
+    inner = FakeStore()
+    compact = CompactVectorStore(inner, store, dims=8, factor=3)
+    vectors = _random(4)
+    compact.insert(vectors.tolist(), payloads=[{}] * 4, ids=["a", "b", "c", "d"])
+
+    assert all(len(v) == 8 for v in inner.vectors.values())
+    assert store.count() == 4
+
+    results = compact.search("q", vectors[2].tolist(), limit=2)
+    assert inner.limits == [6]
+    assert [item.id for item in results][0] == "c"
+    assert len(results) == 2
+
+    compact.update("c", vector=vectors[0].tolist())
+    assert len(inner.vectors["c"]) == 8
+    assert store.get(["c"])["c"] @ store.get(["a"])["a"] > 0.999
+
+    compact.delete("d")
+    assert "d" not in inner.vectors
+    assert store.get(["d"]) == {}
+    assert compact.col_info() == "info"
@@ -0,0 +1,182 @@
+import json
+from contextlib import closing
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from consolidation import MemoryConsolidator, UsageTracker, _clusters, _same_hash
+
+
+class FakeCollection:
+    """按插入顺序保存记录的 Chroma 集合；before_get 在每次 get 之前调用，用于模拟并发写入"""
+
+    def __init__(self):
+        self.records = {}
+        self.before_get = []
+
+    def add(self, memory_id, vector, **payload):
+        self.records[memory_id] = (dict(payload), np.asarray(vector, dtype=np.float32))
+
+    def get(self, ids=None, where=None, include=()):
+        if self.before_get:
+            self.before_get.pop(0)()
+        items = [(i, r) for i, r in self.records.items()
+                 if (ids is None or i in ids) and
+                 (where is None or r[0].get("user_id") == where["user_id"])]
+        result = {"ids": [i for i, _ in items], "metadatas": [dict(r[0]) for _, r in items]}
+        if "embeddings" in include:
+            result["embeddings"] = np.array([r[1] for _, r in items])
+        return result
+
+
+class FakeEmbedder:
+    def __init__(self, dims):
+        self.dims = dims
+
+    def embed_batch(self, texts):
+        return [np.eye(self.dims)[-1].tolist() for _ in texts]
+
+
+class FakeMemoryManager:
+    def __init__(self, collection, dims=4, merged=None):
+        self.collection = collection
+        self.usage = UsageTracker()
+        self.deleted = []
+        self.llm_inputs = []
+
+        def generate_response(messages, response_format=None):
+            groups = json.loads(messages[-1]["content"])["groups"]
+            self.llm_inputs.append(groups)
+            if merged is None:
+                raise RuntimeError("LLM 不可用")
+            return json.dumps({"merged": merged[:len(groups)]}, ensure_ascii=False)
+
+        def insert(vectors, payloads, ids):
+            for memory_id, vector, payload in zip(ids, vectors, payloads):
+                collection.add(memory_id, vector, **payload)
+
+        self.partitions = SimpleNamespace(collection_for=lambda user_id, create=True: collection)
+        self.memory = SimpleNamespace(
+            llm=SimpleNamespace(generate_response=generate_response),
+            embedding_model=FakeEmbedder(dims),
+            vector_store=SimpleNamespace(insert=insert),
+            db=SimpleNamespace(add_history=lambda *args, **kwargs: None),
+        )
+
+    def delete_memories(self, user_id, ids):
+        for memory_id in ids:
+            self.collection.records.pop(memory_id, None)
+        self.deleted.extend(ids)
+        return len(ids)
+
+
+def _unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def make_consolidator(tmp_path):
+    def make(manager, **overrides):
+        consolidator = MemoryConsolidator(manager, path=str(tmp_path / "state.db"))
+        consolidator.similarity = 0.85
+        consolidator.duplicate_similarity = 0.97
+        consolidator.max_memories = 0
+        for name, value in overrides.items():
+            setattr(consolidator, name, value)
+        return consolidator
+    return make
+
+
+def test_same_hash_requires_both_hashes():
+    assert _same_hash({"hash": "x"}, {"hash": "x"})
+    assert not _same_hash({"hash": "x"}, {"hash": "y"})
+    assert not _same_hash({}, {})
+    assert not _same_hash({"hash": ""}, {"hash": ""})
+
+
+def test_clusters_join_chains_and_cap_size():
+    vectors = np.array([_unit(1, 0, 0), _unit(1, 0.2, 0), _unit(1, 0.4, 0.1), _unit(0, 0, 1)])
+
+    assert _clusters(vectors, [1], 0.95, 10) == [[0, 1, 2]]
+    # 只有新记忆（下标 3）参与比较时，旧记忆之间的相似不会连成簇
+    assert _clusters(vectors, [3], 0.95, 10) == []
+    assert _clusters(vectors, [1], 0.95, 2) == [[1, 2]]
+
+
+def test_vectors_stay_aligned_when_memories_change_between_reads(make_consolidator):
+    collection = FakeCollection()
+    collection.add("a", _unit(1, 0, 0, 0), user_id="u", data="住在北京", created_at="2024-01-01")
+    collection.add("b", _unit(0, 1, 0, 0), user_id="u", data="喜欢猫", created_at="2024-01-02")
+    collection.add("c", _unit(1, 0, 0, 0), user_id="u", data="住在北京市", created_at="2024-01-03")
+    manager = FakeMemoryManager(collection)
+    # 第一次读取（只读元数据）之后、读取向量之前，b 被删除、d 被写入
+    collection.before_get = [
+        lambda: None,
+        lambda: (collection.records.pop("b"),
+                 collection.add("d", _unit(0, 0, 1, 0), user_id="u", data="会弹钢琴", created_at="2024-01-04")),
+    ]
+
+    stats = make_consolidator(manager).consolidate_user("u")
+
+    # c 与 a 向量相同，保留较新的 c；b、d 与其他记忆都不相似，不受影响
+    assert manager.deleted == ["a"]
+    assert stats["before"] == 3
+    assert stats["duplicates"] == 1
+    assert stats["after"] == 2
+    assert set(collection.records) == {"c", "d"}
+
+
+def test_similar_memories_are_merged_by_llm(make_consolidator):
+    collection = FakeCollection()
+    collection.add("a", _unit(1, 0, 0, 0), user_id="u", data="养了一只猫", created_at="2024-01-01", role="user")
+    collection.add("b", _unit(1, 0.3, 0, 0), user_id="u", data="猫叫咪咪", created_at="2024-01-02", role="user")
+    manager = FakeMemoryManager(collection, merged=["养了一只叫咪咪的猫"])
+
+    stats = make_consolidator(manager).consolidate_user("u")
+
+    assert manager.llm_inputs == [[[{"text": "养了一只猫", "time": "2024-01-01"},
+                                    {"text": "猫叫咪咪", "time": "2024-01-02"}]]]
+    assert sorted(manager.deleted) == ["a", "b"]
+    (payload, _), = collection.records.values()
+    assert payload["data"] == "养了一只叫咪咪的猫"
+    assert payload["created_at"] == "2024-01-02"
+    assert payload["role"] == "user"
+    assert stats["merged_groups"] == 1
+    assert stats["after"] == 1
+
+
+def test_failed_merge_keeps_watermark_before_unmerged_memories(make_consolidator):
+    collection = FakeCollection()
+    collection.add("a", _unit(1, 0, 0, 0), user_id="u", data="x", created_at="2024-01-01")
+    collection.add("b", _unit(1, 0.3, 0, 0), user_id="u", data="y", created_at="2024-01-02")
+    collection.add("c", _unit(0, 0, 1, 0), user_id="u", data="z", created_at="2024-01-03")
+    manager = FakeMemoryManager(collection)
+    consolidator = make_consolidator(manager)
+
+    stats = consolidator.consolidate_user("u")
+
+    assert stats["failed_batches"] == 1
+    assert manager.deleted == []
+    with closing(consolidator._connect()) as conn:
+        # 合并失败的 a、b 下次仍是新记忆
+        assert consolidator._watermark(conn, "u") < "2024-01-01"
+
+    manager.memory.llm.generate_response = lambda messages, response_format=None: '{"merged": ["xy"]}'
+    assert consolidator.consolidate_user("u")["merged_groups"] == 1
+    with closing(consolidator._connect()) as conn:
+        assert consolidator._watermark(conn, "u") == "2024-01-03"
+
+
+def test_over_cap_evicts_oldest_by_age(make_consolidator):
+    collection = FakeCollection()
+    for i in range(4):
+        collection.add(f"m{i}", np.eye(4)[i], user_id="u", data=str(i), created_at=f"2024-01-0{i + 1}")
+    manager = FakeMemoryManager(collection)
+
+    stats = make_consolidator(manager, max_memories=2, eviction="age").consolidate_user("u")
+
+    assert sorted(manager.deleted) == ["m0", "m1"]
+    assert stats["evicted"] == 2
+    assert stats["after"] == 2
@@ -0,0 +1,132 @@
+import pytest
+
+from keyword_index import KeywordIndex, KeywordIndexedStore, fuse, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    return KeywordIndex(str(tmp_path / "keywords.db"), tokenizer="bigram")
+
+
+def _ids(results):
+    return [item[0] for item in results]
+
+
+def test_tokenize_ascii_and_cjk_bigrams():
+    assert tokenize("Order ORD-2024-001 shipped", "bigram") == [
+        "order", "ord-2024-001", "ord", "2024", "001", "shipped"
+    ]
+    assert tokenize("我住在北京", "bigram") == ["我住", "住在", "在北", "北京"]
+    assert tokenize("猫 和 dog", "bigram") == ["dog", "猫", "和"]
+    assert tokenize("", "bigram") == []
+
+
+def test_search_is_scoped_to_the_user(index):
+    index.add(["a1", "a2", "b1"], [
+        {"user_id": "alice", "data": "订单号 ORD-7781 已发货"},
+        {"user_id": "alice", "data": "喜欢吃火锅"},
+        {"user_id": "bob", "data": "订单号 ORD-7781 是 bob 的"},
+    ])
+
+    assert _ids(index.search("alice", "ORD-7781")) == ["a1"]
+    assert _ids(index.search("bob", "ord-7781")) == ["b1"]
+    assert index.search("carol", "ORD-7781") == []
+    assert index.count("alice") == 2
+    assert index.count() == 3
+
+
+def test_bm25_prefers_rarer_terms_and_reports_coverage(index):
+    index.add(["m1", "m2", "m3"], [
+        {"user_id": "u", "data": "我喜欢猫"},
+        {"user_id": "u", "data": "我喜欢狗"},
+        {"user_id": "u", "data": "我喜欢猫也喜欢狗"},
+    ])
+
+    results = index.search("u", "喜欢猫", limit=3)
+
+    # 查询词为 喜欢、欢猫；只命中常见词（喜欢）的 m2 排在最后，覆盖比例较低
+    assert _ids(results)[-1] == "m2"
+    coverage = {memory_id: value for memory_id, _, value in results}
+    assert coverage["m1"] == pytest.approx(1.0)
+    assert coverage["m3"] == pytest.approx(1.0)
+    assert 0 < coverage["m2"] < 0.5
+    assert [score for _, score, _ in results] == sorted((score for _, score, _ in results), reverse=True)
+    assert index.search("u", "鸟") == []
+
+
+def test_reindex_and_delete_keep_user_stats(index):
+    index.add(["m1"], [{"user_id": "u", "data": "住在上海"}])
+    index.add(["m1"], [{"user_id": "u", "data": "住在北京"}])
+
+    assert index.count("u") == 1
+    assert index.search("u", "上海") == []
+    assert _ids(index.search("u", "北京")) == ["m1"]
+
+    index.delete(["m1"])
+    assert index.count("u") == 0
+    assert index.search("u", "北京") == []
+
+    index.add(["m2", "m3"], [{"user_id": "u", "data": "a"}, {"user_id": "v", "data": "a"}])
+    index.delete_user("u")
+    assert index.count() == 1
+    index.clear()
+    assert index.count() == 0
+
+
+def test_fuse_weights_normalized_scores():
+    vector = [{"id": "v1", "memory": "x", "score": 0.2}, {"id": "both", "memory": "y", "score": 0.6},
+              {"id": "v2", "memory": "z", "score": 1.0}]
+    keyword = [{"id": "both", "memory": "y", "score": 0.9}, {"id": "k1", "memory": "w", "score": 0.3}]
+
+    results = fuse(vector, keyword, limit=4, weight=0.5)
+
+    assert [item["id"] for item in results[:2]] == ["both", "v1"]
+    assert {item["id"]: item["match"] for item in results} == {
+        "both": "both", "v1": "vector", "v2": "vector", "k1": "keyword"
+    }
+    # both：向量距离归一化后 0.5，关键词 1.0；v2 和 k1 各自是本路最差的结果
+    assert [item["score"] for item in results] == pytest.approx([0.75, 0.5, 0.0, 0.0])
+    assert vector[0]["score"] == 0.2
+
+
+def test_fuse_with_one_empty_source():
+    vector = [{"id": "v1", "score": 0.3}, {"id": "v2", "score": 0.3}]
+
+    results = fuse(vector, [], limit=1, weight=0.3)
+
+    assert len(results) == 1
+    assert results[0]["score"] == pytest.approx(0.7)
+    assert fuse([], [], limit=3) == []
+
+
+class FakeStore:
+    def __init__(self):
+        self.calls = []
+
+    def insert(self, vectors, payloads=None, ids=None):
+        self.calls.append("insert")
+
+    def update(self, vector_id, vector=None, payload=None):
+        self.calls.append("update")
+
+    def delete(self, vector_id):
+        self.calls.append("delete")
+
+
+def test_indexed_store_keeps_index_in_sync(index):
+    inner = FakeStore()
+    store = KeywordIndexedStore(inner, index)
+
+    store.insert(vectors=[[0.1]], payloads=[{"user_id": "u", "data": "养了一只猫"}], ids=["m1"])
+    assert _ids(index.search("u", "一只猫")) == ["m1"]
+
+    store.update("m1", payload={"user_id": "u", "data": "养了一条狗"})
+    assert index.search("u", "一只猫") == []
+    assert _ids(index.search("u", "一条狗")) == ["m1"]
+
+    store.update("m1", vector=[0.2])
+    assert _ids(index.search("u", "一条狗")) == ["m1"]
+
+    store.delete("m1")
+    assert index.count("u") == 0
+    assert inner.calls == ["insert", "update", "update", "delete"]
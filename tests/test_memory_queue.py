@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import closing
+
+import pytest
+
+from memory_queue import MemoryWriteQueue
+
+
+class FakeMemoryManager:
+    """记录每次 add_messages 的参数；fail_after 中的步骤完成后抛出异常"""
+
+    def __init__(self, fail_after=None, delay=0.0):
+        self.calls = []
+        self.fail_after = fail_after
+        self.delay = delay
+
+    def add_messages(self, user_id, messages, done=None):
+        self.calls.append((user_id, [m["content"] for m in messages], set(done)))
+        time.sleep(self.delay)
+        if "extract" not in done:
+            done.add("extract")
+        if self.fail_after == "extract":
+            raise RuntimeError("raw 写入失败")
+        done.add("raw")
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(memory_manager=None, **kwargs):
+        options = dict(path=str(tmp_path / "journal.db"), workers=1, batch_size=10,
+                       max_retries=3, lease_seconds=60)
+        options.update(kwargs)
+        return MemoryWriteQueue(memory_manager or FakeMemoryManager(), **options)
+    return make
+
+
+def _claim(queue):
+    with closing(queue._connect()) as conn:
+        return queue._claim_batch(conn)
+
+
+def _process(queue, rows):
+    with closing(queue._connect()) as conn:
+        queue._process(conn, rows)
+
+
+def _rows(queue):
+    with closing(queue._connect()) as conn:
+        return conn.execute(
+            "SELECT id, user_id, status, attempts, done_steps, next_attempt_at FROM memory_journal ORDER BY id"
+        ).fetchall()
+
+
+def _enqueue(queue, *users):
+    return [queue.enqueue_turn(user, f"{user}-{i}", "ok") for i, user in enumerate(users)]
+
+
+def test_claim_batches_across_users_grouped_per_user(make_queue):
+    queue = make_queue()
+    a1, b1, a2, c1 = _enqueue(queue, "a", "b", "a", "c")
+
+    rows = _claim(queue)
+
+    assert [(row[0], row[1]) for row in rows] == [(a1, "a"), (a2, "a"), (b1, "b"), (c1, "c")]
+    assert {row[2] for row in _rows(queue)} == {"processing"}
+
+
+def test_claim_respects_batch_size(make_queue):
+    queue = make_queue(batch_size=2)
+    a1, a2, _ = _enqueue(queue, "a", "a", "a")
+
+    assert [row[0] for row in _claim(queue)] == [a1, a2]
+
+
+def test_user_with_leased_rows_is_not_claimed_again(make_queue):
+    queue = make_queue()
+    _enqueue(queue, "a", "b")
+    assert len(_claim(queue)) == 2
+
+    # 后来的记录也要等该用户正在处理的记录完成，保证同一用户的写入不并发、不乱序
+    _enqueue(queue, "a")
+    (c1,) = _enqueue(queue, "c")
+    assert [row[0] for row in _claim(queue)] == [c1]
+
+
+def test_expired_lease_is_claimed_again(make_queue):
+    queue = make_queue(lease_seconds=0.05)
+    ids = _enqueue(queue, "a", "a")
+    assert [row[0] for row in _claim(queue)] == ids
+    assert _claim(queue) == []
+
+    time.sleep(0.1)
+    assert [row[0] for row in _claim(queue)] == ids
+
+
+def test_lease_is_renewed_while_processing(make_queue):
+    queue = make_queue(FakeMemoryManager(delay=0.5), lease_seconds=0.15)
+    _enqueue(queue, "a")
+    rows = _claim(queue)
+    worker = threading.Thread(target=_process, args=(queue, rows))
+    worker.start()
+
+    time.sleep(0.3)
+    assert _claim(queue) == []
+    worker.join()
+    assert _rows(queue) == []
+
+
+def test_successful_group_is_written_once_and_deleted(make_queue):
+    manager = FakeMemoryManager()
+    queue = make_queue(manager)
+    _enqueue(queue, "a", "b", "a")
+
+    _process(queue, _claim(queue))
+
+    assert manager.calls == [
+        ("a", ["a-0", "ok", "a-2", "ok"], set()),
+        ("b", ["b-1", "ok"], set()),
+    ]
+    assert _rows(queue) == []
+    assert queue.pending_count() == 0
+
+
+def test_retry_skips_completed_steps(make_queue):
+    failing = FakeMemoryManager(fail_after="extract")
+    queue = make_queue(failing)
+    _enqueue(queue, "a")
+
+    _process(queue, _claim(queue))
+    (row,) = _rows(queue)
+    assert row[2:5] == ("pending", 1, "extract")
+    assert row[5] > time.time()
+    assert _claim(queue) == []
+
+    with closing(queue._connect()) as conn:
+        conn.execute("UPDATE memory_journal SET next_attempt_at = 0")
+    manager = FakeMemoryManager()
+    queue.memory_manager = manager
+    _process(queue, _claim(queue))
+
+    assert manager.calls == [("a", ["a-0", "ok"], {"extract"})]
+    assert _rows(queue) == []
+
+
+def test_rows_with_different_completed_steps_are_not_merged(make_queue):
+    queue = make_queue()
+    a1, a2 = _enqueue(queue, "a", "a")
+    with closing(queue._connect()) as conn:
+        conn.execute("UPDATE memory_journal SET done_steps = 'extract' WHERE id = ?", (a1,))
+
+    assert [row[0] for row in _claim(queue)] == [a1]
+
+
+def test_exhausted_retries_mark_failed_without_blocking_the_user(make_queue):
+    queue = make_queue(FakeMemoryManager(fail_after="extract"), max_retries=1)
+    _enqueue(queue, "a")
+
+    _process(queue, _claim(queue))
+    assert _rows(queue)[0][2] == "failed"
+    assert queue.pending_count() == 0
+
+    (a2,) = _enqueue(queue, "a")
+    assert [row[0] for row in _claim(queue)] == [a2]
@@ -0,0 +1,144 @@
+import uuid
+
+import pytest
+
+from partitioning import PartitionedChromaDB, PartitionRouter, partition_scope
+
+chromadb = pytest.importorskip("chromadb")
+
+
+@pytest.fixture
+def client():
+    return chromadb.EphemeralClient()
+
+
+@pytest.fixture
+def base_name():
+    return f"test_{uuid.uuid4().hex[:8]}"
+
+
+def _names(client):
+    return {c.name for c in client.list_collections()}
+
+
+def test_name_for_each_mode(client, base_name):
+    assert PartitionRouter(client, base_name, mode="none").name_for("alice") == base_name
+
+    router = PartitionRouter(client, base_name, mode="user")
+    name = router.name_for("alice")
+    assert name.startswith(f"{base_name}_u_alice_")
+    assert router.is_partition(name)
+    # 清洗后的可读前缀相同的用户仍然分到不同的集合
+    assert router.name_for("a b") != router.name_for("a-b")
+    assert router.is_partition(router.name_for("用户 1"))
+    assert not router.is_partition(base_name)
+
+    router = PartitionRouter(client, base_name, mode="hash", buckets=8)
+    names = {router.name_for(f"user-{i}") for i in range(100)}
+    assert len(names) <= 8
+    assert all(router.is_partition(n) for n in names)
+    assert router.name_for("alice") == router.name_for("alice")
+
+
+def test_unknown_mode_is_rejected(client, base_name):
+    with pytest.raises(ValueError):
+        PartitionRouter(client, base_name, mode="shard")
+
+
+def test_read_path_does_not_create_collections(client, base_name):
+    router = PartitionRouter(client, base_name, mode="user")
+
+    assert router.collection_for("alice", create=False) is None
+    assert router.name_for("alice") not in _names(client)
+
+    collection = router.collection_for("alice")
+    assert collection.name in _names(client)
+    assert router.collection_for("alice", create=False) is collection
+
+
+def test_handle_cache_is_bounded(client, base_name):
+    router = PartitionRouter(client, base_name, mode="user", cache_size=2)
+    for user in ("a", "b", "c"):
+        router.collection_for(user)
+
+    assert list(router._handles) == [router.name_for("b"), router.name_for("c")]
+
+
+def test_drop_if_empty_only_drops_empty_user_partitions(client, base_name):
+    router = PartitionRouter(client, base_name, mode="user")
+    router.collection_for("alice")
+    router.collection_for("bob").add(ids=["m1"], embeddings=[[0.1, 0.2]])
+
+    assert router.drop_if_empty("alice")
+    assert not router.drop_if_empty("bob")
+    assert router.name_for("alice") not in _names(client)
+    assert router.name_for("bob") in _names(client)
+
+    hashed = PartitionRouter(client, base_name, mode="hash", buckets=4)
+    hashed.collection_for("carol")
+    assert not hashed.drop_if_empty("carol")
+
+
+def test_locate_by_scope_remembered_id_and_scan(client, base_name):
+    router = PartitionRouter(client, base_name, mode="user")
+    alice = router.collection_for("alice")
+    alice.add(ids=["m1"], embeddings=[[0.1, 0.2]])
+    router.collection_for("bob").add(ids=["m2"], embeddings=[[0.3, 0.4]])
+
+    with partition_scope("alice"):
+        assert router.locate("m1").name == alice.name
+
+    router.remember(["m1"], alice)
+    assert router.locate("m1").name == alice.name
+
+    # 没有作用域、也没有记录位置时逐个分区查找
+    assert router.locate("m2").name == router.name_for("bob")
+    assert router._locations["m2"] == router.name_for("bob")
+    assert router.locate("missing") is None
+
+
+@pytest.fixture
+def store(client, base_name):
+    mem0_chroma = pytest.importorskip("mem0.vector_stores.chroma")
+    base = mem0_chroma.ChromaDB(collection_name=base_name, client=client)
+    return PartitionedChromaDB(base, PartitionRouter(client, base_name, mode="user"))
+
+
+def test_partitioned_store_routes_by_user(store):
+    store.insert(
+        vectors=[[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]],
+        payloads=[{"user_id": "alice", "data": "a1"}, {"user_id": "bob", "data": "b1"},
+                  {"user_id": "alice", "data": "a2"}],
+        ids=["a1", "b1", "a2"],
+    )
+
+    results = store.search("q", vectors=[[1.0, 0.0]], limit=5, filters={"user_id": "alice"})
+    assert [item.id for item in results] == ["a1", "a2"]
+    assert store.search("q", vectors=[[1.0, 0.0]], filters={"user_id": "carol"}) == []
+    assert {item.id for item in store.list(filters={"user_id": "bob"})[0]} == {"b1"}
+    # 不带 user_id 时检索全部分区并按距离合并
+    assert [item.id for item in store.search("q", vectors=[[1.0, 0.0]], limit=2)] == ["a1", "b1"]
+
+
+def test_partitioned_store_updates_and_deletes_by_id(store):
+    store.insert(vectors=[[1.0, 0.0]], payloads=[{"user_id": "alice", "data": "old"}], ids=["m1"])
+
+    store.update("m1", payload={"user_id": "alice", "data": "new"})
+    assert store.get("m1").payload["data"] == "new"
+
+    store.delete("m1")
+    assert store.get("m1") is None
+    with pytest.raises(ValueError):
+        store.update("never-written", payload={"data": "x"})
+
+
+def test_reset_only_drops_the_current_users_empty_partition(store):
+    store.insert(vectors=[[1.0, 0.0], [0.0, 1.0]],
+                 payloads=[{"user_id": "alice"}, {"user_id": "bob"}], ids=["a1", "b1"])
+    store.delete("a1")
+
+    with partition_scope("alice"):
+        store.reset()
+
+    names = {c.name for c in store.list_cols()}
+    assert names == {store.router.name_for("bob")}
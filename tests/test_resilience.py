@@ -0,0 +1,204 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import uuid
+
+import httpx
+import pytest
+
+import config
+import resilience
+from admission import AdmissionRejected
+from resilience import RetryBudget
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff", lambda attempt: 0)
+    monkeypatch.setattr(resilience, "budget", RetryBudget(ratio=1.0, min_per_second=1))
+
+
+class Flaky:
+    """前 failures 次调用抛出 error，之后返回 "ok" """
+
+    def __init__(self, failures: int, error: Exception):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+def test_retry_budget_allows_a_ratio_of_requests():
+    budget = RetryBudget(ratio=0.5, min_per_second=0)
+    for _ in range(4):
+        budget.record_request()
+
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
+
+
+def test_retry_budget_floor_without_requests():
+    budget = RetryBudget(ratio=0.0, min_per_second=1, window=2.0)
+
+    assert [budget.try_spend() for _ in range(3)] == [True, True, False]
+
+
+def test_retry_budget_forgets_events_outside_the_window():
+    budget = RetryBudget(ratio=1.0, min_per_second=0, window=0.05)
+    budget.record_request()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+    time.sleep(0.06)
+    assert not budget.try_spend()
+    budget.record_request()
+    assert budget.try_spend()
+
+
+@pytest.mark.parametrize("error", [
+    TimeoutError(),
+    asyncio.TimeoutError(),
+    concurrent.futures.TimeoutError(),
+    ConnectionError(),
+    httpx.ConnectTimeout("timeout"),
+    httpx.HTTPStatusError("bad gateway", request=httpx.Request("POST", "http://x"),
+                          response=httpx.Response(502)),
+])
+def test_transient_errors_are_retryable(error):
+    assert resilience.is_retryable(error)
+
+
+@pytest.mark.parametrize("error", [
+    ValueError("bad request"),
+    httpx.HTTPStatusError("bad request", request=httpx.Request("POST", "http://x"),
+                          response=httpx.Response(400)),
+    AdmissionRejected("llm", "user_queue_full", 429, 1),
+])
+def test_local_and_client_errors_are_not_retryable(error):
+    assert not resilience.is_retryable(error)
+
+
+def test_retry_recovers_from_transient_errors():
+    func = Flaky(2, ConnectionError())
+
+    assert resilience.retry("test", func, attempts=3) == "ok"
+    assert func.calls == 3
+
+
+def test_retry_does_not_retry_client_errors():
+    func = Flaky(1, ValueError("bad request"))
+
+    with pytest.raises(ValueError):
+        resilience.retry("test", func, attempts=3)
+    assert func.calls == 1
+
+
+def test_retry_stops_when_budget_is_exhausted(monkeypatch):
+    monkeypatch.setattr(resilience, "budget", RetryBudget(ratio=0.0, min_per_second=0))
+    func = Flaky(1, ConnectionError())
+
+    with pytest.raises(ConnectionError):
+        resilience.retry("test", func, attempts=3)
+    assert func.calls == 1
+
+
+def test_stream_retries_only_before_the_first_chunk():
+    calls = []
+
+    def fails_before_output():
+        calls.append("before")
+        if len(calls) == 1:
+            raise ConnectionError()
+        yield "a"
+        yield "b"
+
+    assert list(resilience.stream("test", fails_before_output, attempts=3)) == ["a", "b"]
+    assert len(calls) == 2
+
+    def fails_after_output():
+        calls.append("after")
+        yield "a"
+        raise ConnectionError()
+
+    chunks = []
+    with pytest.raises(ConnectionError):
+        for chunk in resilience.stream("test", fails_after_output, attempts=3):
+            chunks.append(chunk)
+    assert chunks == ["a"]
+    assert calls.count("after") == 1
+
+
+def test_astream_retries_when_the_first_chunk_times_out():
+    attempts = []
+
+    async def chunks():
+        attempts.append(1)
+        if len(attempts) == 1:
+            await asyncio.sleep(1)
+        yield "a"
+
+    async def collect():
+        return [chunk async for chunk in resilience.astream("test", chunks, first_timeout=0.05, attempts=3)]
+
+    assert asyncio.run(collect()) == ["a"]
+    assert len(attempts) == 2
+
+
+def _warm(upstream: str, seconds: float = 0.01):
+    tracker = resilience.latency(upstream)
+    for _ in range(tracker.min_samples):
+        tracker.record(seconds)
+
+
+def test_hedged_request_returns_the_faster_copy(monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY", 0.01)
+    upstream = f"test-{uuid.uuid4().hex}"
+    _warm(upstream)
+    calls = []
+    lock = threading.Lock()
+
+    def func():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        time.sleep(0.5 if first else 0.01)
+        return "slow" if first else "fast"
+
+    start = time.monotonic()
+    assert resilience.hedged(upstream, func) == "fast"
+    assert time.monotonic() - start < 0.4
+    assert len(calls) == 2
+
+
+def test_hedged_request_is_not_sent_without_budget(monkeypatch):
+    monkeypatch.setattr(config, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(resilience, "budget", RetryBudget(ratio=0.0, min_per_second=0))
+    upstream = f"test-{uuid.uuid4().hex}"
+    _warm(upstream)
+    calls = []
+
+    def func():
+        calls.append(1)
+        time.sleep(0.1)
+        return "only"
+
+    assert resilience.hedged(upstream, func) == "only"
+    assert len(calls) == 1
+
+
+def test_hedged_request_keeps_context(monkeypatch):
+    import admission
+
+    monkeypatch.setattr(config, "HEDGE_ENABLED", True)
+    upstream = f"test-{uuid.uuid4().hex}"
+    _warm(upstream)
+
+    with admission.user_scope("alice"):
+        assert resilience.hedged(upstream, admission.current_user.get) == "alice"
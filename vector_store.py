@@ -0,0 +1,89 @@
+"""向量库连接：进程内嵌的 Chroma 或独立的 Chroma 服务
+
+嵌入式模式（VECTOR_STORE_MODE=embedded）下 Chroma 直接读写本地目录，多个进程同时打开
+同一目录会损坏索引，因此启动时对目录加排他锁，并拒绝多 worker 配置。多个 uvicorn/gunicorn
+worker 或多个节点请使用服务模式（VECTOR_STORE_MODE=server）：所有进程通过连接池访问同一个
+Chroma 服务，本地可用 `chroma run --path ./chroma_db` 启动。
+"""
+import os
+
+import chromadb
+from chromadb.config import Settings
+
+import config
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，跳过目录锁
+    fcntl = None
+
+_lock_file = None
+
+
+def _worker_count() -> int:
+    """uvicorn --workers 和 gunicorn 都读取 WEB_CONCURRENCY"""
+    try:
+        return int(os.getenv("WEB_CONCURRENCY", "1"))
+    except ValueError:
+        return 1
+
+
+def _lock_embedded_path(path: str):
+    """对嵌入式 Chroma 目录加排他锁，锁随进程退出释放"""
+    global _lock_file
+    if fcntl is None or _lock_file is not None:
+        return
+    os.makedirs(path, exist_ok=True)
+    lock_file = open(os.path.join(path, ".process.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(
+            f"嵌入式 Chroma 目录 {path} 已被另一个进程使用。多进程部署请设置 VECTOR_STORE_MODE=server "
+            f"并连接 Chroma 服务（chroma run --path {path}）"
+        )
+    _lock_file = lock_file
+
+
+def check_deployment():
+    """启动检查：嵌入式模式只允许单进程"""
+    if config.VECTOR_STORE_MODE == "embedded":
+        if _worker_count() > 1:
+            raise RuntimeError(
+                "嵌入式 Chroma 不支持多 worker（WEB_CONCURRENCY > 1），请设置 VECTOR_STORE_MODE=server"
+            )
+        _lock_embedded_path(config.CHROMA_PATH)
+    elif config.VECTOR_STORE_MODE != "server":
+        raise ValueError(f"未知的 VECTOR_STORE_MODE: {config.VECTOR_STORE_MODE}")
+
+
+def create_chroma_client():
+    """按配置创建 Chroma 客户端，交给 mem0 使用"""
+    check_deployment()
+    if config.VECTOR_STORE_MODE == "embedded":
+        return chromadb.PersistentClient(
+            path=config.CHROMA_PATH,
+            settings=Settings(anonymized_telemetry=False)
+        )
+
+    settings = Settings(
+        anonymized_telemetry=False,
+        chroma_http_keepalive_secs=config.CHROMA_HTTP_KEEPALIVE_SECS,
+        chroma_http_max_connections=config.CHROMA_HTTP_MAX_CONNECTIONS,
+        chroma_http_max_keepalive_connections=config.CHROMA_HTTP_MAX_CONNECTIONS,
+    )
+    headers = {"Authorization": f"Bearer {config.CHROMA_AUTH_TOKEN}"} if config.CHROMA_AUTH_TOKEN else None
+    client = chromadb.HttpClient(
+        host=config.CHROMA_HOST,
+        port=config.CHROMA_PORT,
+        ssl=config.CHROMA_SSL,
+        headers=headers,
+        settings=settings
+    )
+    try:
+        client.heartbeat()
+    except Exception as e:
+        raise RuntimeError(f"无法连接 Chroma 服务 {config.CHROMA_HOST}:{config.CHROMA_PORT}: {e}")
+    return client
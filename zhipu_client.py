@@ -0,0 +1,184 @@
+"""复用 HTTP 连接的智谱聊天模型
+
+langchain_community 的 ChatZhipuAI 每次调用都新建并关闭一个 httpx 客户端，即使共享模型对象，
+每个请求也要重新建立 TCP/TLS 连接。SharedClientChatZhipuAI 只替换发送请求的部分：同步调用
+共用一个 httpx.Client，异步调用按事件循环各共用一个 httpx.AsyncClient（异步连接绑定在创建它
+的事件循环上，不能跨循环使用）。消息转换、鉴权和响应解析仍沿用 ChatZhipuAI 的实现。
+
+本模块导入 langchain，只在 resources.get_llm 首次创建模型时导入。
+"""
+import asyncio
+import json
+import threading
+import weakref
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import httpx
+from langchain_community.chat_models import ChatZhipuAI
+from langchain_community.chat_models.zhipuai import (
+    _convert_delta_to_message_chunk,
+    _get_jwt_token,
+    _truncate_params,
+    aconnect_sse,
+    connect_sse,
+)
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+import config
+
+_lock = threading.Lock()
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_options() -> dict:
+    return {
+        "timeout": config.LLM_TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+        ),
+    }
+
+
+def get_client() -> httpx.Client:
+    """进程内共享的同步客户端"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """当前事件循环共享的异步客户端，事件循环被回收后随之释放"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                client = _async_clients[loop] = httpx.AsyncClient(**_client_options())
+    return client
+
+
+def close_clients():
+    """关闭同步客户端并丢弃异步客户端（异步客户端只能在各自的事件循环中关闭，交给垃圾回收）"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        _async_clients.clear()
+
+
+def _to_chunk(data: str):
+    """把一个 SSE 事件转换为 (ChatGenerationChunk, finish_reason)，没有 choices 时返回 (None, None)"""
+    chunk = json.loads(data)
+    if len(chunk["choices"]) == 0:
+        return None, None
+    choice = chunk["choices"][0]
+    finish_reason = choice.get("finish_reason", None)
+    generation_info = (
+        {
+            "finish_reason": finish_reason,
+            "token_usage": chunk.get("usage", None),
+            "model_name": chunk.get("model", ""),
+        }
+        if finish_reason is not None
+        else None
+    )
+    message = _convert_delta_to_message_chunk(choice["delta"], AIMessageChunk)
+    return ChatGenerationChunk(message=message, generation_info=generation_info), finish_reason
+
+
+class SharedClientChatZhipuAI(ChatZhipuAI):
+    """请求通过共享 httpx 客户端发送的 ChatZhipuAI，行为与父类一致"""
+
+    def _request(self, messages: List[BaseMessage], stop: Optional[List[str]], stream: bool, **kwargs: Any):
+        if self.zhipuai_api_key is None:
+            raise ValueError("Did not find zhipuai_api_key.")
+        if self.zhipuai_api_base is None:
+            raise ValueError("Did not find zhipu_api_base.")
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        payload = {**params, **kwargs, "messages": message_dicts, "stream": stream}
+        _truncate_params(payload)
+        headers = {
+            "Authorization": _get_jwt_token(self.zhipuai_api_key),
+            "Accept": "application/json",
+        }
+        return payload, headers
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        stream: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if stream if stream is not None else self.streaming:
+            return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+        payload, headers = self._request(messages, stop, False, **kwargs)
+        response = get_client().post(self.zhipuai_api_base, json=payload, headers=headers)
+        response.raise_for_status()
+        return self._create_chat_result(response.json())
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        payload, headers = self._request(messages, stop, True, **kwargs)
+        with connect_sse(get_client(), "POST", self.zhipuai_api_base, json=payload, headers=headers) as event_source:
+            for sse in event_source.iter_sse():
+                chunk, finish_reason = _to_chunk(sse.data)
+                if chunk is None:
+                    continue
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                if finish_reason is not None:
+                    break
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        stream: Optional[bool] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if stream if stream is not None else self.streaming:
+            return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager, **kwargs))
+        payload, headers = self._request(messages, stop, False, **kwargs)
+        response = await get_async_client().post(self.zhipuai_api_base, json=payload, headers=headers)
+        response.raise_for_status()
+        return self._create_chat_result(response.json())
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        payload, headers = self._request(messages, stop, True, **kwargs)
+        async with aconnect_sse(
+            get_async_client(), "POST", self.zhipuai_api_base, json=payload, headers=headers
+        ) as event_source:
+            async for sse in event_source.aiter_sse():
+                chunk, finish_reason = _to_chunk(sse.data)
+                if chunk is None:
+                    continue
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                if finish_reason is not None:
+                    break